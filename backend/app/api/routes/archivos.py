@@ -1,18 +1,32 @@
 import asyncio
+import bz2
+import gzip
 import hashlib
+import json
+import os
+import tempfile
 import threading
+import time
+import zipfile
+from contextlib import aclosing
 from pathlib import Path
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from typing import BinaryIO, Literal, Union
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_db
 from app.config import settings
 from app.models import ArchivoProcesado
-from app.schemas.archivo import ArchivoUploadResponse, ArchivoStatus
-from app.services.archivo_service import obtener_archivo_por_hash
+from app.schemas.archivo import ArchivoUploadResponse, ArchivoStatus, ArchivoPerfilResponse, SimulacionResponse
+from app.services.archivo_service import obtener_archivo_por_hash, ruta_por_hash
+from app.services.procesador_service import detectar_compresion
+from app.services.progreso_service import ESTADOS_FINALES, evento_desde_archivo, suscribir_progreso
 
 router = APIRouter(prefix="/api/v1/archivos", tags=["archivos"])
 
+DESCOMPRESORES = {"gzip": gzip.open, "bz2": bz2.open}
+
 
 @router.get("", response_model=list[ArchivoStatus])
 def list_archivos(
@@ -29,42 +43,102 @@ def list_archivos(
     return archivos
 
 
-def _procesar_en_background(archivo_id: int, ruta_archivo: str) -> None:
+def _procesar_en_background(archivo_id: int, ruta_archivo: str, motor_validacion: str | None = None) -> None:
     """Ejecuta el procesamiento en un hilo para no bloquear la respuesta del upload."""
     from app.database import SessionLocal
     from app.services.procesador_service import procesar_archivo
     db = SessionLocal()
     try:
-        procesar_archivo(db, archivo_id, ruta_archivo)
+        procesar_archivo(db, archivo_id, ruta_archivo, motor_validacion=motor_validacion)
     finally:
         db.close()
 
 
-def _encolar_o_procesar_sync(archivo_id: int, ruta_archivo: str) -> None:
+def _encolar_o_procesar_sync(archivo_id: int, ruta_archivo: str, motor_validacion: str | None = None) -> None:
     """Encola tarea Celery o procesa en un hilo en segundo plano si no hay Redis."""
     try:
         from app.tasks import procesar_archivo_task
-        procesar_archivo_task.delay(archivo_id, ruta_archivo)
+        procesar_archivo_task.delay(archivo_id, ruta_archivo, motor_validacion, time.time())
     except Exception:
-        thread = threading.Thread(target=_procesar_en_background, args=(archivo_id, ruta_archivo))
+        thread = threading.Thread(
+            target=_procesar_en_background, args=(archivo_id, ruta_archivo, motor_validacion)
+        )
         thread.daemon = True
         thread.start()
 
 
+def _guardar_temporal(origen: BinaryIO, upload_dir: Path, comprimir: bool = False) -> tuple[str, str]:
+    """
+    Copia el archivo subido a un temporal en upload_dir por trozos de
+    UPLOAD_TAMANO_TROZO bytes, calculando el SHA-256 a la vez.
+    Con comprimir=True el temporal se guarda en gzip (el hash es del contenido leído).
+    Devuelve (ruta del temporal, hash).
+    """
+    sha256 = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=upload_dir, prefix=".subida-", delete=False) as destino:
+        try:
+            salida = gzip.GzipFile(fileobj=destino, mode="wb") if comprimir else destino
+            while trozo := origen.read(settings.UPLOAD_TAMANO_TROZO):
+                sha256.update(trozo)
+                salida.write(trozo)
+            if comprimir:
+                salida.close()
+        except BaseException:
+            destino.close()
+            os.unlink(destino.name)
+            raise
+    return destino.name, sha256.hexdigest()
+
+
+def _hash_descomprimido(ruta: str, compresion: str) -> str:
+    """SHA-256 del contenido descomprimido (gzip/bz2), leído por trozos."""
+    sha256 = hashlib.sha256()
+    with DESCOMPRESORES[compresion](ruta, "rb") as f:
+        while trozo := f.read(settings.UPLOAD_TAMANO_TROZO):
+            sha256.update(trozo)
+    return sha256.hexdigest()
+
+
+def _entradas_zip(ruta_zip: str, upload_dir: Path, temporales: list[str]) -> list[tuple[str, str, str]]:
+    """
+    Un trabajo por archivo del ZIP: cada uno se guarda en un temporal en gzip
+    (nunca expandido a disco). Devuelve [(ruta del temporal, hash del contenido, nombre)].
+    """
+    entradas = []
+    with zipfile.ZipFile(ruta_zip) as zf:
+        for miembro in zf.infolist():
+            nombre = os.path.basename(miembro.filename)
+            # Directorios y metadatos (__MACOSX, archivos ocultos) no son archivos de peajes
+            if miembro.is_dir() or not nombre or nombre.startswith(".") or miembro.filename.startswith("__MACOSX/"):
+                continue
+            with zf.open(miembro) as origen:
+                ruta_temporal, hash_archivo = _guardar_temporal(origen, upload_dir, comprimir=True)
+            temporales.append(ruta_temporal)
+            entradas.append((ruta_temporal, hash_archivo, nombre))
+    return entradas
+
+
 def _subida_pesada_sync(
-    contenido: bytes,
+    origen: BinaryIO,
     nombre_archivo: str,
     usuario_id: int,
+    motor_validacion: str | None = None,
 ) -> dict:
     """
     Lógica pesada de subida (hash, guardado, BD, encolar).
     Se ejecuta en un hilo para no bloquear el event loop de FastAPI.
-    Devuelve {"ok": True, "archivo_id", "nombre_archivo"} o {"ok": False, "detail": str, "status_code": int}.
+    El archivo se copia por trozos a un temporal (memoria acotada por
+    UPLOAD_TAMANO_TROZO) y solo se renombra a su sitio si no es duplicado.
+    Los comprimidos (gzip/bz2, por magic bytes) se guardan tal cual y se
+    descomprimen al procesarlos; un .zip crea un trabajo por archivo que contiene.
+    El hash es siempre del contenido descomprimido.
+    Devuelve {"ok": True, "archivo_id", "nombre_archivo", "archivo_ids"} o {"ok": False, "detail": str, "status_code": int}.
     """
     from app.database import SessionLocal
     from app.models.usuario import Usuario
 
     db = SessionLocal()
+    temporales: list[str] = []
     try:
         usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
         if not usuario:
@@ -73,40 +147,68 @@ def _subida_pesada_sync(
             return {"ok": False, "detail": "No hay usuarios en la base de datos. Ejecute init_db.py", "status_code": 400}
         usuario_id = usuario.id
 
-        hash_archivo = hashlib.sha256(contenido).hexdigest()
-        archivo_existente = obtener_archivo_por_hash(db, hash_archivo)
-        if archivo_existente:
+        upload_dir = Path(settings.UPLOAD_DIR)
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        ruta_temporal, hash_archivo = _guardar_temporal(origen, upload_dir)
+        temporales.append(ruta_temporal)
+        nombre = nombre_archivo or "sin_nombre.xml"
+
+        with open(ruta_temporal, "rb") as f:
+            compresion = detectar_compresion(f.read(4))
+        if compresion == "zip":
+            entradas = [
+                (ruta, hash_entrada, nombre_entrada, f"{nombre_entrada}.gz")
+                for ruta, hash_entrada, nombre_entrada in _entradas_zip(ruta_temporal, upload_dir, temporales)
+            ]
+        else:
+            if compresion is not None:
+                hash_archivo = _hash_descomprimido(ruta_temporal, compresion)
+            entradas = [(ruta_temporal, hash_archivo, nombre, nombre)]
+
+        creados = []
+        duplicados = []
+        for ruta_entrada, hash_entrada, nombre_entrada, nombre_guardado in entradas:
+            archivo_existente = obtener_archivo_por_hash(db, hash_entrada)
+            if archivo_existente:
+                duplicados.append(archivo_existente.id)
+                continue
+
+            # Almacenamiento por hash (ab/cd/<hash>): subidas con el mismo nombre no se pisan
+            ruta_guardado = ruta_por_hash(upload_dir, hash_entrada, nombre_guardado)
+            ruta_guardado.parent.mkdir(parents=True, exist_ok=True)
+            # Renombrado atómico: el archivo aparece completo o no aparece
+            os.replace(ruta_entrada, ruta_guardado)
+
+            nuevo_archivo = ArchivoProcesado(
+                usuario_id=usuario_id,
+                nombre_archivo=nombre_entrada,
+                hash_archivo=hash_entrada,
+                estado="pendiente",
+                ruta_archivo=str(ruta_guardado),
+            )
+            db.add(nuevo_archivo)
+            db.commit()
+            db.refresh(nuevo_archivo)
+            creados.append(nuevo_archivo)
+
+        if not creados:
+            if not duplicados:
+                return {"ok": False, "detail": "El ZIP no contiene archivos", "status_code": 400}
             return {
                 "ok": False,
-                "detail": f"Archivo duplicado. Ya procesado con ID {archivo_existente.id}",
+                "detail": f"Archivo duplicado. Ya procesado con ID {', '.join(map(str, duplicados))}",
                 "status_code": 400,
             }
 
-        upload_dir = Path(settings.UPLOAD_DIR)
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        nombre = nombre_archivo or "sin_nombre.xml"
-        ruta_guardado = upload_dir / nombre
-        ruta_guardado.write_bytes(contenido)
-        ruta_str = str(ruta_guardado)
-
-        nuevo_archivo = ArchivoProcesado(
-            usuario_id=usuario_id,
-            nombre_archivo=nombre,
-            hash_archivo=hash_archivo,
-            estado="pendiente",
-            ruta_archivo=ruta_str,
-        )
-        db.add(nuevo_archivo)
-        db.commit()
-        db.refresh(nuevo_archivo)
-        archivo_id = nuevo_archivo.id
-
-        _encolar_o_procesar_sync(archivo_id, ruta_str)
+        for archivo in creados:
+            _encolar_o_procesar_sync(archivo.id, archivo.ruta_archivo, motor_validacion)
 
         return {
             "ok": True,
-            "archivo_id": archivo_id,
-            "nombre_archivo": nuevo_archivo.nombre_archivo,
+            "archivo_id": creados[0].id,
+            "nombre_archivo": creados[0].nombre_archivo,
+            "archivo_ids": [archivo.id for archivo in creados],
+            "duplicados": duplicados,
         }
     except Exception as e:
         return {
@@ -115,25 +217,94 @@ def _subida_pesada_sync(
             "status_code": 500,
         }
     finally:
+        for ruta in temporales:
+            if os.path.exists(ruta):
+                os.unlink(ruta)
+        db.close()
+
+
+def _simulacion_sync(origen: BinaryIO, nombre_archivo: str, motor_validacion: str | None = None) -> dict:
+    """
+    Simulación (dry-run) de una subida: guarda el archivo en un temporal y lo
+    recorre con simular_archivo (un informe por archivo si es un .zip). No crea
+    archivo_procesado ni escribe energía o errores; los temporales se borran al terminar.
+    Devuelve {"ok": True, "informes": [...]} o {"ok": False, "detail": str, "status_code": int}.
+    """
+    from app.database import SessionLocal
+    from app.services.procesador_service import simular_archivo
+
+    db = SessionLocal()
+    temporales: list[str] = []
+    try:
+        upload_dir = Path(settings.UPLOAD_DIR)
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        ruta_temporal, _ = _guardar_temporal(origen, upload_dir)
+        temporales.append(ruta_temporal)
+        with open(ruta_temporal, "rb") as f:
+            compresion = detectar_compresion(f.read(4))
+        if compresion == "zip":
+            entradas = [(ruta, nombre) for ruta, _, nombre in _entradas_zip(ruta_temporal, upload_dir, temporales)]
+        else:
+            entradas = [(ruta_temporal, nombre_archivo)]
+        if not entradas:
+            return {"ok": False, "detail": "El ZIP no contiene archivos", "status_code": 400}
+
+        informes = []
+        for ruta, nombre in entradas:
+            informe = simular_archivo(db, ruta, motor_validacion=motor_validacion)
+            informes.append({"nombre_archivo": nombre, **informe})
+        return {"ok": True, "informes": informes}
+    except Exception as e:
+        return {"ok": False, "detail": f"Error en la simulación: {e}", "status_code": 500}
+    finally:
+        for ruta in temporales:
+            if os.path.exists(ruta):
+                os.unlink(ruta)
         db.close()
 
 
 @router.post(
     "/upload",
-    response_model=ArchivoUploadResponse,
+    response_model=Union[ArchivoUploadResponse, SimulacionResponse],
     status_code=status.HTTP_202_ACCEPTED,
 )
 async def upload_archivo(
+    response: Response,
     file: UploadFile = File(...),
     usuario_id: int = 1,
+    motor_validacion: Literal["python", "numpy"] | None = None,
+    simulacion: bool = False,
     db: Session = Depends(get_db),
 ):
     """
     Sube un archivo de peajes. El trabajo pesado (hash, guardado, Celery/hilo)
     se hace en segundo plano para no bloquear el servidor; el dashboard sigue respondiendo.
+    motor_validacion elige el motor de validación de filas CSV/TXT de este trabajo
+    (por defecto PROCESAMIENTO_MOTOR_VALIDACION).
+    Con simulacion=true no se guarda nada: el archivo se valida en la petición,
+    por el mismo camino que el procesamiento real, y se devuelve (200) un informe
+    con los errores por tipo, las líneas por segundo por etapa y el pico de memoria.
     """
     from app.models.usuario import Usuario
 
+    nombre_archivo = file.filename or "sin_nombre.xml"
+    if simulacion:
+        resultado = await asyncio.to_thread(_simulacion_sync, file.file, nombre_archivo, motor_validacion)
+        if not resultado.get("ok"):
+            raise HTTPException(
+                status_code=resultado.get("status_code", 500),
+                detail=resultado.get("detail", "Error en la simulación"),
+            )
+        response.status_code = status.HTTP_200_OK
+        informes = resultado["informes"]
+        return SimulacionResponse(
+            mensaje=(
+                f"Simulación: {sum(i['registros_con_error'] for i in informes)} de "
+                f"{sum(i['total_registros'] for i in informes)} línea(s) con error. No se ha guardado nada."
+            ),
+            informes=informes,
+        )
+
     usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
     if not usuario:
         usuario = db.query(Usuario).first()
@@ -144,15 +315,14 @@ async def upload_archivo(
         )
     usuario_id = usuario.id
 
-    contenido = await file.read()
-    nombre_archivo = file.filename or "sin_nombre.xml"
-
-    # Ejecutar hash, guardado y encolado en un hilo para no bloquear el event loop
+    # Ejecutar hash, guardado y encolado en un hilo para no bloquear el event loop;
+    # el contenido se lee por trozos del archivo subido, sin cargarlo entero en memoria
     resultado = await asyncio.to_thread(
         _subida_pesada_sync,
-        contenido,
+        file.file,
         nombre_archivo,
         usuario_id,
+        motor_validacion,
     )
 
     if not resultado.get("ok"):
@@ -161,11 +331,18 @@ async def upload_archivo(
             detail=resultado.get("detail", "Error en la subida"),
         )
 
+    mensaje = "Archivo en cola."
+    if len(resultado["archivo_ids"]) > 1 or resultado["duplicados"]:
+        mensaje = f"ZIP: {len(resultado['archivo_ids'])} archivo(s) en cola."
+        if resultado["duplicados"]:
+            mensaje += f" Omitidos por duplicados (ya procesados con ID {', '.join(map(str, resultado['duplicados']))})."
+    mensaje += " El procesamiento continúa en segundo plano (Celery o worker). Consulta estado en Archivos."
     return ArchivoUploadResponse(
         archivo_id=resultado["archivo_id"],
         nombre_archivo=resultado["nombre_archivo"],
         estado="pendiente",
-        mensaje="Archivo en cola. El procesamiento continúa en segundo plano (Celery o worker). Consulta estado en Archivos.",
+        mensaje=mensaje,
+        archivo_ids=resultado["archivo_ids"],
     )
 
 
@@ -176,3 +353,73 @@ def get_archivo_status(archivo_id: int, db: Session = Depends(get_db)):
     if not archivo:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     return archivo
+
+
+@router.get("/{archivo_id}/profile", response_model=ArchivoPerfilResponse)
+def get_perfil_archivo(archivo_id: int, db: Session = Depends(get_db)):
+    """
+    Perfil de la última ejecución del procesamiento: segundos, filas y líneas por
+    segundo de cada etapa, sentencias enviadas a la BD y pico de memoria del worker.
+    """
+    archivo = db.query(ArchivoProcesado).filter(ArchivoProcesado.id == archivo_id).first()
+    if not archivo:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    if not archivo.perfil:
+        raise HTTPException(status_code=404, detail="El archivo aún no tiene perfil de procesamiento")
+    return {
+        "archivo_id": archivo.id,
+        "nombre_archivo": archivo.nombre_archivo,
+        "estado": archivo.estado,
+        "fecha_procesamiento": archivo.fecha_procesamiento,
+        **archivo.perfil,
+    }
+
+
+def _leer_evento_archivo(archivo_id: int) -> dict | None:
+    """Progreso guardado en BD (para comprobar el final si se perdió el último evento)."""
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        archivo = db.query(ArchivoProcesado).filter(ArchivoProcesado.id == archivo_id).first()
+        return evento_desde_archivo(archivo) if archivo else None
+    finally:
+        db.close()
+
+
+def _formato_sse(evento: dict) -> str:
+    return f"event: progreso\ndata: {json.dumps(evento)}\n\n"
+
+
+async def _eventos_sse(archivo_id: int, inicial: dict):
+    yield _formato_sse(inicial)
+    if inicial["estado"] in ESTADOS_FINALES:
+        return
+    async with aclosing(suscribir_progreso(archivo_id, settings.PROGRESO_LATIDO_SEGUNDOS)) as eventos:
+        async for evento in eventos:
+            if evento is None:
+                # Sin eventos en un intervalo: comprobar en BD si ya terminó; si no, latido
+                evento = await asyncio.to_thread(_leer_evento_archivo, archivo_id)
+                if evento is None or evento["estado"] not in ESTADOS_FINALES:
+                    yield ": latido\n\n"
+                    continue
+            yield _formato_sse(evento)
+            if evento["estado"] in ESTADOS_FINALES:
+                return
+
+
+@router.get("/{archivo_id}/events")
+def stream_progreso_archivo(archivo_id: int, db: Session = Depends(get_db)):
+    """
+    Progreso en vivo del procesamiento (Server-Sent Events, evento 'progreso'):
+    líneas leídas, exitosas, con error, líneas por segundo y ETA. Empieza con el
+    estado guardado y termina cuando el archivo queda completado o en error.
+    """
+    archivo = db.query(ArchivoProcesado).filter(ArchivoProcesado.id == archivo_id).first()
+    if not archivo:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    return StreamingResponse(
+        _eventos_sse(archivo_id, evento_desde_archivo(archivo)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
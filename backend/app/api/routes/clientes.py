@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, select, true
+from typing import List, Optional
 
 from app.api.deps import get_db
 from app.models import Cliente, EnergiaExcedentaria
-from app.schemas.cliente import ClienteCreate, ClienteUpdate, ClienteResponse, ClienteWithStats
+from app.schemas.cliente import ClienteCreate, ClienteUpdate, ClienteResponse, ClienteWithStats, EnergiaMes
+from app.services.resumen_service import CAMPOS_RESUMEN, NUM_PERIODOS, totales_por_mes
 
 router = APIRouter()
 
@@ -150,42 +152,124 @@ def get_clientes_stats(db: Session = Depends(get_db)):
     }
 
 
+def _energia_por_periodo(db: Session, condiciones: list) -> tuple[int, dict, list]:
+    """
+    Una sola consulta: desanida los arrays P1-P6 de los registros (unnest WITH
+    ORDINALITY) y suma por periodo; ROLLUP añade la fila de totales (periodo NULL).
+    Devuelve el número de registros, los totales y el desglose por periodo.
+    """
+    periodos = (
+        func.unnest(EnergiaExcedentaria.energia_neta_gen, EnergiaExcedentaria.energia_autoconsumida, EnergiaExcedentaria.pago_tda)
+        .table_valued("generada", "autoconsumida", "pago", with_ordinality="periodo")
+        .render_derived()
+    )
+    filas = db.execute(
+        select(
+            periodos.c.periodo,
+            func.count(EnergiaExcedentaria.id.distinct()),
+            func.coalesce(func.sum(periodos.c.generada), 0),
+            func.coalesce(func.sum(periodos.c.autoconsumida), 0),
+            func.coalesce(func.sum(periodos.c.pago), 0),
+        )
+        .select_from(EnergiaExcedentaria)
+        .join(periodos, true())
+        .where(*condiciones)
+        .group_by(func.rollup(periodos.c.periodo))
+        .order_by(periodos.c.periodo)
+    ).all()
+    total_registros, totales, desglose = 0, {"generada": 0.0, "autoconsumida": 0.0, "pago": 0.0}, []
+    for periodo, registros, generada, autoconsumida, pago in filas:
+        valores = {"generada": float(generada), "autoconsumida": float(autoconsumida), "pago": float(pago)}
+        if periodo is None:
+            total_registros, totales = registros, valores
+        else:
+            desglose.append({"periodo": periodo, **valores})
+    return total_registros, totales, desglose
+
+
+def _energia_desde_resumen(db: Session, cliente_id: int) -> tuple[int, dict, list]:
+    """
+    Lo mismo que _energia_por_periodo sin filtro de fechas, pero sumando las filas
+    del resumen mensual (una por mes) en lugar de desanidar cada registro.
+    """
+    meses = totales_por_mes(db, cliente_id)
+    total_registros = sum(m.registros for m in meses)
+    claves = ("generada", "autoconsumida", "pago")
+    sumas = [
+        {clave: sum(getattr(m, f"{c}_{p}") for m in meses) for clave, c in zip(claves, CAMPOS_RESUMEN)}
+        for p in range(1, NUM_PERIODOS + 1)
+    ]
+    totales = {clave: float(sum(s[clave] for s in sumas)) for clave in claves}
+    desglose = [
+        {"periodo": p, **{clave: float(v) for clave, v in s.items()}}
+        for p, s in enumerate(sumas, start=1)
+    ] if total_registros else []
+    return total_registros, totales, desglose
+
+
 @router.get("/{cliente_id}/energia", response_model=ClienteWithStats)
-def get_cliente_with_energia(cliente_id: int, db: Session = Depends(get_db)):
+def get_cliente_with_energia(
+    cliente_id: int,
+    fecha_desde: Optional[date] = Query(None),
+    fecha_hasta: Optional[date] = Query(None),
+    db: Session = Depends(get_db),
+):
     """
-    Obtener cliente con estadísticas de energía
+    Obtener cliente con estadísticas de energía: totales y desglose por periodo
+    (P1-P6), calculados en la BD. Sin fechas se leen del resumen mensual; con
+    fecha_desde/fecha_hasta, de los registros de ese rango (mismo criterio que GET /energia).
     """
-    cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+    cliente = db.execute(select(Cliente.__table__).where(Cliente.id == cliente_id)).mappings().first()
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Cliente con ID {cliente_id} no encontrado"
         )
-    
-    # Obtener estadísticas de energía
-    registros = db.query(EnergiaExcedentaria).filter(
-        EnergiaExcedentaria.cliente_id == cliente_id
-    ).all()
-    
-    total_registros = len(registros)
-    
-    # Calcular totales de energía
-    total_generada = 0
-    total_autoconsumida = 0
-    total_pago = 0
-    
-    for registro in registros:
-        if registro.energia_neta_gen:
-            total_generada += sum(registro.energia_neta_gen)
-        if registro.energia_autoconsumida:
-            total_autoconsumida += sum(registro.energia_autoconsumida)
-        if registro.pago_tda:
-            total_pago += sum(registro.pago_tda)
-    
+
+    if fecha_desde is None and fecha_hasta is None:
+        total_registros, totales, periodos = _energia_desde_resumen(db, cliente_id)
+    else:
+        condiciones = [EnergiaExcedentaria.cliente_id == cliente_id]
+        if fecha_desde is not None:
+            condiciones.append(EnergiaExcedentaria.fecha_desde >= fecha_desde)
+        if fecha_hasta is not None:
+            condiciones.append(EnergiaExcedentaria.fecha_hasta <= fecha_hasta)
+        total_registros, totales, periodos = _energia_por_periodo(db, condiciones)
+
     return {
-        **cliente.__dict__,
+        **cliente,
         "total_registros": total_registros,
-        "total_energia_generada": float(total_generada),
-        "total_energia_autoconsumida": float(total_autoconsumida),
-        "total_pago_tda": float(total_pago)
+        "total_energia_generada": totales["generada"],
+        "total_energia_autoconsumida": totales["autoconsumida"],
+        "total_pago_tda": totales["pago"],
+        "periodos": periodos,
     }
+
+
+@router.get("/{cliente_id}/energia/mensual", response_model=List[EnergiaMes])
+def get_cliente_energia_mensual(
+    cliente_id: int,
+    desde: Optional[date] = Query(None, description="Primer mes (vale cualquier día del mes)"),
+    hasta: Optional[date] = Query(None, description="Último mes, incluido"),
+    db: Session = Depends(get_db),
+):
+    """
+    Totales de energía del cliente mes a mes (por fecha_desde de los registros),
+    leídos del resumen mensual: una fila por mes, sin recorrer los registros.
+    """
+    if db.execute(select(Cliente.id).where(Cliente.id == cliente_id)).first() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Cliente con ID {cliente_id} no encontrado"
+        )
+    return [
+        {
+            "mes": m.mes,
+            "registros": m.registros,
+            **{
+                clave: float(sum(getattr(m, f"{c}_{p}") for p in range(1, NUM_PERIODOS + 1)))
+                for clave, c in zip(("generada", "autoconsumida", "pago"), CAMPOS_RESUMEN)
+            },
+        }
+        for m in totales_por_mes(db, cliente_id, desde, hasta)
+    ]
@@ -1,43 +1,102 @@
 from datetime import date
-from typing import Optional
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_db
+from app.config import settings
 from app.models import EnergiaExcedentaria
 from app.schemas.energia import EnergiaExcedenteResponse, EnergiaListResponse
+from app.services.exportacion_service import TIPOS_MEDIO_EXPORTACION, exportar_csv, exportar_ndjson, filas_energia
+from app.services.paginacion_service import ModoTotal, contar, paginar
 
 router = APIRouter(prefix="/api/v1/energia", tags=["energia"])
 
+# Órdenes de la paginación: columna de orden y el id para desempatar
+ORDENES_ENERGIA = {
+    "linea_archivo": (EnergiaExcedentaria.linea_archivo, EnergiaExcedentaria.id),
+    "fecha_desde": (EnergiaExcedentaria.fecha_desde, EnergiaExcedentaria.id),
+}
 
-@router.get("", response_model=EnergiaListResponse)
-def get_energia_registros(
+
+def filtros_energia(
     cups: Optional[str] = Query(None),
     fecha_desde: Optional[date] = Query(None),
     fecha_hasta: Optional[date] = Query(None),
     tipo_autoconsumo: Optional[int] = Query(None),
     archivo_id: Optional[int] = Query(None, description="Filtrar por ID de archivo (registros OK de ese archivo)"),
-    db: Session = Depends(get_db),
-):
-    """
-    Consulta registros de energía con filtros opcionales.
-    Use archivo_id para ver los registros OK de un archivo concreto.
-    """
-    query = db.query(EnergiaExcedentaria)
+) -> list:
+    """Condiciones de los filtros comunes de la consulta y la exportación de energía."""
+    condiciones = []
     if archivo_id is not None:
-        query = query.filter(EnergiaExcedentaria.archivo_id == archivo_id)
+        condiciones.append(EnergiaExcedentaria.archivo_id == archivo_id)
     if cups:
-        query = query.filter(EnergiaExcedentaria.cups_cliente == cups)
+        condiciones.append(EnergiaExcedentaria.cups_cliente == cups)
     if fecha_desde is not None:
-        query = query.filter(EnergiaExcedentaria.fecha_desde >= fecha_desde)
+        condiciones.append(EnergiaExcedentaria.fecha_desde >= fecha_desde)
     if fecha_hasta is not None:
-        query = query.filter(EnergiaExcedentaria.fecha_hasta <= fecha_hasta)
+        condiciones.append(EnergiaExcedentaria.fecha_hasta <= fecha_hasta)
     if tipo_autoconsumo is not None:
-        query = query.filter(EnergiaExcedentaria.tipo_autoconsumo == tipo_autoconsumo)
+        condiciones.append(EnergiaExcedentaria.tipo_autoconsumo == tipo_autoconsumo)
+    return condiciones
+
 
-    registros = query.order_by(EnergiaExcedentaria.linea_archivo).all()
+@router.get("", response_model=EnergiaListResponse)
+def get_energia_registros(
+    condiciones: list = Depends(filtros_energia),
+    orden: Literal["linea_archivo", "fecha_desde"] = Query("linea_archivo"),
+    limite: int = Query(settings.ENERGIA_TAMANO_PAGINA, ge=1, le=settings.ENERGIA_MAX_TAMANO_PAGINA),
+    cursor: Optional[str] = Query(None, description="siguiente_cursor de la página anterior"),
+    total: ModoTotal = Query(
+        "ninguno", description="ninguno (por defecto), exacto (COUNT) o estimado (planificador)"
+    ),
+    db: Session = Depends(get_db),
+):
+    """
+    Consulta registros de energía con filtros opcionales, por páginas de como
+    mucho `limite` registros. La siguiente página se pide con `cursor` =
+    `siguiente_cursor` (null en la última) y los mismos filtros y orden.
+    Use archivo_id para ver los registros OK de un archivo concreto.
+    El total solo se cuenta si se pide (total=exacto o estimado), para que las
+    páginas siguientes no recorran la tabla; si todo cabe en una página, va siempre.
+    """
+    query = db.query(EnergiaExcedentaria).filter(*condiciones)
+    try:
+        registros, siguiente = paginar(query, orden, ORDENES_ENERGIA[orden], cursor, limite)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cursor is None and siguiente is None:
+        # Todo cabe en la primera página: el total es el número de registros
+        conteo = len(registros)
+    elif total == "ninguno":
+        conteo = None
+    else:
+        conteo = contar(db, query, total)
     return EnergiaListResponse(
-        total=len(registros),
+        total=conteo,
         registros=[EnergiaExcedenteResponse.model_validate(r) for r in registros],
+        siguiente_cursor=siguiente,
+    )
+
+
+@router.get("/export")
+def exportar_energia_registros(
+    condiciones: list = Depends(filtros_energia),
+    formato: Literal["ndjson", "csv"] = Query("ndjson"),
+    orden: Literal["linea_archivo", "fecha_desde"] = Query("linea_archivo"),
+    db: Session = Depends(get_db),
+):
+    """
+    Exporta todos los registros de energía que cumplen los filtros (los mismos
+    que GET /energia), en NDJSON (un registro JSON por línea, mismos campos que
+    la consulta) o CSV (periodos en columnas _1.._6). Se envían a medida que se
+    leen de un cursor del servidor: memoria constante sea cual sea el tamaño.
+    """
+    filas = filas_energia(db, condiciones, ORDENES_ENERGIA[orden])
+    return StreamingResponse(
+        exportar_csv(filas) if formato == "csv" else exportar_ndjson(filas),
+        media_type=TIPOS_MEDIO_EXPORTACION[formato],
+        headers={"Content-Disposition": f'attachment; filename="energia.{formato}"'},
     )
@@ -1,22 +1,75 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_db
+from app.config import settings
 from app.models import ArchivoProcesado, RegistroErrores
-from app.schemas.error import ErrorResponse
+from app.schemas.error import ErrorResponse, ErrorResumen
+from app.services.paginacion_service import paginar
 
 router = APIRouter(tags=["errores"])
 
+# Orden del listado (el de siempre: archivo y línea) con el id para desempatar
+ORDEN_ERRORES = (RegistroErrores.archivo_id, RegistroErrores.linea_archivo, RegistroErrores.id)
+# El cuerpo sigue siendo una lista; el cursor de la página siguiente va en esta cabecera
+CABECERA_SIGUIENTE_CURSOR = "X-Siguiente-Cursor"
+
 
 @router.get("", response_model=list[ErrorResponse])
-def get_todos_errores(db: Session = Depends(get_db)):
-    """Obtiene todos los errores registrados."""
-    errores = (
-        db.query(RegistroErrores)
-        .order_by(RegistroErrores.archivo_id, RegistroErrores.linea_archivo)
+def get_todos_errores(
+    response: Response,
+    archivo_id: Optional[int] = Query(None),
+    tipo_error: Optional[str] = Query(None),
+    fecha_desde: Optional[date] = Query(None, description="Registrados desde este día"),
+    fecha_hasta: Optional[date] = Query(None, description="Registrados hasta este día, incluido"),
+    limite: int = Query(settings.ERRORES_TAMANO_PAGINA, ge=1, le=settings.ERRORES_MAX_TAMANO_PAGINA),
+    cursor: Optional[str] = Query(None, description=f"Cabecera {CABECERA_SIGUIENTE_CURSOR} de la página anterior"),
+    db: Session = Depends(get_db),
+):
+    """
+    Errores registrados, por archivo y línea, en páginas de como mucho `limite`.
+    Si hay más, la respuesta trae la cabecera X-Siguiente-Cursor: la página
+    siguiente se pide con `cursor` = ese valor y los mismos filtros.
+    """
+    query = db.query(RegistroErrores)
+    if archivo_id is not None:
+        query = query.filter(RegistroErrores.archivo_id == archivo_id)
+    if tipo_error:
+        query = query.filter(RegistroErrores.tipo_error == tipo_error)
+    if fecha_desde is not None:
+        query = query.filter(RegistroErrores.fecha_registro >= datetime.combine(fecha_desde, time.min))
+    if fecha_hasta is not None:
+        query = query.filter(RegistroErrores.fecha_registro < datetime.combine(fecha_hasta + timedelta(days=1), time.min))
+    try:
+        errores, siguiente = paginar(query, "archivo_linea", ORDEN_ERRORES, cursor, limite)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if siguiente is not None:
+        response.headers[CABECERA_SIGUIENTE_CURSOR] = siguiente
+    return [ErrorResponse.model_validate(e) for e in errores]
+
+
+@router.get("/resumen", response_model=list[ErrorResumen])
+def get_resumen_errores(archivo_id: Optional[int] = Query(None), db: Session = Depends(get_db)):
+    """
+    Número de errores por archivo y tipo_error, sin transferir los errores.
+    Se cuenta solo con el índice (archivo_id, tipo_error) de registro_errores.
+    """
+    query = db.query(
+        RegistroErrores.archivo_id, RegistroErrores.tipo_error, func.count().label("total")
+    )
+    if archivo_id is not None:
+        query = query.filter(RegistroErrores.archivo_id == archivo_id)
+    filas = (
+        query.group_by(RegistroErrores.archivo_id, RegistroErrores.tipo_error)
+        .order_by(RegistroErrores.archivo_id, RegistroErrores.tipo_error)
         .all()
     )
-    return [ErrorResponse.model_validate(e) for e in errores]
+    return [ErrorResumen(archivo_id=a, tipo_error=t, total=n) for a, t, n in filas]
 
 
 @router.get("/{archivo_id}", response_model=list[ErrorResponse])
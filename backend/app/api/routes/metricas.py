@@ -0,0 +1,55 @@
+import logging
+
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import metricas
+from app.api.deps import get_db
+from app.models import ArchivoProcesado
+from app.services.progreso_service import cliente_redis, marcar_redis_no_disponible
+
+router = APIRouter(tags=["metricas"])
+logger = logging.getLogger(__name__)
+
+
+def _tareas_en_cola() -> dict[str, int]:
+    """
+    Mensajes pendientes de cada cola de Celery en el broker Redis (una lista por
+    prioridad, como las cuenta kombu). Vacío si Redis no está disponible.
+    """
+    from kombu.transport.redis import PRIORITY_STEPS, Channel
+
+    from app.celery_app import celery_app
+
+    cola = celery_app.conf.task_default_queue
+    try:
+        cliente = cliente_redis()
+        if cliente is None:
+            return {}
+        with cliente.pipeline() as pipe:
+            for prioridad in PRIORITY_STEPS:
+                pipe.llen(f"{cola}{Channel.sep}{prioridad}" if prioridad else cola)
+            return {cola: sum(pipe.execute())}
+    except Exception as e:
+        logger.debug("Cola de Celery sin Redis: %s", e)
+        marcar_redis_no_disponible()
+        return {}
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metricas(db: Session = Depends(get_db)):
+    """
+    Métricas en formato Prometheus: latencia HTTP por ruta, espera por conexión de
+    la BD, ingesta (líneas, errores por tipo_error, trabajos por estado, segundos
+    por etapa, espera en cola por tarea), archivos por estado en la BD y tareas
+    esperando en la cola del broker (el retraso se ve mientras crece, no solo
+    cuando un worker recoge la tarea).
+    """
+    conteos = dict.fromkeys(("pendiente", "procesando", "completado", "error"), 0)
+    conteos.update(db.query(ArchivoProcesado.estado, func.count(ArchivoProcesado.id)).group_by(ArchivoProcesado.estado).all())
+    metricas.actualizar_archivos_por_estado(conteos)
+    for cola, pendientes in _tareas_en_cola().items():
+        metricas.actualizar_tareas_en_cola(cola, pendientes)
+    contenido, tipo = metricas.exportar()
+    return Response(content=contenido, media_type=tipo)
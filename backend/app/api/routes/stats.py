@@ -1,21 +1,19 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from app.api.deps import get_db
-from app.models import ArchivoProcesado, EnergiaExcedentaria, RegistroErrores
+from app.services.estadisticas_service import obtener_estadisticas
 
 router = APIRouter(prefix="/api/v1/stats", tags=["stats"])
 
 
 @router.get("")
-def get_stats(db: Session = Depends(get_db)):
-    """Estadísticas para el dashboard."""
-    total_archivos = db.query(func.count(ArchivoProcesado.id)).scalar() or 0
-    total_energia = db.query(func.count(EnergiaExcedentaria.id)).scalar() or 0
-    total_errores = db.query(func.count(RegistroErrores.id)).scalar() or 0
-    return {
-        "total_archivos": total_archivos,
-        "total_registros_energia": total_energia,
-        "total_errores": total_errores,
-    }
+def get_stats(
+    exact: bool = Query(False, description="Contar las tablas enteras en lugar de usar los contadores cacheados"),
+    db: Session = Depends(get_db),
+):
+    """
+    Estadísticas para el dashboard. Por defecto salen de los contadores por archivo
+    que guarda la ingesta al terminar cada trabajo, cacheados STATS_CACHE_SEGUNDOS.
+    """
+    return obtener_estadisticas(db, exactas=exact)
@@ -23,7 +23,7 @@ celery_app.conf.update(
     worker_cancel_long_running_tasks_on_connection_loss=True,
     # Redis: comprobar conexión periódicamente para evitar cierres por inactividad
     broker_transport_options={
-        "visibility_timeout": 3600,
+        "visibility_timeout": settings.CELERY_VISIBILITY_TIMEOUT,
         "health_check_interval": 30,
         "socket_keepalive": True,
         "socket_connect_timeout": 10,
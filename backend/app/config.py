@@ -38,6 +38,38 @@ class Settings(BaseSettings):
     
     # Upload
     UPLOAD_DIR: str = "./uploads"
+    # Bytes leídos por trozo al guardar una subida (memoria acotada por subida)
+    UPLOAD_TAMANO_TROZO: int = 1024 * 1024
+
+    # Procesamiento: líneas por lote (consulta de CUPS, escritura en bloque y commit)
+    PROCESAMIENTO_TAMANO_LOTE: int = 1000
+    # Procesos para validar en paralelo CSV/TXT grandes (1 = secuencial) y bytes por trozo
+    PROCESAMIENTO_PROCESOS: int = 1
+    PROCESAMIENTO_BYTES_TROZO: int = 4 * 1024 * 1024
+    # Motor de validación de filas CSV/TXT: "python" (fila a fila) o "numpy" (por lotes, requiere numpy>=2)
+    PROCESAMIENTO_MOTOR_VALIDACION: str = "python"
+    # Celery: los CSV/TXT mayores que el umbral se reparten en subtareas por trozos
+    CELERY_UMBRAL_DIVISION_BYTES: int = 256 * 1024 * 1024
+    CELERY_BYTES_TROZO: int = 64 * 1024 * 1024
+    # Segundos sin ack tras los que Redis vuelve a entregar una tarea (acks_late): por encima
+    # del trabajo más largo. Si aun así se duplica, reservar_archivo hace que la copia no haga nada
+    CELERY_VISIBILITY_TIMEOUT: int = 24 * 3600
+    # Progreso en vivo (SSE): intervalo mínimo entre eventos y latido de la conexión
+    PROGRESO_INTERVALO_SEGUNDOS: float = 1.0
+    PROGRESO_LATIDO_SEGUNDOS: float = 15.0
+    # GET /api/v1/energia: registros por página por defecto y máximo
+    ENERGIA_TAMANO_PAGINA: int = 100
+    ENERGIA_MAX_TAMANO_PAGINA: int = 1000
+    # GET /api/v1/errores: errores por página por defecto y máximo
+    ERRORES_TAMANO_PAGINA: int = 100
+    ERRORES_MAX_TAMANO_PAGINA: int = 1000
+    # Exportación en streaming de energía: filas leídas del cursor del servidor (y enviadas) por lote
+    EXPORTACION_FILAS_LOTE: int = 2000
+    # Métricas Prometheus del worker Celery: puerto del servidor HTTP (0 = sin servidor).
+    # Con varios procesos, definir además PROMETHEUS_MULTIPROC_DIR (ver app/metricas.py)
+    METRICAS_PUERTO_WORKER: int = 9101
+    # GET /api/v1/stats: segundos que se sirven los contadores cacheados (la ingesta los invalida al terminar)
+    STATS_CACHE_SEGUNDOS: float = 30.0
 
     model_config = {
         "env_file": _PROJECT_ROOT / ".env",
@@ -3,9 +3,12 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.config import settings
+from app.metricas import QueuePoolMedido
 
 engine = create_engine(
     settings.database_url,
+    # QueuePool (el de siempre) midiendo la espera por una conexión
+    poolclass=QueuePoolMedido,
     pool_pre_ping=True,
     echo=False,  # 
 )
@@ -3,7 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 
 from app.config import settings
-from app.api.routes import archivos, energia, errores, stats, usuarios, clientes, auth
+from app.api.routes import archivos, energia, errores, stats, usuarios, clientes, auth, metricas
+from app.metricas import MiddlewareMetricas
 from app.database import get_db
 
 # Desactivar logs de SQLAlchemy
@@ -20,7 +21,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Para que el frontend pueda leer el cursor de la página siguiente de GET /errores
+    expose_headers=[errores.CABECERA_SIGUIENTE_CURSOR],
 )
+# Latencia de cada petición por ruta (expuesta en /metrics)
+app.add_middleware(MiddlewareMetricas)
 
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(archivos.router)
@@ -29,6 +34,7 @@ app.include_router(errores.router, prefix="/api/v1/errores")
 app.include_router(stats.router)
 app.include_router(usuarios.router, prefix="/api/v1/usuarios", tags=["usuarios"])
 app.include_router(clientes.router, prefix="/api/v1/clientes", tags=["clientes"])
+app.include_router(metricas.router)
 
 
 @app.get("/")
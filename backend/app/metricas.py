@@ -0,0 +1,206 @@
+"""
+Métricas en formato Prometheus de la API y de los workers.
+
+Con varios procesos (uvicorn --workers, Celery prefork) hay que definir la
+variable de entorno PROMETHEUS_MULTIPROC_DIR (directorio vacío y compartido,
+que se limpia al arrancar): cada proceso escribe sus métricas ahí y registro()
+las agrega. Sin ella, cada proceso solo expone las suyas (basta con un único
+proceso, p. ej. el worker con -P solo).
+La API las expone en /metrics; el worker, en un servidor HTTP propio
+(METRICAS_PUERTO_WORKER, ver iniciar_exportador_worker).
+"""
+
+import logging
+import os
+import time
+from typing import Mapping
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+PREFIJO = "energy"
+# Rutas sin plantilla (404): una sola etiqueta para no disparar la cardinalidad
+RUTA_DESCONOCIDA = "sin_ruta"
+CUBETAS_ESPERA = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CUBETAS_TRABAJO = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+DURACION_PETICIONES = Histogram(
+    f"{PREFIJO}_http_duracion_segundos",
+    "Duración de las peticiones HTTP por método, ruta (plantilla) y código de estado",
+    ("metodo", "ruta", "codigo"),
+)
+ESPERA_CONEXION_BD = Histogram(
+    f"{PREFIJO}_bd_espera_conexion_segundos",
+    "Tiempo de espera para obtener una conexión del pool de la BD",
+    buckets=CUBETAS_ESPERA,
+)
+LINEAS_INGESTA = Counter(
+    f"{PREFIJO}_ingesta_lineas",
+    "Líneas procesadas por resultado (valida, error)",
+    ("resultado",),
+)
+ERRORES_INGESTA = Counter(
+    f"{PREFIJO}_ingesta_errores",
+    "Errores de línea por tipo_error",
+    ("tipo_error",),
+)
+SEGUNDOS_ETAPA = Counter(
+    f"{PREFIJO}_ingesta_etapa_segundos",
+    "Segundos acumulados por etapa del procesamiento (entre las líneas: latencia por línea)",
+    ("etapa",),
+)
+TRABAJOS = Counter(
+    f"{PREFIJO}_ingesta_trabajos",
+    "Trabajos de procesamiento terminados por estado",
+    ("estado",),
+)
+DURACION_TRABAJOS = Histogram(
+    f"{PREFIJO}_ingesta_trabajo_segundos",
+    "Duración de los trabajos de procesamiento",
+    buckets=CUBETAS_TRABAJO,
+)
+ESPERA_COLA = Histogram(
+    f"{PREFIJO}_ingesta_espera_cola_segundos",
+    "Tiempo desde que se encola una tarea (archivo, trozo o finalización) hasta que un worker la empieza",
+    ("tarea",),
+    buckets=CUBETAS_TRABAJO,
+)
+TAREAS_EN_COLA = Gauge(
+    f"{PREFIJO}_cola_tareas",
+    "Tareas esperando en la cola del broker, aún sin worker (leído en cada consulta de /metrics)",
+    ("cola",),
+    multiprocess_mode="mostrecent",
+)
+ARCHIVOS = Gauge(
+    f"{PREFIJO}_archivos",
+    "Archivos en archivo_procesado por estado (leído de la BD en cada consulta de /metrics)",
+    ("estado",),
+    multiprocess_mode="mostrecent",
+)
+
+
+def multiproceso() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def registro() -> CollectorRegistry:
+    """Registro a exponer: el agregado de todos los procesos en multiproceso, o el del proceso."""
+    if not multiproceso():
+        return REGISTRY
+    agregado = CollectorRegistry()
+    multiprocess.MultiProcessCollector(agregado)
+    return agregado
+
+
+def exportar() -> tuple[bytes, str]:
+    """Métricas en el formato de texto de Prometheus y su content-type."""
+    return generate_latest(registro()), CONTENT_TYPE_LATEST
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI: duración de cada petición HTTP por método, plantilla de ruta
+    (p. ej. /api/v1/archivos/{archivo_id}) y código. En respuestas en streaming
+    (SSE, exportaciones) cuenta hasta que termina el envío.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        codigo = 500
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # El router deja la ruta resuelta en el scope
+            ruta = getattr(scope.get("route"), "path", RUTA_DESCONOCIDA)
+            DURACION_PETICIONES.labels(scope["method"], ruta, str(codigo)).observe(time.perf_counter() - inicio)
+
+
+class QueuePoolMedido(QueuePool):
+    """QueuePool que mide cuánto se espera para obtener una conexión (incluye abrirla si hace falta)."""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            ESPERA_CONEXION_BD.observe(time.perf_counter() - inicio)
+
+
+def observar_lote(validas: int, con_error: int, errores_por_tipo: Mapping[str, int]) -> None:
+    """Líneas de un lote ya guardado y sus errores por tipo."""
+    if validas:
+        LINEAS_INGESTA.labels("valida").inc(validas)
+    if con_error:
+        LINEAS_INGESTA.labels("error").inc(con_error)
+    for tipo, cantidad in errores_por_tipo.items():
+        ERRORES_INGESTA.labels(tipo).inc(cantidad)
+
+
+def observar_etapas(segundos: Mapping[str, float]) -> None:
+    for etapa, seg in segundos.items():
+        if seg > 0:
+            SEGUNDOS_ETAPA.labels(etapa).inc(seg)
+
+
+def observar_trabajo(estado: str, segundos: float) -> None:
+    TRABAJOS.labels(estado).inc()
+    DURACION_TRABAJOS.observe(segundos)
+
+
+def observar_espera_cola(encolado: float | None, tarea: str = "procesar_archivo") -> None:
+    """encolado: time.time() al encolar la tarea (None si se encoló sin él)."""
+    if encolado is not None:
+        ESPERA_COLA.labels(tarea).observe(max(time.time() - encolado, 0.0))
+
+
+def actualizar_tareas_en_cola(cola: str, pendientes: int) -> None:
+    TAREAS_EN_COLA.labels(cola).set(pendientes)
+
+
+def actualizar_archivos_por_estado(conteos: Mapping[str, int]) -> None:
+    for estado, cantidad in conteos.items():
+        ARCHIVOS.labels(estado).set(cantidad)
+
+
+def iniciar_exportador_worker(puerto: int) -> None:
+    """Servidor HTTP con las métricas del worker (0 = desactivado)."""
+    if puerto <= 0:
+        return
+    if not multiproceso():
+        logger.warning(
+            "Sin PROMETHEUS_MULTIPROC_DIR solo se exportan las métricas del proceso principal del worker "
+            "(en prefork, los procesos hijos no se ven)"
+        )
+    start_http_server(puerto, registry=registro())
+    logger.info("Métricas del worker en http://0.0.0.0:%s/metrics", puerto)
+
+
+def proceso_terminado(pid: int) -> None:
+    """Al terminar un proceso en multiproceso, descarta sus gauges 'live*'."""
+    if multiproceso():
+        multiprocess.mark_process_dead(pid)
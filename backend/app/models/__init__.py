@@ -4,6 +4,8 @@ from app.models.archivo_procesado import ArchivoProcesado
 from app.models.tipo_autoconsumo import TipoAutoconsumo
 from app.models.energia_excedentaria import EnergiaExcedentaria
 from app.models.registro_errores import RegistroErrores
+from app.models.resumen_mensual_energia import ResumenMensualEnergia
+from app.models.estadisticas_archivo import EstadisticasArchivo
 
 __all__ = [
     "Usuario",
@@ -12,4 +14,6 @@ __all__ = [
     "TipoAutoconsumo",
     "EnergiaExcedentaria",
     "RegistroErrores",
+    "ResumenMensualEnergia",
+    "EstadisticasArchivo",
 ]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, CheckConstraint, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, CheckConstraint, ForeignKey, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -19,6 +19,11 @@ class ArchivoProcesado(Base):
     registros_exitosos = Column(Integer, default=0)
     registros_con_error = Column(Integer, default=0)
     ruta_archivo = Column(Text, nullable=True)
+    # Última línea cuyo lote está guardado; permite reanudar si el worker se cae.
+    # Repartido en trozos: última línea ya encolada (la tarea no se vuelve a repartir)
+    checkpoint_linea = Column(Integer, nullable=False, default=0, server_default="0")
+    # Perfil de la última ejecución: tiempo, filas e idas a la BD por etapa y pico de memoria
+    perfil = Column(JSON, nullable=True)
 
     usuario = relationship("Usuario", back_populates="archivos")
     registros_energia = relationship(
@@ -8,6 +8,7 @@ from sqlalchemy import (
     ARRAY,
     Numeric,
     CheckConstraint,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -50,4 +51,7 @@ class EnergiaExcedentaria(Base):
 
     __table_args__ = (
         CheckConstraint("fecha_hasta >= fecha_desde", name="ck_fechas_validas"),
+        # Paginación por clave de GET /energia (orden linea_archivo o fecha_desde, desempate por id)
+        Index("idx_energia_linea_id", "linea_archivo", "id"),
+        Index("idx_energia_fecha_id", "fecha_desde", "id"),
     )
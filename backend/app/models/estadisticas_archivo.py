@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, ForeignKey
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class EstadisticasArchivo(Base):
+    """
+    Registros de energía y errores guardados de cada archivo, contados al terminar
+    su procesamiento. GET /api/v1/stats suma esta tabla (una fila por archivo) en
+    lugar de contar energia_excedentaria y registro_errores enteras.
+    """
+
+    __tablename__ = "estadisticas_archivo"
+
+    archivo_id = Column(Integer, ForeignKey("archivo_procesado.id", ondelete="CASCADE"), primary_key=True)
+    registros_energia = Column(BigInteger, nullable=False, default=0)
+    errores = Column(BigInteger, nullable=False, default=0)
+    fecha_actualizacion = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
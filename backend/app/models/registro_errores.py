@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -21,3 +21,10 @@ class RegistroErrores(Base):
     fecha_registro = Column(DateTime, nullable=False, server_default=func.now())
 
     archivo = relationship("ArchivoProcesado", back_populates="errores")
+
+    __table_args__ = (
+        # Paginación por clave de GET /errores (archivo, línea, id)
+        Index("idx_error_archivo_linea_id", "archivo_id", "linea_archivo", "id"),
+        # Conteo por tipo de GET /errores/resumen solo con el índice
+        Index("idx_error_archivo_tipo", "archivo_id", "tipo_error"),
+    )
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, Date, ForeignKey, ARRAY, Numeric
+
+from app.database import Base
+
+
+class ResumenMensualEnergia(Base):
+    """
+    Sumas por periodo (P1-P6) y número de registros de energia_excedentaria por
+    cliente, mes (de fecha_desde) y tipo de autoconsumo. Lo mantiene la ingesta
+    en la misma transacción que cada lote (services/resumen_service.py).
+    """
+
+    __tablename__ = "resumen_mensual_energia"
+
+    cliente_id = Column(Integer, ForeignKey("cliente.id", ondelete="CASCADE"), primary_key=True)
+    # Primer día del mes
+    mes = Column(Date, primary_key=True)
+    tipo_autoconsumo = Column(Integer, ForeignKey("tipo_autoconsumo.codigo"), primary_key=True)
+    registros = Column(Integer, nullable=False, default=0)
+
+    energia_neta_gen = Column(ARRAY(Numeric(16, 3)), nullable=False)
+    energia_autoconsumida = Column(ARRAY(Numeric(16, 3)), nullable=False)
+    pago_tda = Column(ARRAY(Numeric(16, 2)), nullable=False)
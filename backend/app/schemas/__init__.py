@@ -1,15 +1,18 @@
-from app.schemas.archivo import ArchivoUploadResponse, ArchivoStatus
+from app.schemas.archivo import ArchivoUploadResponse, ArchivoStatus, ArchivoPerfilResponse, SimulacionResponse
 from app.schemas.energia import EnergiaExcedenteResponse, EnergiaListResponse
-from app.schemas.error import ErrorResponse
+from app.schemas.error import ErrorResponse, ErrorResumen
 from app.schemas.usuario import UsuarioCreate, UsuarioUpdate, UsuarioResponse
-from app.schemas.cliente import ClienteCreate, ClienteUpdate, ClienteResponse, ClienteWithStats
+from app.schemas.cliente import ClienteCreate, ClienteUpdate, ClienteResponse, ClienteWithStats, EnergiaMes
 
 __all__ = [
     "ArchivoUploadResponse",
     "ArchivoStatus",
+    "ArchivoPerfilResponse",
+    "SimulacionResponse",
     "EnergiaExcedenteResponse",
     "EnergiaListResponse",
     "ErrorResponse",
+    "ErrorResumen",
     "UsuarioCreate",
     "UsuarioUpdate",
     "UsuarioResponse",
@@ -17,4 +20,5 @@ __all__ = [
     "ClienteUpdate",
     "ClienteResponse",
     "ClienteWithStats",
+    "EnergiaMes",
 ]
@@ -9,6 +9,8 @@ class ArchivoUploadResponse(BaseModel):
     nombre_archivo: str
     estado: str
     mensaje: str
+    # Todos los trabajos creados (varios si se sube un .zip)
+    archivo_ids: list[int] = []
 
 
 class ArchivoStatus(BaseModel):
@@ -22,3 +24,57 @@ class ArchivoStatus(BaseModel):
     registros_con_error: int
 
     model_config = {"from_attributes": True}
+
+
+class EtapaSimulacion(BaseModel):
+    segundos: float
+    filas: int = 0
+    lineas_por_segundo: Optional[float] = None
+
+
+class InformeSimulacion(BaseModel):
+    nombre_archivo: str
+    estado: str
+    total_registros: int
+    registros_validos: int
+    registros_con_error: int
+    errores_por_tipo: dict[str, int]
+    segundos: float
+    lineas_por_segundo: Optional[float] = None
+    # lectura, validacion, cups, duplicados, escritura (no se escribe: ~0 en simulación)
+    etapas: dict[str, EtapaSimulacion]
+    # Sentencias enviadas a la BD (consultas de CUPS y duplicados)
+    consultas_bd: int = 0
+    # Pico de memoria residente del proceso (None si la plataforma no lo ofrece)
+    memoria_pico_mb: Optional[float] = None
+
+
+class SimulacionResponse(BaseModel):
+    simulacion: bool = True
+    mensaje: str
+    # Uno por archivo (varios si se sube un .zip)
+    informes: list[InformeSimulacion]
+
+
+class ArchivoPerfilResponse(BaseModel):
+    archivo_id: int
+    nombre_archivo: str
+    estado: str
+    fecha_procesamiento: Optional[datetime] = None
+    # De la última ejecución (si se reanudó, solo lo procesado tras reanudar)
+    segundos: float
+    lineas: int
+    lineas_previas: int = 0
+    lineas_por_segundo: Optional[float] = None
+    etapas: dict[str, EtapaSimulacion]
+    # Tiempo fuera de las etapas (apertura del archivo, cierre, errores finales...)
+    otros_segundos: float = 0.0
+    # Sentencias enviadas a la BD (cada COPY cuenta como una)
+    consultas_bd: int
+    memoria_pico_mb: Optional[float] = None
+    memoria_pico_inicio_mb: Optional[float] = None
+    procesos: Optional[int] = None
+    motor_validacion: Optional[str] = None
+    # Solo si se procesó por trozos en paralelo
+    trozos: Optional[int] = None
+    segundos_trozos: Optional[float] = None
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Optional
 
 
 class ClienteBase(BaseModel):
@@ -40,8 +40,26 @@ class ClienteResponse(ClienteBase):
         from_attributes = True
 
 
+class EnergiaPeriodo(BaseModel):
+    periodo: int
+    generada: float
+    autoconsumida: float
+    pago: float
+
+
 class ClienteWithStats(ClienteResponse):
     total_registros: int
     total_energia_generada: float
     total_energia_autoconsumida: float
     total_pago_tda: float
+    # Desglose P1-P6 (vacío si no hay registros)
+    periodos: List[EnergiaPeriodo] = []
+
+
+class EnergiaMes(BaseModel):
+    """Totales de un mes (por fecha_desde de los registros), del resumen mensual."""
+    mes: date
+    registros: int
+    generada: float
+    autoconsumida: float
+    pago: float
@@ -1,6 +1,6 @@
 from datetime import date
 from decimal import Decimal
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, field_validator, computed_field
 
@@ -42,5 +42,8 @@ class EnergiaExcedenteResponse(BaseModel):
 
 
 class EnergiaListResponse(BaseModel):
-    total: int
+    # Registros que cumplen los filtros (todas las páginas); None con total=ninguno y más de una página
+    total: Optional[int] = None
     registros: List[EnergiaExcedenteResponse]
+    # Cursor de la página siguiente (None en la última)
+    siguiente_cursor: Optional[str] = None
@@ -14,3 +14,9 @@ class ErrorResponse(BaseModel):
     fecha_registro: datetime
 
     model_config = {"from_attributes": True}
+
+
+class ErrorResumen(BaseModel):
+    archivo_id: int
+    tipo_error: str
+    total: int
@@ -1,15 +1,38 @@
 from app.services.procesador_service import (
+    EscritorEnergia,
+    IndiceCups,
+    RegistroEnergia,
+    SumideroErrores,
+    detectar_duplicados,
+    finalizar_trozos,
+    marcar_procesando,
+    planificar_trozos_csv,
     procesar_archivo,
+    procesar_trozo_csv,
+    simular_archivo,
+    parsear_linea,
     validar_linea,
     insertar_energia,
     registrar_error,
 )
-from app.services.archivo_service import obtener_archivo_por_hash
+from app.services.archivo_service import obtener_archivo_por_hash, ruta_por_hash
 
 __all__ = [
+    "EscritorEnergia",
+    "IndiceCups",
+    "RegistroEnergia",
+    "SumideroErrores",
+    "detectar_duplicados",
+    "finalizar_trozos",
+    "marcar_procesando",
+    "planificar_trozos_csv",
     "procesar_archivo",
+    "procesar_trozo_csv",
+    "simular_archivo",
+    "parsear_linea",
     "validar_linea",
     "insertar_energia",
     "registrar_error",
     "obtener_archivo_por_hash",
+    "ruta_por_hash",
 ]
@@ -1,3 +1,6 @@
+import os
+from pathlib import Path
+
 from sqlalchemy.orm import Session
 
 from app.models import ArchivoProcesado
@@ -8,3 +11,13 @@ def obtener_archivo_por_hash(db: Session, hash_archivo: str) -> ArchivoProcesado
     return (
         db.query(ArchivoProcesado).filter(ArchivoProcesado.hash_archivo == hash_archivo).first()
     )
+
+
+def ruta_por_hash(upload_dir: Path, hash_archivo: str, nombre_archivo: str) -> Path:
+    """
+    Ruta de almacenamiento direccionada por contenido: upload_dir/ab/cd/<hash><ext>.
+    El nombre original solo se guarda en ArchivoProcesado; la extensión se conserva
+    porque el procesador distingue XML y CSV/TXT por ella.
+    """
+    ext = os.path.splitext(nombre_archivo)[1].lower()
+    return upload_dir / hash_archivo[:2] / hash_archivo[2:4] / f"{hash_archivo}{ext}"
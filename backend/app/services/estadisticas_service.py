@@ -0,0 +1,128 @@
+"""
+Estadísticas del dashboard (GET /api/v1/stats) sin contar las tablas grandes.
+
+Al terminar cada trabajo de ingesta se guardan los registros de energía y errores
+del archivo en estadisticas_archivo (actualizar_estadisticas_archivo) y se
+invalida la caché. Los totales salen de sumar esa tabla (una fila por archivo) y
+se sirven de caché durante STATS_CACHE_SEGUNDOS: en Redis, compartida por todos
+los procesos de la API y que el worker invalida; sin Redis, en memoria del proceso.
+Con exactas=True se cuentan las tablas enteras, como antes.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ArchivoProcesado, EnergiaExcedentaria, EstadisticasArchivo, RegistroErrores
+from app.services.progreso_service import cliente_redis, marcar_redis_no_disponible
+
+logger = logging.getLogger(__name__)
+
+CLAVE_CACHE_STATS = "stats:dashboard"
+
+_lock = threading.Lock()
+# (instante en que caduca, estadísticas) de la caché en memoria
+_cache_local: tuple[float, dict[str, int]] | None = None
+
+
+def actualizar_estadisticas_archivo(db: Session, archivo_id: int) -> None:
+    """
+    Cuenta lo guardado del archivo (por índice de archivo_id) y lo deja en
+    estadisticas_archivo con commit. Es idempotente: un reintento o una
+    reanudación sustituyen la fila, no suman. Si falla, solo avisa: los
+    totales quedan sin este archivo hasta su próxima finalización.
+    """
+    try:
+        db.merge(EstadisticasArchivo(
+            archivo_id=archivo_id,
+            registros_energia=db.query(func.count(EnergiaExcedentaria.id))
+            .filter(EnergiaExcedentaria.archivo_id == archivo_id).scalar() or 0,
+            errores=db.query(func.count(RegistroErrores.id))
+            .filter(RegistroErrores.archivo_id == archivo_id).scalar() or 0,
+        ))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("No se pudieron guardar las estadísticas del archivo %s: %s", archivo_id, e)
+    invalidar_cache()
+
+
+def contar_estadisticas(db: Session) -> dict[str, int]:
+    """Totales del dashboard a partir de estadisticas_archivo (archivos en curso: al terminar)."""
+    registros_energia, errores = db.query(
+        func.coalesce(func.sum(EstadisticasArchivo.registros_energia), 0),
+        func.coalesce(func.sum(EstadisticasArchivo.errores), 0),
+    ).one()
+    return {
+        "total_archivos": db.query(func.count(ArchivoProcesado.id)).scalar() or 0,
+        "total_registros_energia": int(registros_energia),
+        "total_errores": int(errores),
+    }
+
+
+def contar_estadisticas_exactas(db: Session) -> dict[str, int]:
+    """Totales contando las tablas enteras (COUNT(*) sobre energía y errores)."""
+    return {
+        "total_archivos": db.query(func.count(ArchivoProcesado.id)).scalar() or 0,
+        "total_registros_energia": db.query(func.count(EnergiaExcedentaria.id)).scalar() or 0,
+        "total_errores": db.query(func.count(RegistroErrores.id)).scalar() or 0,
+    }
+
+
+def _leer_cache() -> dict[str, int] | None:
+    try:
+        cliente = cliente_redis()
+        if cliente is not None:
+            valor = cliente.get(CLAVE_CACHE_STATS)
+            return json.loads(valor) if valor is not None else None
+    except Exception as e:
+        logger.debug("Caché de estadísticas sin Redis: %s", e)
+        marcar_redis_no_disponible()
+    with _lock:
+        if _cache_local is not None and _cache_local[0] > time.monotonic():
+            return _cache_local[1]
+    return None
+
+
+def _guardar_cache(estadisticas: dict[str, int]) -> None:
+    global _cache_local
+    with _lock:
+        _cache_local = (time.monotonic() + settings.STATS_CACHE_SEGUNDOS, estadisticas)
+    try:
+        cliente = cliente_redis()
+        if cliente is not None:
+            cliente.set(CLAVE_CACHE_STATS, json.dumps(estadisticas), px=int(settings.STATS_CACHE_SEGUNDOS * 1000))
+    except Exception as e:
+        logger.debug("Caché de estadísticas sin Redis: %s", e)
+        marcar_redis_no_disponible()
+
+
+def invalidar_cache() -> None:
+    """Descarta las estadísticas cacheadas (en Redis y en este proceso). Nunca falla."""
+    global _cache_local
+    with _lock:
+        _cache_local = None
+    try:
+        cliente = cliente_redis()
+        if cliente is not None:
+            cliente.delete(CLAVE_CACHE_STATS)
+    except Exception as e:
+        logger.debug("Caché de estadísticas sin Redis: %s", e)
+        marcar_redis_no_disponible()
+
+
+def obtener_estadisticas(db: Session, exactas: bool = False) -> dict[str, Any]:
+    """Estadísticas del dashboard: de caché si están y no han caducado, o recién sumadas."""
+    if exactas:
+        return contar_estadisticas_exactas(db)
+    estadisticas = _leer_cache()
+    if estadisticas is None:
+        estadisticas = contar_estadisticas(db)
+        _guardar_cache(estadisticas)
+    return estadisticas
@@ -0,0 +1,107 @@
+"""
+Exportación de registros de energía en streaming (NDJSON o CSV).
+
+Las filas se leen por lotes de un cursor del servidor (yield_per: cursor con
+nombre en PostgreSQL) y cada lote se serializa y se envía antes de leer el
+siguiente, así que la memoria no depende del número de registros y el primer
+byte sale en cuanto llega el primer lote.
+"""
+
+import csv
+import io
+import json
+from typing import Any, Iterable, Iterator, Sequence
+
+from sqlalchemy import Text, cast, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import EnergiaExcedentaria
+from app.services.procesador_service import COLUMNAS_ARRAY_ORDEN, NUM_PERIODOS
+
+TIPOS_MEDIO_EXPORTACION = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+TOTALES = {"energia_neta_gen": "total_neta_gen", "energia_autoconsumida": "total_autoconsumida", "pago_tda": "total_pago"}
+
+
+def _periodos_texto(columna):
+    # El array entero como texto ('{1.500,2.000,...}'): se trocea en Python sin procesar cada elemento
+    return cast(columna, Text)
+
+
+def _total_texto(columna):
+    # Suma P1..P6 en la BD: mismo valor y escala que sum() de los Decimal en la respuesta JSON
+    return cast(sum((columna[p] for p in range(2, NUM_PERIODOS + 1)), columna[1]), Text)
+
+
+# Mismos campos que EnergiaExcedenteResponse. Los decimales llegan ya como texto (así
+# salen en JSON): convertirlos a Decimal y de vuelta a texto era la mayor parte del coste.
+COLUMNAS_EXPORTACION = (
+    EnergiaExcedentaria.id,
+    EnergiaExcedentaria.cups_cliente,
+    EnergiaExcedentaria.instalacion_gen,
+    EnergiaExcedentaria.fecha_desde,
+    EnergiaExcedentaria.fecha_hasta,
+    EnergiaExcedentaria.tipo_autoconsumo,
+    *(_periodos_texto(getattr(EnergiaExcedentaria, campo)) for campo in COLUMNAS_ARRAY_ORDEN),
+    *(_total_texto(getattr(EnergiaExcedentaria, campo)) for campo in COLUMNAS_ARRAY_ORDEN),
+)
+CABECERA_CSV = (
+    ["id", "cups_cliente", "instalacion_gen", "fecha_desde", "fecha_hasta", "tipo_autoconsumo"]
+    + [f"{campo}_{p}" for campo in COLUMNAS_ARRAY_ORDEN for p in range(1, NUM_PERIODOS + 1)]
+    + list(TOTALES.values())
+)
+
+
+def filas_energia(
+    db: Session, condiciones: Sequence[Any], orden: Sequence[Any], filas_por_lote: int | None = None
+) -> Iterator[Sequence[Any]]:
+    """Lotes de filas (COLUMNAS_EXPORTACION) que cumplen las condiciones, en el orden dado."""
+    sentencia = (
+        select(*COLUMNAS_EXPORTACION)
+        .where(*condiciones)
+        .order_by(*orden)
+        .execution_options(yield_per=filas_por_lote or settings.EXPORTACION_FILAS_LOTE)
+    )
+    yield from db.execute(sentencia).partitions()
+
+
+def _registro(fila: Sequence[Any]) -> dict[str, Any]:
+    """Fila como en la respuesta JSON de GET /energia (decimales y fechas en texto)."""
+    id_, cups, instalacion, desde, hasta, tipo, neta, autoconsumida, pago, *totales = fila
+    return {
+        "id": id_,
+        "cups_cliente": cups,
+        "instalacion_gen": instalacion,
+        "fecha_desde": desde.isoformat(),
+        "fecha_hasta": hasta.isoformat(),
+        "tipo_autoconsumo": tipo,
+        "energia_neta_gen": neta[1:-1].split(","),
+        "energia_autoconsumida": autoconsumida[1:-1].split(","),
+        "pago_tda": pago[1:-1].split(","),
+        **dict(zip(TOTALES.values(), totales)),
+    }
+
+
+def exportar_ndjson(lotes: Iterable[Sequence[Sequence[Any]]]) -> Iterator[str]:
+    """Un bloque de texto por lote: un registro JSON por línea."""
+    for lote in lotes:
+        yield "".join(json.dumps(_registro(fila), separators=(",", ":")) + "\n" for fila in lote)
+
+
+def exportar_csv(lotes: Iterable[Sequence[Sequence[Any]]]) -> Iterator[str]:
+    """Cabecera (sale en cuanto empieza la respuesta) y un bloque de texto CSV por lote."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator="\n")
+    escritor.writerow(CABECERA_CSV)
+    yield buffer.getvalue()
+    for lote in lotes:
+        buffer.seek(0)
+        buffer.truncate()
+        for fila in lote:
+            registro = _registro(fila)
+            escritor.writerow(
+                [registro[c] for c in CABECERA_CSV[:6]]
+                + [v for campo in COLUMNAS_ARRAY_ORDEN for v in registro[campo]]
+                + [registro[t] for t in TOTALES.values()]
+            )
+        yield buffer.getvalue()
@@ -0,0 +1,67 @@
+"""
+Paginación por clave (keyset) con cursor opaco y conteo exacto o estimado.
+
+La página siguiente se pide con el cursor de la anterior: filas con
+(columna de orden, id) mayor que el último de la página. El coste y la memoria
+de cada página no dependen de lo lejos que esté (no hay OFFSET).
+"""
+
+import base64
+import json
+from datetime import date
+from typing import Literal
+
+from sqlalchemy import text, tuple_
+from sqlalchemy.orm import Query, Session
+
+# exacto: COUNT(*); estimado: filas que estima el planificador de PostgreSQL; ninguno: sin total
+ModoTotal = Literal["exacto", "estimado", "ninguno"]
+
+
+def codificar_cursor(orden: str, valores: tuple) -> str:
+    """Cursor opaco con el orden y los valores de la última fila (columna de orden, id)."""
+    datos = [orden, [v.isoformat() if isinstance(v, date) else v for v in valores]]
+    return base64.urlsafe_b64encode(json.dumps(datos, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, orden: str, columnas: tuple) -> tuple:
+    """Valores del cursor, convertidos al tipo de cada columna. ValueError si no es válido para este orden."""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        orden_cursor, valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if orden_cursor != orden or len(valores) != len(columnas):
+            raise ValueError
+        return tuple(
+            date.fromisoformat(v) if columna.type.python_type is date else columna.type.python_type(v)
+            for columna, v in zip(columnas, valores)
+        )
+    except (ValueError, TypeError, json.JSONDecodeError, UnicodeDecodeError):
+        raise ValueError("Cursor inválido") from None
+
+
+def paginar(query: Query, orden: str, columnas: tuple, cursor: str | None, limite: int) -> tuple[list, str | None]:
+    """
+    Una página de query ordenada por columnas (la última, única: el id) a partir del
+    cursor. Devuelve las filas y el cursor de la página siguiente (None si es la última).
+    """
+    if cursor:
+        query = query.filter(tuple_(*columnas) > decodificar_cursor(cursor, orden, columnas))
+    # Una fila de más para saber si hay página siguiente sin contar
+    filas = query.order_by(*columnas).limit(limite + 1).all()
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    return filas, codificar_cursor(orden, tuple(getattr(ultima, c.key) for c in columnas))
+
+
+def contar(db: Session, query: Query, modo: ModoTotal) -> int | None:
+    """Total de filas de query (sin orden ni límite) según el modo; el estimado solo en PostgreSQL."""
+    if modo == "ninguno":
+        return None
+    query = query.order_by(None)
+    if modo == "estimado" and db.get_bind().dialect.name == "postgresql":
+        sentencia = query.statement.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+        plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sentencia}")).scalar()
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return query.count()
@@ -1,28 +1,152 @@
 """Procesamiento de archivos de peajes: parsing, validaciones y persistencia."""
 
+import bz2
+import csv
+import gzip
+import io
 import json
+import logging
+import multiprocessing
 import os
-from datetime import datetime
+import sys
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
-from typing import Any
+from itertools import islice
+from operator import itemgetter
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, NamedTuple
 
+from sqlalchemy import event, func, text, tuple_
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import Session
 
-from app.models import ArchivoProcesado, EnergiaExcedentaria, RegistroErrores
+from app.config import settings
+from app.models import ArchivoProcesado, Cliente, EnergiaExcedentaria, RegistroErrores
+from app import metricas
+from app.services.estadisticas_service import actualizar_estadisticas_archivo
+from app.services.progreso_service import NotificadorProgreso
+from app.services.resumen_service import restar_registros, sumar_lote
 from app.utils.validators import TIPOS_AUTOCONSUMO_VALIDOS
 
+logger = logging.getLogger(__name__)
+
+# Líneas por lote: se resuelven sus CUPS con una sola consulta y se escriben en bloque
+TAMANO_LOTE = settings.PROCESAMIENTO_TAMANO_LOTE
+# Máximo de valores por cláusula IN (...) al consultar clientes
+MAX_CUPS_POR_CONSULTA = 1000
+# Registros duplicados entre trozos que se restan del resumen y se borran por sentencia (IN de ids)
+LOTE_DUPLICADOS_ENTRE_TROZOS = 5000
+# Campos de 6 periodos, en el orden de RegistroEnergia
+COLUMNAS_ARRAY_ORDEN = ("energia_neta_gen", "energia_autoconsumida", "pago_tda")
+# Archivos comprimidos: se detectan por sus magic bytes, no por la extensión
+MAGIC_COMPRESION = {"gzip": b"\x1f\x8b", "bz2": b"BZh", "zip": b"PK\x03\x04"}
+# Clase de los advisory locks de PostgreSQL con que un trabajo se reserva su archivo
+CLASE_BLOQUEO_ARCHIVO = 7301
+# Clave en Session.info del MedidorEtapas del trabajo que usa la sesión (cuenta las idas a la BD)
+CLAVE_MEDIDOR = "medidor_etapas"
+
 
 def validar_cups_existe(cups: str, db: Session) -> bool:
     """
     Verifica si CUPS existe en la tabla de clientes.
     """
-    from app.models import Cliente
     return db.query(Cliente).filter(Cliente.cups == cups).first() is not None
 
 
-def validar_linea(
-    row: dict[str, Any], num_linea: int, db: Session
-) -> list[tuple[str, str]]:
+class IndiceCups:
+    """
+    Índice CUPS -> cliente_id de un trabajo de procesamiento.
+    Se carga por lotes de CUPS no vistos con una única consulta IN (...)
+    (precargar). Los CUPS inexistentes
+    también se recuerdan, para no volver a consultarlos.
+    Con etapas, el tiempo de las consultas y los CUPS consultados van a la etapa "cups".
+    """
+
+    def __init__(self, db: Session, etapas: "MedidorEtapas | None" = None):
+        self.db = db
+        self.etapas = etapas
+        self._ids: dict[str, int | None] = {}
+
+    def _medir(self, filas: int):
+        if self.etapas is None:
+            return nullcontext()
+        self.etapas.contar("cups", filas)
+        return self.etapas.medir("cups")
+
+    def precargar(self, cups_lote: Iterable[str]) -> None:
+        """Resuelve de una vez los CUPS del lote que aún no están en el índice."""
+        pendientes = sorted({c for c in cups_lote if c and c not in self._ids})
+        if pendientes:
+            with self._medir(len(pendientes)):
+                self._consultar(pendientes)
+
+    def _consultar(self, pendientes: list[str]) -> None:
+        for i in range(0, len(pendientes), MAX_CUPS_POR_CONSULTA):
+            trozo = pendientes[i:i + MAX_CUPS_POR_CONSULTA]
+            encontrados: dict[str, int] = {}
+            filas = (
+                self.db.query(Cliente.cups, Cliente.id)
+                .filter(Cliente.cups.in_(trozo))
+                .order_by(Cliente.id)
+            )
+            for cups, cliente_id in filas:
+                encontrados.setdefault(cups, cliente_id)
+            for cups in trozo:
+                self._ids[cups] = encontrados.get(cups)
+
+    def cliente_id(self, cups: str) -> int | None:
+        """Devuelve el id del cliente con ese CUPS, o None si no existe."""
+        if cups not in self._ids:
+            self.precargar([cups])
+        return self._ids.get(cups)
+
+    def existe(self, cups: str) -> bool:
+        return self.cliente_id(cups) is not None
+
+
+def _lotes(iterable: Iterable, tamano: int):
+    """Agrupa un iterable en listas de como mucho `tamano` elementos."""
+    it = iter(iterable)
+    while True:
+        lote = list(islice(it, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def _error_cliente_inexistente(cups: str) -> tuple[str, str]:
+    return ("cliente_inexistente", f"CUPS {cups} no encontrado en la base de datos de clientes")
+
+
+class RegistroEnergia(NamedTuple):
+    """
+    Línea validada y ya convertida a tipos (fechas, entero y 3 x 6 Decimal).
+    La producen parsear_linea y la usan la deduplicación y la escritura sin
+    volver a convertir los textos.
+    """
+
+    cups_cliente: str
+    instalacion_gen: str
+    fecha_desde: date
+    fecha_hasta: date
+    tipo_autoconsumo: int
+    energia_neta_gen: tuple[Decimal, ...]
+    energia_autoconsumida: tuple[Decimal, ...]
+    pago_tda: tuple[Decimal, ...]
+
+
+def parsear_linea(
+    row: dict[str, Any],
+    num_linea: int,
+    db: Session,
+    indice_cups: IndiceCups | None = None,
+    comprobar_cliente: bool = True,
+) -> tuple[RegistroEnergia | None, list[tuple[str, str]]]:
     """
     Valida una línea del archivo siguiendo las 7 reglas:
     1. CUPS formato "ES" + longitud >= 10
@@ -32,6 +156,11 @@ def validar_linea(
     5. Conversión numérica correcta
     6. CUPS existe en sistema
     7. Registro único (simulado por ahora si no hay hash por registro)
+    Si se pasa indice_cups, la regla 6 se resuelve contra el índice del trabajo
+    en lugar de consultar la BD. Con comprobar_cliente=False la regla 6 se omite
+    (validación sin BD, p. ej. en procesos del pool).
+    Cada valor se convierte una sola vez: devuelve (registro, errores), con el
+    RegistroEnergia ya convertido si no hay errores y None si los hay.
     """
     errores: list[tuple[str, str]] = []
 
@@ -43,12 +172,13 @@ def validar_linea(
         )
     
     # 6. CUPS existe en sistema
-    elif not validar_cups_existe(cups, db):
-        errores.append(
-            ("cliente_inexistente", f"CUPS {cups} no encontrado en la base de datos de clientes")
-        )
+    elif comprobar_cliente and not (
+        indice_cups.existe(cups) if indice_cups is not None else validar_cups_existe(cups, db)
+    ):
+        errores.append(_error_cliente_inexistente(cups))
 
     # 2. Tipo autoconsumo
+    tipo = None
     try:
         tipo_str = row.get("tipo_autoconsumo")
         if tipo_str is None or tipo_str == "":
@@ -84,74 +214,198 @@ def validar_linea(
         )
 
     # 4. Arrays con 6 períodos exactos y 5. Conversión numérica (valores)
-    for campo in ["energia_neta_gen", "energia_autoconsumida", "pago_tda"]:
-        valores_validos = 0
+    periodos: list[tuple[Decimal, ...]] = []
+    for campo in COLUMNAS_ARRAY_ORDEN:
+        valores: list[Decimal] = []
         for i in range(1, 7):
             key = f"{campo}_{i}"
             val = row.get(key)
             if val is not None and str(val).strip() != "":
                 try:
-                    Decimal(str(val).strip())
-                    valores_validos += 1
+                    valores.append(Decimal(str(val).strip()))
                 except (InvalidOperation, TypeError):
                     errores.append(
                         ("formato_numerico_invalido", f"Valor numérico inválido en {key}: {val}")
                     )
                     break
         
-        if valores_validos != 6:
+        if len(valores) != 6:
             errores.append(
                 (
                     "periodos_insuficientes",
-                    f"El campo {campo} debe tener exactamente 6 periodos (P1-P6). Encontrados: {valores_validos}",
+                    f"El campo {campo} debe tener exactamente 6 periodos (P1-P6). Encontrados: {len(valores)}",
                 )
             )
+        periodos.append(tuple(valores))
 
-    return errores
+    if errores:
+        return None, errores
+    registro = RegistroEnergia(
+        cups, (row.get("instalacion_gen") or "").strip(), fecha_desde, fecha_hasta, tipo, *periodos
+    )
+    return registro, errores
+
+
+def validar_linea(
+    row: dict[str, Any],
+    num_linea: int,
+    db: Session,
+    indice_cups: IndiceCups | None = None,
+    comprobar_cliente: bool = True,
+) -> list[tuple[str, str]]:
+    """Valida una línea con las 7 reglas (ver parsear_linea) y devuelve solo los errores."""
+    return parsear_linea(row, num_linea, db, indice_cups, comprobar_cliente)[1]
+
+
+def _valores_energia(
+    archivo_id: int, linea: int, registro: RegistroEnergia, cliente_id: int
+) -> dict[str, Any]:
+    """Valores de columna de energia_excedentaria para una línea ya convertida."""
+    return {
+        "archivo_id": archivo_id,
+        "cliente_id": cliente_id,
+        "linea_archivo": linea,
+        "instalacion_gen": registro.instalacion_gen,
+        "fecha_desde": registro.fecha_desde,
+        "fecha_hasta": registro.fecha_hasta,
+        "tipo_autoconsumo": registro.tipo_autoconsumo,
+        "cups_cliente": registro.cups_cliente,
+        "energia_neta_gen": list(registro.energia_neta_gen),
+        "energia_autoconsumida": list(registro.energia_autoconsumida),
+        "pago_tda": list(registro.pago_tda),
+    }
+
+
+def _cliente_id_de(db: Session, cups: str, indice_cups: IndiceCups | None) -> int:
+    """Obtiene el ID del cliente basado en el CUPS (del índice del trabajo si lo hay)."""
+    if indice_cups is not None:
+        cliente_id = indice_cups.cliente_id(cups)
+    else:
+        cliente = db.query(Cliente).filter(Cliente.cups == cups).first()
+        cliente_id = cliente.id if cliente else None
+    if cliente_id is None:
+        raise ValueError(f"CUPS {cups} no encontrado en la base de datos de clientes")
+    return cliente_id
 
 
 def insertar_energia(
-    db: Session, archivo_id: int, linea: int, row: dict[str, Any]
+    db: Session,
+    archivo_id: int,
+    linea: int,
+    row: dict[str, Any] | RegistroEnergia,
+    indice_cups: IndiceCups | None = None,
 ) -> None:
-    """Inserta un registro de energía validado."""
-    from app.models import Cliente
-    
-    # Obtener el ID del cliente basado en el CUPS
-    cliente = db.query(Cliente).filter(Cliente.cups == row["cups_cliente"].strip()).first()
-    
-    energia_neta = [
-        Decimal(str(row.get(f"energia_neta_gen_{i}", 0)).strip())
-        for i in range(1, 7)
-    ]
-    energia_auto = [
-        Decimal(str(row.get(f"energia_autoconsumida_{i}", 0)).strip())
-        for i in range(1, 7)
-    ]
-    pago = [
-        Decimal(str(row.get(f"pago_tda_{i}", 0)).strip()) for i in range(1, 7)
-    ]
-
-    registro = EnergiaExcedentaria(
-        archivo_id=archivo_id,
-        cliente_id=cliente.id,
-        cups_cliente=cliente.cups,
-        linea_archivo=linea,
-        instalacion_gen=(row.get("instalacion_gen") or "").strip(),
-        fecha_desde=datetime.strptime(
-            (row.get("fecha_desde_1") or "").strip(), "%Y-%m-%d"
-        ).date(),
-        fecha_hasta=datetime.strptime(
-            (row.get("fecha_hasta_1") or "").strip(), "%Y-%m-%d"
-        ).date(),
-        tipo_autoconsumo=int(row["tipo_autoconsumo"]),
-        energia_neta_gen=energia_neta,
-        energia_autoconsumida=energia_auto,
-        pago_tda=pago,
-    )
-    db.add(registro)
+    """Inserta un registro de energía validado (RegistroEnergia, o la fila en texto a convertir)."""
+    registro = row
+    if not isinstance(registro, RegistroEnergia):
+        registro, errores = parsear_linea(row, linea, db, comprobar_cliente=False)
+        if errores:
+            raise ValueError(errores[0][1])
+    cliente_id = _cliente_id_de(db, registro.cups_cliente, indice_cups)
+    valores = _valores_energia(archivo_id, linea, registro, cliente_id)
+    db.add(EnergiaExcedentaria(**valores))
+    sumar_lote(db, [valores])
     db.commit()
 
 
+# Columnas que escribe la carga en bloque (fecha_creacion la pone la BD)
+COLUMNAS_ENERGIA = (
+    "archivo_id", "cliente_id", "linea_archivo", "instalacion_gen", "fecha_desde", "fecha_hasta",
+    "tipo_autoconsumo", "cups_cliente", "energia_neta_gen", "energia_autoconsumida", "pago_tda",
+)
+COLUMNAS_ARRAY = frozenset(COLUMNAS_ARRAY_ORDEN)
+# Columnas de texto NOT NULL que pueden venir vacías (p. ej. instalacion_gen en
+# AutoconsumoColectivo): en COPY csv un campo vacío sin comillas sería NULL
+COLUMNAS_TEXTO_NO_NULAS = ("instalacion_gen", "cups_cliente")
+
+
+class EscritorEnergia:
+    """
+    Acumula las líneas validadas de un trabajo y las escribe en bloque en
+    energia_excedentaria: COPY (psycopg2 copy_expert) en PostgreSQL y
+    executemany en cualquier otro motor. No hace commit: lo hace quien
+    procesa, al cerrar cada lote. Lo escrito se suma al resumen mensual en la
+    misma transacción.
+    Si el bloque falla, se reintenta línea a línea (cada una en su SAVEPOINT)
+    para saber qué líneas concretas fallan y poder registrarlas como error.
+    Con simular=True (validación sin escritura) convierte las líneas pero no las escribe.
+    """
+
+    def __init__(self, db: Session, archivo_id: int, simular: bool = False):
+        self.db = db
+        self.archivo_id = archivo_id
+        self.simular = simular
+        self._pendientes: list[tuple[int, dict[str, Any] | None, dict[str, Any]]] = []
+        bind = db.get_bind()
+        self._usar_copy = bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+
+    def __len__(self) -> int:
+        return len(self._pendientes)
+
+    def agregar(
+        self, linea: int, registro: RegistroEnergia, cliente_id: int, row: dict[str, Any] | None = None
+    ) -> None:
+        """Deja la línea ya convertida pendiente de escritura (row: datos originales para el error, si falla)."""
+        self._pendientes.append((linea, row, _valores_energia(self.archivo_id, linea, registro, cliente_id)))
+
+    def flush(self) -> tuple[int, list[tuple[int, dict[str, Any] | None, str]]]:
+        """
+        Escribe las líneas pendientes.
+        Devuelve (nº de líneas escritas, [(linea, row, mensaje de error), ...]).
+        """
+        pendientes, self._pendientes = self._pendientes, []
+        if not pendientes or self.simular:
+            return len(pendientes), []
+        try:
+            with self.db.begin_nested():
+                if self._usar_copy:
+                    self._copy(v for _, _, v in pendientes)
+                else:
+                    self.db.execute(EnergiaExcedentaria.__table__.insert(), [v for _, _, v in pendientes])
+        except Exception:
+            pass
+        else:
+            sumar_lote(self.db, (v for _, _, v in pendientes))
+            return len(pendientes), []
+
+        # El bloque ha fallado: línea a línea para aislar las que fallan
+        fallos: list[tuple[int, dict[str, Any] | None, str]] = []
+        escritos: list[dict[str, Any]] = []
+        for linea, row, valores in pendientes:
+            try:
+                with self.db.begin_nested():
+                    self.db.execute(EnergiaExcedentaria.__table__.insert(), [valores])
+                escritos.append(valores)
+            except Exception as e:
+                fallos.append((linea, row, str(e)))
+        sumar_lote(self.db, escritos)
+        return len(escritos), fallos
+
+    def _copy(self, filas: Iterable[dict[str, Any]]) -> None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for valores in filas:
+            writer.writerow([
+                "{" + ",".join(str(x) for x in valores[c]) + "}" if c in COLUMNAS_ARRAY else valores[c]
+                for c in COLUMNAS_ENERGIA
+            ])
+        buffer.seek(0)
+        conexion = self.db.connection()
+        # COPY va por el cursor de psycopg2, sin pasar por los eventos de SQLAlchemy
+        medidor = self.db.info.get(CLAVE_MEDIDOR)
+        if medidor is not None:
+            medidor.consultas += 1
+        cursor = conexion.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {EnergiaExcedentaria.__tablename__} ({', '.join(COLUMNAS_ENERGIA)}) "
+                f"FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(COLUMNAS_TEXTO_NO_NULAS)}))",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+
 # Tipos que la BD acepta (migración 001). Si no está la 002, solo estos 7 están permitidos.
 # Cualquier otro tipo se guarda como "formato_invalido"; la descripción sigue siendo la real.
 TIPOS_ERROR_BD_PERMITIDOS = frozenset({
@@ -160,6 +414,19 @@ TIPOS_ERROR_BD_PERMITIDOS = frozenset({
 })
 
 
+def _valores_error(
+    archivo_id: int, linea: int, tipo: str, desc: str, datos: str | None = None
+) -> dict[str, Any]:
+    """Valores de columna de un RegistroErrores, con el tipo ya adaptado a los que acepta la BD."""
+    return {
+        "archivo_id": archivo_id,
+        "linea_archivo": linea,
+        "tipo_error": tipo if tipo in TIPOS_ERROR_BD_PERMITIDOS else "formato_invalido",
+        "descripcion": desc[:5000] if desc else "",  # límite razonable
+        "datos_linea": datos,
+    }
+
+
 def registrar_error(
     db: Session,
     archivo_id: int,
@@ -169,14 +436,7 @@ def registrar_error(
     datos: str | None = None,
 ) -> None:
     """Registra un error en la BD (queda listado en Archivos y errores)."""
-    tipo_ok = tipo if tipo in TIPOS_ERROR_BD_PERMITIDOS else "formato_invalido"
-    error = RegistroErrores(
-        archivo_id=archivo_id,
-        linea_archivo=linea,
-        tipo_error=tipo_ok,
-        descripcion=desc[:5000] if desc else "",  # límite razonable
-        datos_linea=datos,
-    )
+    error = RegistroErrores(**_valores_error(archivo_id, linea, tipo, desc, datos))
     try:
         db.add(error)
         db.commit()
@@ -185,6 +445,42 @@ def registrar_error(
         raise
 
 
+class SumideroErrores:
+    """
+    Acumula los errores de línea de un trabajo y los inserta en bloque
+    (un único executemany) al cerrar cada lote y al terminar el trabajo.
+    Aplica el mismo mapeo a TIPOS_ERROR_BD_PERMITIDOS que registrar_error.
+    No hace commit: lo hace quien procesa, junto con el resto del lote.
+    Cuenta los errores por tipo (sin mapear); con simular=True solo los cuenta.
+    """
+
+    def __init__(self, db: Session, archivo_id: int, simular: bool = False):
+        self.db = db
+        self.archivo_id = archivo_id
+        self.simular = simular
+        self.por_tipo: Counter[str] = Counter()
+        self._pendientes: list[dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._pendientes)
+
+    def agregar(self, linea: int, tipo: str, desc: str, datos: str | None = None) -> None:
+        self.por_tipo[tipo] += 1
+        self._pendientes.append(_valores_error(self.archivo_id, linea, tipo, desc, datos))
+
+    def flush(self) -> int:
+        """Inserta los errores pendientes. Devuelve cuántos se han insertado."""
+        pendientes, self._pendientes = self._pendientes, []
+        if not pendientes or self.simular:
+            return len(pendientes)
+        try:
+            self.db.execute(RegistroErrores.__table__.insert(), pendientes)
+        except Exception:
+            self.db.rollback()
+            raise
+        return len(pendientes)
+
+
 # Estructura XML esperada (para validación)
 XML_ROOT_TAG = "energiaExcedentaria"
 XML_REGISTRO_TAG = "registro"
@@ -268,23 +564,72 @@ def validar_estructura_xml_registro(reg) -> list[tuple[str, str]]:
     return errores
 
 
-def _procesar_xml_autoconsumo_colectivo(db: Session, archivo_id: int, root, ruta_archivo_abs: str) -> None:
+def _texto(elem) -> str:
+    return (elem.text or "").strip() if elem is not None else ""
+
+
+def _fila_desde_registro_xml(reg) -> dict[str, str]:
+    """Construye la fila (mismas claves que el CSV) desde un <registro> con estructura ya validada."""
+    row = {
+        "cups_cliente": _texto(_find_child(reg, "cupsCliente")),
+        "instalacion_gen": _texto(_find_child(reg, "instalacionGen")),
+        "fecha_desde_1": _texto(_find_child(reg, "fechaDesde")),
+        "fecha_hasta_1": _texto(_find_child(reg, "fechaHasta")),
+        "tipo_autoconsumo": _texto(_find_child(reg, "tipoAutoconsumo")),
+    }
+    for campo_xml, campo_csv in [("energiaNetaGen", "energia_neta_gen"), ("energiaAutoconsumida", "energia_autoconsumida"), ("pagoTDA", "pago_tda")]:
+        elem = _find_child(reg, campo_xml)
+        valores, _ = _obtener_valores_periodo(elem)
+        for i in range(1, NUM_PERIODOS + 1):
+            row[f"{campo_csv}_{i}"] = valores[i - 1] if i <= len(valores) else ""
+    return row
+
+
+def _abrir_xml_streaming(fxml: BinaryIO) -> tuple[ET.Element, Iterator[ET.Element]]:
+    """
+    Lee un XML en modo streaming (iterparse): devuelve la raíz en cuanto se abre
+    y un iterador que entrega cada <registro> hijo directo de la raíz al cerrarse.
+    Los hijos ya entregados se sueltan de la raíz, así que la memoria no depende
+    del tamaño del archivo. Lo que haya tras el cierre de la raíz se ignora.
+    """
+    eventos = ET.iterparse(fxml, events=("start", "end"))
+    _, root = next(eventos)
+
+    def _registros() -> Iterator[ET.Element]:
+        profundidad = 1
+        for evento, elem in eventos:
+            if evento == "start":
+                profundidad += 1
+                continue
+            profundidad -= 1
+            if profundidad == 0:
+                return
+            if profundidad == 1:
+                if _tag_sin_namespace(elem.tag) == XML_REGISTRO_TAG:
+                    yield elem
+                root.clear()
+
+    return root, _registros()
+
+
+def _procesar_xml_autoconsumo_colectivo(ctx: "_ContextoTrabajo", root) -> None:
     """
     Procesa XML con raíz <AutoconsumoColectivo>: Cabecera (CUPS, TipoAutoconsumo, PeriodoFacturacion) + Registros (6 valores por bloque).
     Cada grupo de 6 <Registro> forma un registro de energía (EnergiaNetaGenerada, EnergiaAutoconsumida, PagoTDA).
     """
     cabecera = _find_child(root, "Cabecera")
     registros_cont = _find_child(root, "Registros")
-    if not cabecera or not registros_cont:
-        registrar_error(db, archivo_id, 1, "estructura_invalida", "AutoconsumoColectivo debe tener Cabecera y Registros")
+    # Un elemento sin hijos es falso: se comprueba con "is None"
+    if cabecera is None or registros_cont is None:
+        ctx.registrar_error(1, "estructura_invalida", "AutoconsumoColectivo debe tener Cabecera y Registros")
         return
     cups_e = _find_child(cabecera, "CUPS")
     tipo_e = _find_child(cabecera, "TipoAutoconsumo")
     periodo = _find_child(cabecera, "PeriodoFacturacion")
-    fecha_desde_e = _find_child(periodo, "FechaDesde") if periodo else None
-    fecha_hasta_e = _find_child(periodo, "FechaHasta") if periodo else None
-    if not all([cups_e, tipo_e, fecha_desde_e, fecha_hasta_e]):
-        registrar_error(db, archivo_id, 1, "estructura_invalida", "Cabecera debe tener CUPS, TipoAutoconsumo y PeriodoFacturacion (FechaDesde, FechaHasta)")
+    fecha_desde_e = _find_child(periodo, "FechaDesde") if periodo is not None else None
+    fecha_hasta_e = _find_child(periodo, "FechaHasta") if periodo is not None else None
+    if any(e is None for e in (cups_e, tipo_e, fecha_desde_e, fecha_hasta_e)):
+        ctx.registrar_error(1, "estructura_invalida", "Cabecera debe tener CUPS, TipoAutoconsumo y PeriodoFacturacion (FechaDesde, FechaHasta)")
         return
     cups = (cups_e.text or "").strip()
     tipo = (tipo_e.text or "").strip()
@@ -292,7 +637,7 @@ def _procesar_xml_autoconsumo_colectivo(db: Session, archivo_id: int, root, ruta
     fecha_hasta = (fecha_hasta_e.text or "").strip()
     registros = [e for e in registros_cont if _tag_sin_namespace(e.tag) == "Registro"]
     if len(registros) < NUM_PERIODOS:
-        registrar_error(db, archivo_id, 2, "estructura_invalida", f"AutoconsumoColectivo debe tener al menos {NUM_PERIODOS} Registro. Encontrados: {len(registros)}")
+        ctx.registrar_error(2, "estructura_invalida", f"AutoconsumoColectivo debe tener al menos {NUM_PERIODOS} Registro. Encontrados: {len(registros)}")
         return
     row = {
         "cups_cliente": cups,
@@ -309,251 +654,1201 @@ def _procesar_xml_autoconsumo_colectivo(db: Session, archivo_id: int, root, ruta
         row["energia_autoconsumida_" + str(i + 1)] = _txt(_find_child(reg, "EnergiaAutoconsumida"))
         row["pago_tda_" + str(i + 1)] = _txt(_find_child(reg, "PagoTDA"))
     row = {k: (v.strip() if isinstance(v, str) else str(v)) for k, v in row.items()}
-    errores = validar_linea(row, 2, db)
+    ctx.total += 1
+    registro, errores = parsear_linea(row, 2, ctx.db, ctx.indice_cups)
     if errores:
         for t, d in errores:
-            registrar_error(db, archivo_id, 2, t, d, json.dumps(row))
+            ctx.sumidero.agregar(2, t, d, json.dumps(row))
+        ctx.con_error += 1
+    else:
+        try:
+            ctx.escritor.agregar(2, registro, _cliente_id_de(ctx.db, registro.cups_cliente, ctx.indice_cups), row)
+        except Exception as e:
+            ctx.sumidero.agregar(2, "inconsistencia", str(e), json.dumps(row))
+            ctx.con_error += 1
+    ctx.cerrar_lote(2)
+
+
+def _clave_registro(registro: RegistroEnergia, con_instalacion: bool) -> tuple:
+    """Clave de unicidad de una línea: (cups, fecha_desde, fecha_hasta[, instalacion_gen])."""
+    if con_instalacion:
+        return (registro.cups_cliente, registro.fecha_desde, registro.fecha_hasta, registro.instalacion_gen)
+    return (registro.cups_cliente, registro.fecha_desde, registro.fecha_hasta)
+
+
+def detectar_duplicados(
+    db: Session,
+    claves: Iterable[tuple],
+    con_instalacion: bool,
+    excluir_archivo_id: int | None = None,
+) -> set[tuple]:
+    """
+    Devuelve qué claves (ver _clave_registro) ya existen en energia_excedentaria,
+    con una sola consulta para todo el lote. Con excluir_archivo_id no se tienen
+    en cuenta los registros de ese archivo.
+    """
+    claves = list(set(claves))
+    if not claves:
+        return set()
+    columnas = [
+        EnergiaExcedentaria.cups_cliente,
+        EnergiaExcedentaria.fecha_desde,
+        EnergiaExcedentaria.fecha_hasta,
+    ]
+    if con_instalacion:
+        columnas.append(EnergiaExcedentaria.instalacion_gen)
+    existentes = db.query(*columnas).filter(tuple_(*columnas).in_(claves))
+    if excluir_archivo_id is not None:
+        existentes = existentes.filter(EnergiaExcedentaria.archivo_id != excluir_archivo_id)
+    return {tuple(fila) for fila in existentes.distinct()}
+
+
+def _memoria_pico_mb() -> float | None:
+    """Pico de memoria residente del proceso (MB), o None si la plataforma no lo ofrece."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: kilobytes en Linux, bytes en macOS
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _por_segundo(lineas: int, segundos: float) -> float | None:
+    return round(lineas / segundos, 1) if segundos > 0 else None
+
+
+# Etapas del procesamiento cuyo tiempo se mide: lectura (leer, descomprimir y separar
+# líneas o <registro>), validacion (reglas y conversión sin BD), cups (consultas de
+# clientes y regla 6), duplicados (regla 7) y escritura (energía, errores y commit)
+ETAPAS_PROCESAMIENTO = ("lectura", "validacion", "cups", "duplicados", "escritura")
+
+
+class MedidorEtapas:
+    """
+    Tiempo, filas e idas a la BD de un trabajo por etapa (ver ETAPAS_PROCESAMIENTO).
+    Las etapas se pueden anidar: el tiempo de la interior no cuenta en la exterior.
+    """
+
+    def __init__(self):
+        self.segundos = dict.fromkeys(ETAPAS_PROCESAMIENTO, 0.0)
+        self.filas = dict.fromkeys(ETAPAS_PROCESAMIENTO, 0)
+        # Sentencias enviadas a la BD (ver vincular)
+        self.consultas = 0
+        self._pila: list[str] = []
+        self._desde = 0.0
+        # Conexión de la transacción en curso de la sesión vinculada (la que se escucha)
+        self._conexion: Connection | None = None
+
+    @contextmanager
+    def medir(self, etapa: str) -> Iterator[None]:
+        ahora = time.perf_counter()
+        if self._pila:
+            self.segundos[self._pila[-1]] += ahora - self._desde
+        self._pila.append(etapa)
+        self._desde = ahora
+        try:
+            yield
+        finally:
+            ahora = time.perf_counter()
+            self.segundos[self._pila.pop()] += ahora - self._desde
+            self._desde = ahora
+
+    def medir_iter(self, etapa: str, iterable: Iterable) -> Iterator:
+        """Entrega los elementos de iterable sumando a la etapa el tiempo de obtener cada uno."""
+        it = iter(iterable)
+        while True:
+            with self.medir(etapa):
+                try:
+                    elemento = next(it)
+                except StopIteration:
+                    return
+            yield elemento
+
+    def contar(self, etapa: str, filas: int) -> None:
+        self.filas[etapa] += filas
+
+    def exportar(self) -> dict[str, Any]:
+        """Medidas en un dict serializable (p. ej. resultado de una subtarea Celery)."""
+        return {"segundos": dict(self.segundos), "filas": dict(self.filas), "consultas": self.consultas}
+
+    def acumular(self, medidas: dict[str, Any]) -> None:
+        """Suma las medidas de exportar() de otro medidor (p. ej. de cada trozo)."""
+        for etapa, segundos in medidas.get("segundos", {}).items():
+            self.segundos[etapa] = self.segundos.get(etapa, 0.0) + segundos
+        for etapa, filas in medidas.get("filas", {}).items():
+            self.filas[etapa] = self.filas.get(etapa, 0) + filas
+        self.consultas += medidas.get("consultas", 0)
+
+    def vincular(self, db: Session) -> None:
+        """
+        Cuenta en consultas las sentencias que la sesión envíe a la BD hasta
+        desvincular. Solo se escucha la conexión de cada transacción de la sesión;
+        el resto de sesiones y motores del proceso no pasan por el medidor.
+        """
+        if isinstance(db, Session):
+            db.info[CLAVE_MEDIDOR] = self
+            event.listen(db, "after_begin", self._al_empezar)
+            if db.in_transaction():
+                self._escuchar(db.connection())
+
+    def desvincular(self, db: Session) -> None:
+        if isinstance(db, Session):
+            event.remove(db, "after_begin", self._al_empezar)
+            db.info.pop(CLAVE_MEDIDOR, None)
+            self._escuchar(None)
+
+    def _al_empezar(self, session, transaccion, conexion) -> None:
+        self._escuchar(conexion)
+
+    def _escuchar(self, conexion: Connection | None) -> None:
+        """Pasa a contar las sentencias de conexion (None: de ninguna) y deja la anterior."""
+        if self._conexion is not None and event.contains(self._conexion, "before_cursor_execute", self._contar_consulta):
+            event.remove(self._conexion, "before_cursor_execute", self._contar_consulta)
+        self._conexion = conexion
+        if conexion is not None:
+            event.listen(conexion, "before_cursor_execute", self._contar_consulta)
+
+    def _contar_consulta(self, conexion, cursor, sentencia, parametros, contexto, executemany) -> None:
+        self.consultas += 1
+
+    def resumen(self, lineas: int) -> dict[str, dict[str, Any]]:
+        """Por etapa: segundos, filas y líneas por segundo (de las `lineas` del trabajo)."""
+        return {
+            etapa: {
+                "segundos": round(segundos, 3),
+                "filas": self.filas[etapa],
+                "lineas_por_segundo": _por_segundo(lineas, segundos),
+            }
+            for etapa, segundos in self.segundos.items()
+        }
+
+
+def _perfil(etapas: MedidorEtapas, lineas: int, segundos: float, **extra: Any) -> dict[str, Any]:
+    """
+    Perfil de una ejecución: tiempo total, líneas procesadas y por segundo, detalle
+    por etapa, tiempo fuera de las etapas, sentencias enviadas a la BD y pico de
+    memoria residente del proceso (en un worker, el mayor desde que arrancó).
+    """
+    return {
+        "segundos": round(segundos, 3),
+        "lineas": lineas,
+        "lineas_por_segundo": _por_segundo(lineas, segundos),
+        "etapas": etapas.resumen(lineas),
+        "otros_segundos": round(max(segundos - sum(etapas.segundos.values()), 0.0), 3),
+        "consultas_bd": etapas.consultas,
+        "memoria_pico_mb": _memoria_pico_mb(),
+        **extra,
+    }
+
+
+def _guardar_perfil(db: Session, archivo: ArchivoProcesado, perfil: dict[str, Any]) -> None:
+    """Guarda el perfil en archivo_procesado; si falla, el procesamiento no se da por fallido."""
+    try:
+        archivo.perfil = perfil
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("No se pudo guardar el perfil del archivo %s: %s", archivo.id, e)
+
+
+class _ContextoTrabajo:
+    """Estado de un trabajo de procesamiento: índice de CUPS, escritor, sumidero y contadores."""
+
+    def __init__(
+        self,
+        db: Session,
+        archivo_id: int,
+        por_trozos: bool = False,
+        archivo: ArchivoProcesado | None = None,
+        progreso: NotificadorProgreso | None = None,
+        simulacion: bool = False,
+    ):
+        self.db = db
+        self.archivo_id = archivo_id
+        # Procesando un trozo: los duplicados entre trozos del archivo se resuelven al finalizar
+        self.por_trozos = por_trozos
+        # Con archivo, cada commit de lote guarda también el checkpoint y los contadores
+        self.archivo = archivo
+        self.progreso = progreso
+        # Simulación (validación sin escritura): mismo recorrido, sin escribir energía ni errores
+        self.simulacion = simulacion
+        # Claves ya "escritas" en la simulación, para los duplicados entre lotes del archivo
+        self.claves_simuladas: set[tuple] = set()
+        self.etapas = MedidorEtapas()
+        # Índice CUPS -> cliente_id del trabajo: lo comparten validación e inserción
+        self.indice_cups = IndiceCups(db, self.etapas)
+        self.escritor = EscritorEnergia(db, archivo_id, simular=simulacion)
+        self.sumidero = SumideroErrores(db, archivo_id, simular=simulacion)
+        self.total = 0
+        self.exitosos = 0
+        self.con_error = 0
+        # Registros (filas o <registro>) ya guardados por una ejecución anterior
+        self.guardados = 0
+        if archivo is not None and archivo.checkpoint_linea:
+            self.guardados = archivo.checkpoint_linea - 1
+            self.total = archivo.total_registros or 0
+            self.exitosos = archivo.registros_exitosos or 0
+            self.con_error = archivo.registros_con_error or 0
+        if progreso is not None:
+            progreso.lineas_previas = self.total
+        # Contadores ya sumados a las métricas (lo guardado antes de reanudar no se vuelve a sumar)
+        self._metricas_observadas = (self.exitosos, self.con_error, Counter())
+
+    def cerrar_lote(self, ultima_linea: int) -> None:
+        """
+        Escribe en bloque las líneas pendientes del lote y los errores acumulados
+        (incluidas las líneas que no se pudieron escribir) y hace un único commit.
+        El checkpoint (ultima_linea) y los contadores van en la misma transacción.
+        """
+        with self.etapas.medir("escritura"):
+            escritos, fallos = self.escritor.flush()
+            for linea, row, mensaje in fallos:
+                self.sumidero.agregar(linea, "inconsistencia", mensaje, json.dumps(row) if row is not None else None)
+            self.etapas.contar("escritura", escritos - len(fallos) + self.sumidero.flush())
+            self.exitosos += escritos
+            self.con_error += len(fallos)
+            if self.archivo is not None:
+                self.archivo.checkpoint_linea = ultima_linea
+                self.archivo.total_registros = self.total
+                self.archivo.registros_exitosos = self.exitosos
+                self.archivo.registros_con_error = self.con_error
+            self.db.commit()
+        if not self.simulacion:
+            self._observar_metricas()
+        self.publicar_progreso()
+
+    def _observar_metricas(self) -> None:
+        """Suma a las métricas de ingesta lo guardado desde el lote anterior."""
+        exitosos, con_error, por_tipo = self._metricas_observadas
+        metricas.observar_lote(
+            self.exitosos - exitosos, self.con_error - con_error, self.sumidero.por_tipo - por_tipo
+        )
+        self._metricas_observadas = (self.exitosos, self.con_error, self.sumidero.por_tipo.copy())
+
+    def publicar_progreso(self, estado: str = "procesando", forzar: bool = False) -> None:
+        """Publica el progreso del trabajo (limitado a un evento por intervalo salvo forzar)."""
+        if self.progreso is not None:
+            self.progreso.publicar(self.total, self.exitosos, self.con_error, estado, forzar)
+
+    def registrar_error(self, linea: int, tipo: str, desc: str, datos: str | None = None) -> None:
+        """Error del archivo (no de una línea del lote): registrar_error, o solo contarlo en simulación."""
+        if self.simulacion:
+            self.sumidero.agregar(linea, tipo, desc, datos)
+        else:
+            registrar_error(self.db, self.archivo_id, linea, tipo, desc, datos)
+            metricas.observar_lote(0, 0, {tipo: 1})
+
+
+def _escribir_candidatos(
+    ctx: _ContextoTrabajo,
+    candidatos: list[tuple[int, dict[str, Any], RegistroEnergia]],
+    con_instalacion: bool,
+    mensaje_duplicado: str,
+) -> None:
+    """
+    Regla 7 (registro único) para las líneas válidas de un lote y paso al escritor.
+    Un registro es duplicado si ya está en la BD o si se repite dentro del archivo.
+    """
+    claves = [_clave_registro(registro, con_instalacion) for _, _, registro in candidatos]
+    ctx.etapas.contar("duplicados", len(claves))
+    with ctx.etapas.medir("duplicados"):
+        existentes = detectar_duplicados(
+            ctx.db, claves, con_instalacion, ctx.archivo_id if ctx.por_trozos else None
+        )
+    if ctx.simulacion:
+        # Lo que habrían escrito los lotes anteriores no está en la BD
+        existentes.update(c for c in claves if c in ctx.claves_simuladas)
+    for (num_linea, row, registro), clave in zip(candidatos, claves):
+        if clave in existentes:
+            ctx.sumidero.agregar(num_linea, "registro_duplicado", mensaje_duplicado, json.dumps(row))
+            ctx.con_error += 1
+            continue
+        try:
+            cliente_id = _cliente_id_de(ctx.db, registro.cups_cliente, ctx.indice_cups)
+            ctx.escritor.agregar(num_linea, registro, cliente_id, row)
+            # Las siguientes apariciones en el archivo son duplicados
+            existentes.add(clave)
+        except Exception as e:
+            ctx.sumidero.agregar(num_linea, "inconsistencia", str(e), json.dumps(row))
+            ctx.con_error += 1
+    if ctx.simulacion:
+        ctx.claves_simuladas.update(existentes)
+
+
+def _procesar_lote_xml(ctx: _ContextoTrabajo, lote: list[tuple[int, ET.Element]]) -> None:
+    """Valida, deduplica y escribe un lote de <registro>."""
+    candidatos = []
+    ctx.etapas.contar("lectura", len(lote))
+    ctx.etapas.contar("validacion", len(lote))
+    with ctx.etapas.medir("validacion"):
+        # Resolver de una vez los CUPS del lote (una consulta IN por lote)
+        ctx.indice_cups.precargar(_texto(_find_child(reg, "cupsCliente")) for _, reg in lote)
+        for num_linea, reg in lote:
+            ctx.total += 1
+            # 1) Validar estructura del registro (campos obligatorios y 6 hora por bloque)
+            errores_estructura = validar_estructura_xml_registro(reg)
+            if errores_estructura:
+                for t, d in errores_estructura:
+                    ctx.sumidero.agregar(num_linea, t, d, None)
+                ctx.con_error += 1
+                continue
+
+            # 2) Construir row desde la estructura validada (acepta <hora> o <p1>..<p6>)
+            row = _fila_desde_registro_xml(reg)
+            registro, errores = parsear_linea(row, num_linea, ctx.db, ctx.indice_cups)
+            if errores:
+                for t, d in errores:
+                    ctx.sumidero.agregar(num_linea, t, d, json.dumps(row))
+                ctx.con_error += 1
+            else:
+                candidatos.append((num_linea, row, registro))
+    # 3) Duplicados del lote con una sola consulta y escritura
+    _escribir_candidatos(ctx, candidatos, con_instalacion=True, mensaje_duplicado="Ya existe este periodo para este CUPS")
+    ctx.cerrar_lote(lote[-1][0])
+    for _, reg in lote:
+        reg.clear()
+
+
+# Alias de columnas CSV/TXT -> nombre canónico
+CSV_ALIAS_COLUMNAS = {
+    "cups": "cups_cliente", "CUPS": "cups_cliente", "cupsCliente": "cups_cliente",
+    "tipo": "tipo_autoconsumo", "tipoAutoconsumo": "tipo_autoconsumo",
+    "fecha_desde": "fecha_desde_1", "fechaDesde": "fecha_desde_1",
+    "fecha_hasta": "fecha_hasta_1", "fechaHasta": "fecha_hasta_1",
+    "instalacion": "instalacion_gen", "instalacionGen": "instalacion_gen",
+}
+CSV_ALIAS_PERIODOS = (("p", "energia_neta_gen_"), ("gen_p", "energia_neta_gen_"), ("cons_p", "energia_autoconsumida_"))
+# Campos canónicos de una línea CSV/TXT: los únicos que se extraen de cada fila
+CSV_CAMPOS = ("cups_cliente", "instalacion_gen", "tipo_autoconsumo", "fecha_desde_1", "fecha_hasta_1") + tuple(
+    f"{campo}_{i}" for campo in COLUMNAS_ARRAY_ORDEN for i in range(1, NUM_PERIODOS + 1)
+)
+CSV_PARAMETROS_DIALECTO = ("delimiter", "quotechar", "escapechar", "doublequote", "skipinitialspace", "quoting")
+
+# Campos canónicos de la fila CSV, su RegistroEnergia (None si hay errores) y sus errores
+FilaValidada = tuple[dict[str, Any], RegistroEnergia | None, list[tuple[str, str]]]
+
+
+class _ColumnasCsv:
+    """
+    Cabecera CSV/TXT resuelta una vez por archivo: para cada campo canónico, las
+    posiciones de las columnas que lo aportan (la canónica y después sus alias).
+    fila() pasa una línea de csv.reader al dict de los campos canónicos, tomando
+    el primer valor no vacío entre la columna canónica y sus alias.
+    """
+
+    def __init__(self, fieldnames: list[str]):
+        posiciones = {}
+        for i, nombre in enumerate(fieldnames):
+            if nombre:
+                posiciones[nombre.strip()] = i
+        candidatos = {campo: [campo] for campo in CSV_CAMPOS}
+        for alias, campo in CSV_ALIAS_COLUMNAS.items():
+            candidatos[campo].append(alias)
+        for pref_alias, pref_campo in CSV_ALIAS_PERIODOS:
+            for i in range(1, NUM_PERIODOS + 1):
+                candidatos[f"{pref_campo}{i}"].append(f"{pref_alias}{i}")
+        # (campo, posiciones, la primera es un alias): sin columna posible, el campo no se extrae
+        self._campos = []
+        for campo, nombres in candidatos.items():
+            presentes = [n for n in nombres if n in posiciones]
+            if presentes:
+                self._campos.append((campo, [posiciones[n] for n in presentes], presentes[0] != campo))
+        self.ancho = len(fieldnames)
+        # Caso habitual: cada campo sale de una sola columna y basta un itemgetter por línea
+        self._directo = len(self._campos) > 1 and all(len(p) == 1 for _, p, _ in self._campos)
+        self._nombres = tuple(campo for campo, _, _ in self._campos)
+        self._extraer = itemgetter(*(p[0] for _, p, _ in self._campos)) if self._directo else None
+
+    def fila(self, valores: list[str]) -> dict[str, Any]:
+        if self._directo and len(valores) >= self.ancho:
+            return dict(zip(self._nombres, self._extraer(valores)))
+        # Línea corta (faltan columnas) o campos con alias: columna a columna
+        n = len(valores)
+        row = {}
+        for campo, posiciones, es_alias in self._campos:
+            valor = valores[posiciones[0]] if posiciones[0] < n else None
+            if es_alias:
+                valor = valor or ""
+            for p in posiciones[1:]:
+                if valor and valor.strip():
+                    break
+                valor = (valores[p] if p < n else None) or ""
+            row[campo] = valor
+        return row
+
+
+def _detectar_dialecto(sample: str) -> dict[str, Any]:
+    """
+    Detecta el formato CSV/TXT (delimitador, comillas) a partir de una muestra.
+    Devuelve los parámetros para csv.reader como dict (se puede enviar a otros procesos).
+    """
+    dialect = None
+    if sample:
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;|")
+        except csv.Error:
+            pass
+    if dialect is None:
+        first_line = sample.split("\n")[0] if sample else ""
+        for delim in "|", ",", ";":
+            if first_line.count(delim) >= 4:
+                return {
+                    "delimiter": delim,
+                    "quotechar": '"',
+                    "escapechar": None,
+                    "doublequote": True,
+                    "skipinitialspace": True,
+                    "quoting": csv.QUOTE_MINIMAL,
+                }
+    if dialect is None:
+        dialect = csv.excel
+    return {p: getattr(dialect, p) for p in CSV_PARAMETROS_DIALECTO}
+
+
+def _abrir_csv(f: Any) -> tuple[Iterator[list[str]], list[str] | None, dict[str, Any]]:
+    """
+    csv.reader sobre el archivo de texto abierto, con el dialecto detectado en su
+    inicio. Devuelve (filas, cabecera, dialecto); las filas no incluyen la cabecera
+    ni las líneas vacías (como csv.DictReader).
+    """
+    sample = f.read(2048)
+    f.seek(0)
+    dialecto = _detectar_dialecto(sample)
+    reader = csv.reader(f, **dialecto)
+    fieldnames = next(reader, None)
+    return filter(None, reader), fieldnames, dialecto
+
+
+def _columnas_csv_validas(fieldnames: list[str] | None) -> bool:
+    """Validar estructura CSV: debe tener columnas que permitan cups, fechas, tipo."""
+    fieldnames = [fn.strip() for fn in (fieldnames or []) if fn]
+    posibles_cups = {"cups", "cups_cliente", "CUPS", "cupsCliente"}
+    posibles_fecha_desde = {"fecha_desde", "fecha_desde_1", "fechaDesde"}
+    posibles_fecha_hasta = {"fecha_hasta", "fecha_hasta_1", "fechaHasta"}
+    tiene_cups = any(c in fieldnames for c in posibles_cups)
+    tiene_fechas = any(f in fieldnames for f in posibles_fecha_desde) and any(f in fieldnames for f in posibles_fecha_hasta)
+    tiene_tipo = any(t in fieldnames for t in ("tipo", "tipo_autoconsumo", "tipoAutoconsumo"))
+    return bool(fieldnames) and tiene_cups and tiene_fechas and tiene_tipo
+
+
+def _motor_validacion(motor: str | None) -> str:
+    """Motor de validación CSV/TXT del trabajo (por defecto PROCESAMIENTO_MOTOR_VALIDACION)."""
+    motor = motor or settings.PROCESAMIENTO_MOTOR_VALIDACION
+    if motor == "numpy":
+        from app.services.validacion_vectorial_service import NUMPY_DISPONIBLE
+
+        if NUMPY_DISPONIBLE:
+            return motor
+        logger.warning("Motor de validación numpy sin NumPy (numpy>=2) instalado: se valida fila a fila")
+    return "python"
+
+
+def _validar_filas_csv(
+    filas: Iterable[list[str]],
+    fieldnames: list[str],
+    motor: str = "python",
+    etapas: MedidorEtapas | None = None,
+) -> Iterator[FilaValidada]:
+    """
+    Extrae los campos canónicos de cada fila (cabecera resuelta una sola vez) y los
+    valida y convierte con las reglas que no necesitan BD (todas menos la 6).
+    Entrega (row, registro, errores); la regla 6 la completa _comprobar_cliente en el lote.
+    Con motor="numpy" las reglas se aplican por lotes de filas con NumPy (mismo resultado).
+    Con etapas, el tiempo de validar cada lote va a la etapa "validacion".
+    """
+    columnas = _ColumnasCsv(fieldnames)
+    if motor == "numpy":
+        from app.services.validacion_vectorial_service import validar_filas_vectorial
+
+        validar = validar_filas_vectorial
+    else:
+        def validar(lote):
+            return [parsear_linea(row, 0, None, comprobar_cliente=False) for row in lote]
+
+    for lote in _lotes(map(columnas.fila, filas), TAMANO_LOTE):
+        with etapas.medir("validacion") if etapas is not None else nullcontext():
+            resultados = validar(lote)
+        if etapas is not None:
+            etapas.contar("validacion", len(lote))
+        for row, (registro, errores) in zip(lote, resultados):
+            yield row, registro, errores
+
+
+def _comprobar_cliente(row: dict[str, Any], errores: list[tuple[str, str]], indice_cups: IndiceCups) -> None:
+    """Regla 6 diferida: añade cliente_inexistente donde lo habría puesto parsear_linea (primera posición)."""
+    if errores and errores[0][0] == "formato_cups_invalido":
+        return
+    cups = (row.get("cups_cliente") or "").strip()
+    if not indice_cups.existe(cups):
+        errores.insert(0, _error_cliente_inexistente(cups))
+
+
+def _procesar_lote_csv(
+    ctx: _ContextoTrabajo,
+    lote: list[tuple[int, FilaValidada]],
+) -> None:
+    """Completa la validación de un lote de filas CSV con la BD, deduplica y escribe."""
+    candidatos = []
+    ctx.etapas.contar("lectura", len(lote))
+    with ctx.etapas.medir("cups"):
+        # Resolver de una vez los CUPS del lote (una consulta IN por lote)
+        ctx.indice_cups.precargar((row.get("cups_cliente") or "").strip() for _, (row, _, _) in lote)
+        for num_linea, (row, registro, errores) in lote:
+            ctx.total += 1
+            _comprobar_cliente(row, errores, ctx.indice_cups)
+            if errores:
+                for t, d in errores:
+                    ctx.sumidero.agregar(num_linea, t, d, json.dumps(row))
+                ctx.con_error += 1
+            else:
+                candidatos.append((num_linea, row, registro))
+    _escribir_candidatos(ctx, candidatos, con_instalacion=False, mensaje_duplicado="Ya existe")
+    ctx.cerrar_lote(lote[-1][0])
+
+
+def _trocear_csv(ruta_archivo_abs: str, inicio_datos: int, tamano_trozo: int) -> list[tuple[int, int]]:
+    """Divide el archivo desde inicio_datos en rangos de bytes [inicio, fin) alineados a fin de línea."""
+    tamano = os.path.getsize(ruta_archivo_abs)
+    rangos = []
+    with open(ruta_archivo_abs, "rb") as f:
+        inicio = inicio_datos
+        while inicio < tamano:
+            f.seek(min(inicio + tamano_trozo, tamano))
+            f.readline()
+            fin = f.tell()
+            rangos.append((inicio, fin))
+            inicio = fin
+    return rangos
+
+
+def _leer_trozo_csv(ruta_archivo_abs: str, inicio: int, fin: int, dialecto: dict[str, Any]) -> Iterator[list[str]]:
+    """Filas (sin las vacías) del rango de bytes [inicio, fin); la cabecera ya está leída."""
+    with open(ruta_archivo_abs, "rb") as f:
+        f.seek(inicio)
+        texto = f.read(fin - inicio).decode("utf-8")
+    return filter(None, csv.reader(io.StringIO(texto, newline=""), **dialecto))
+
+
+def _validar_trozo_csv(
+    ruta_archivo_abs: str, inicio: int, fin: int, fieldnames: list[str], dialecto: dict[str, Any], motor: str
+) -> list[FilaValidada]:
+    """Tarea de un proceso del pool: valida las filas del rango de bytes [inicio, fin)."""
+    return list(_validar_filas_csv(_leer_trozo_csv(ruta_archivo_abs, inicio, fin, dialecto), fieldnames, motor))
+
+
+def _validar_csv_en_paralelo(
+    ruta_archivo_abs: str, fieldnames: list[str], dialecto: dict[str, Any], procesos: int, motor: str = "python"
+) -> Iterator[FilaValidada]:
+    """
+    Valida un CSV/TXT grande en un ProcessPoolExecutor, por trozos de bytes
+    alineados a línea (PROCESAMIENTO_BYTES_TROZO), con la cabecera y el dialecto
+    ya detectados. Entrega las filas en el orden del archivo, así que quien las
+    consume (un único escritor) numera las líneas igual que en secuencial.
+    Supone que ningún campo entre comillas contiene saltos de línea.
+    """
+    with open(ruta_archivo_abs, "rb") as f:
+        f.readline()
+        inicio_datos = f.tell()
+    rangos = iter(_trocear_csv(ruta_archivo_abs, inicio_datos, settings.PROCESAMIENTO_BYTES_TROZO))
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Como mucho dos trozos en vuelo por proceso, para acotar la memoria
+        en_vuelo = deque(
+            pool.submit(_validar_trozo_csv, ruta_archivo_abs, inicio, fin, fieldnames, dialecto, motor)
+            for inicio, fin in islice(rangos, procesos * 2)
+        )
+        while en_vuelo:
+            filas = en_vuelo.popleft().result()
+            siguiente = next(rangos, None)
+            if siguiente is not None:
+                en_vuelo.append(
+                    pool.submit(_validar_trozo_csv, ruta_archivo_abs, *siguiente, fieldnames, dialecto, motor)
+                )
+            yield from filas
+
+
+def _resolver_ruta(ruta_archivo: str) -> str:
+    """Ruta absoluta del archivo en disco."""
+    # CORRECCIÓN PARA WINDOWS: Si la ruta viene de Docker (/app/uploads), 
+    # la traducimos a la carpeta local de uploads.
+    if ruta_archivo.startswith("/app/uploads/"):
+        relativa = os.path.relpath(ruta_archivo, "/app/uploads")
+        ruta_archivo = os.path.join(os.getcwd(), "uploads", relativa)
+    return os.path.abspath(ruta_archivo)
+
+
+def detectar_compresion(cabecera: bytes) -> str | None:
+    """Formato de compresión según los magic bytes del inicio del archivo: 'gzip', 'bz2', 'zip' o None."""
+    for formato, magic in MAGIC_COMPRESION.items():
+        if cabecera.startswith(magic):
+            return formato
+    return None
+
+
+@contextmanager
+def _abrir_datos(ruta_archivo_abs: str) -> Iterator[tuple[BinaryIO, BinaryIO]]:
+    """
+    Abre el archivo en binario y, si está comprimido (gzip, bz2 o zip de un solo
+    archivo), lo descomprime al vuelo sin escribirlo expandido a disco.
+    Entrega (datos, crudo): crudo es el archivo en disco, para medir el progreso en bytes.
+    """
+    with open(ruta_archivo_abs, "rb") as crudo:
+        compresion = detectar_compresion(crudo.read(4))
+        crudo.seek(0)
+        if compresion == "gzip":
+            datos = gzip.GzipFile(fileobj=crudo, mode="rb")
+        elif compresion == "bz2":
+            datos = bz2.BZ2File(crudo)
+        elif compresion == "zip":
+            zf = zipfile.ZipFile(crudo)
+            miembros = [m for m in zf.infolist() if not m.is_dir()]
+            if len(miembros) != 1:
+                raise ValueError(
+                    f"ZIP con {len(miembros)} archivos: súbalo por /upload para crear un trabajo por archivo"
+                )
+            datos = zf.open(miembros[0])
+        else:
+            datos = crudo
+        try:
+            yield datos, crudo
+        finally:
+            if datos is not crudo:
+                datos.close()
+
+
+def _es_xml(ruta_archivo_abs: str) -> bool:
+    """Archivos .xml, y los demás (salvo .csv) cuyo contenido es XML (p. ej. exportados como .txt o comprimidos)."""
+    ext = os.path.splitext(ruta_archivo_abs)[1].lower()
+    if ext == ".xml":
+        return True
+    if ext != ".csv":
+        with _abrir_datos(ruta_archivo_abs) as (datos, _):
+            peek = datos.read(512).decode("utf-8-sig", errors="replace")
+        return peek.strip().startswith("<?xml") or (peek.strip().startswith("<") and "<" in peek and ">" in peek)
+    return False
+
+
+def _es_comprimido(ruta_archivo_abs: str) -> bool:
+    with open(ruta_archivo_abs, "rb") as f:
+        return detectar_compresion(f.read(4)) is not None
+
+
+@contextmanager
+def reservar_archivo(db: Session, archivo_id: int) -> Iterator[bool]:
+    """
+    Reserva el archivo para un solo trabajo mientras dura el bloque: advisory lock
+    de PostgreSQL en una conexión propia (no la de la sesión, que vuelve al pool en
+    cada commit). Si el worker muere, la conexión se cierra y la reserva se libera.
+    Entrega False si otro trabajo ya lo tiene (p. ej. Celery ha vuelto a entregar la
+    tarea porque venció visibility_timeout); en otros motores, siempre True.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        yield True
         return
+    with bind.connect() as conexion:
+        argumentos = {"clase": CLASE_BLOQUEO_ARCHIVO, "archivo_id": archivo_id}
+        reservado = conexion.execute(text("SELECT pg_try_advisory_lock(:clase, :archivo_id)"), argumentos).scalar()
+        try:
+            yield bool(reservado)
+        finally:
+            if reservado:
+                conexion.execute(text("SELECT pg_advisory_unlock(:clase, :archivo_id)"), argumentos)
+
+
+def marcar_procesando(db: Session, archivo_id: int) -> ArchivoProcesado | None:
+    """
+    Pasa el archivo a estado 'procesando' y anota la fecha de inicio. Si ya estaba
+    'procesando' con checkpoint (el worker anterior se cayó), se conserva para reanudar.
+    """
+    archivo = db.query(ArchivoProcesado).filter(ArchivoProcesado.id == archivo_id).first()
+    if not archivo:
+        return None
+    if archivo.estado != "procesando" or not archivo.checkpoint_linea:
+        archivo.checkpoint_linea = 0
+        archivo.fecha_procesamiento = datetime.utcnow()
+    archivo.estado = "procesando"
+    db.commit()
+    return archivo
+
+
+def repartir_en_trozos(db: Session, archivo_id: int, plan: dict[str, Any], despachar: Callable[[], None]) -> str:
+    """
+    Reparte un archivo en trozos (plan de planificar_trozos_csv) una sola vez:
+    con la reserva del archivo (reservar_archivo), lo marca como 'procesando',
+    llama a despachar (que encola los trozos y la finalización) y anota en
+    checkpoint_linea la última línea repartida. Una entrega duplicada de la tarea
+    no vuelve a repartirlo si otro trabajo tiene la reserva, si el archivo ya
+    terminó o si sus trozos ya están encolados. Devuelve el estado resultante:
+    'procesando' (repartido ahora), 'en_curso', 'completado', 'error' o 'no_encontrado'.
+    """
+    with reservar_archivo(db, archivo_id) as reservado:
+        if not reservado:
+            logger.warning("El archivo %s ya lo está repartiendo otro trabajo; se ignora esta entrega", archivo_id)
+            return "en_curso"
+        archivo = db.query(ArchivoProcesado).filter(ArchivoProcesado.id == archivo_id).first()
+        if not archivo:
+            return "no_encontrado"
+        if archivo.estado in ("completado", "error"):
+            return archivo.estado
+        if archivo.estado == "procesando" and archivo.checkpoint_linea:
+            logger.warning("Los trozos del archivo %s ya están encolados; se ignora esta entrega", archivo_id)
+            return "en_curso"
+        archivo = marcar_procesando(db, archivo_id)
+        despachar()
+        # Si el worker cae antes de este commit, una nueva entrega vuelve a repartir
+        archivo.checkpoint_linea = plan["trozos"][-1][3]
+        db.commit()
+        return "procesando"
+
+
+def planificar_trozos_csv(ruta_archivo: str, umbral_bytes: int, tamano_trozo: int) -> dict[str, Any] | None:
+    """
+    Plan para procesar un CSV/TXT grande en varias tareas: ruta, cabecera, dialecto
+    y trozos [inicio, fin, primera_linea, ultima_linea] alineados a línea. Las
+    líneas se numeran igual que en el procesamiento secuencial (las vacías no cuentan).
+    Devuelve None si el archivo debe procesarse entero: no existe, es XML o está
+    comprimido, no supera umbral_bytes, cabecera ilegible o no válida (el error lo
+    registra procesar_archivo) o cabe en un solo trozo.
+    """
+    ruta_archivo_abs = _resolver_ruta(ruta_archivo)
+    if not os.path.exists(ruta_archivo_abs) or os.path.getsize(ruta_archivo_abs) <= umbral_bytes:
+        return None
+    # Los trozos son rangos de bytes del archivo en disco: no aplica a comprimidos
+    if _es_comprimido(ruta_archivo_abs) or _es_xml(ruta_archivo_abs):
+        return None
     try:
-        insertar_energia(db, archivo_id, 2, row)
+        with open(ruta_archivo_abs, "r", encoding="utf-8-sig", newline="") as f:
+            _, fieldnames, dialecto = _abrir_csv(f)
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return None
+    if not _columnas_csv_validas(fieldnames):
+        return None
+
+    with open(ruta_archivo_abs, "rb") as f:
+        f.readline()
+        rangos = _trocear_csv(ruta_archivo_abs, f.tell(), tamano_trozo)
+        if len(rangos) < 2:
+            return None
+        trozos = []
+        linea = 2
+        for inicio, fin in rangos:
+            f.seek(inicio)
+            filas = sum(1 for l in f.read(fin - inicio).split(b"\n") if l not in (b"", b"\r"))
+            trozos.append([inicio, fin, linea, linea + filas - 1])
+            linea += filas
+    return {"ruta": ruta_archivo_abs, "fieldnames": fieldnames, "dialecto": dialecto, "trozos": trozos}
+
+
+def procesar_trozo_csv(
+    db: Session,
+    archivo_id: int,
+    ruta_archivo_abs: str,
+    fieldnames: list[str],
+    dialecto: dict[str, Any],
+    inicio: int,
+    fin: int,
+    primera_linea: int,
+    ultima_linea: int,
+    motor_validacion: str | None = None,
+) -> dict[str, Any]:
+    """
+    Procesa un trozo de un plan de planificar_trozos_csv. Los duplicados con otros
+    trozos del mismo archivo los resuelve finalizar_trozos. Devuelve los contadores
+    del trozo y el error de lectura, si lo hubo (no se propaga: el resto de trozos
+    y la finalización siguen adelante).
+    Es idempotente: si la subtarea se reintenta tras caerse el worker, primero se
+    borra lo que guardó del trozo la ejecución anterior.
+    """
+    ctx = _ContextoTrabajo(db, archivo_id, por_trozos=True)
+    error = None
+    inicio_trozo = time.perf_counter()
+    ctx.etapas.vincular(db)
+    try:
+        restar_registros(
+            db,
+            EnergiaExcedentaria.archivo_id == archivo_id,
+            EnergiaExcedentaria.linea_archivo.between(primera_linea, ultima_linea),
+        )
+        for modelo in (EnergiaExcedentaria, RegistroErrores):
+            db.query(modelo).filter(
+                modelo.archivo_id == archivo_id,
+                modelo.linea_archivo.between(primera_linea, ultima_linea),
+            ).delete(synchronize_session=False)
+        db.commit()
+        filas = _validar_filas_csv(
+            _leer_trozo_csv(ruta_archivo_abs, inicio, fin, dialecto),
+            fieldnames,
+            _motor_validacion(motor_validacion),
+            ctx.etapas,
+        )
+        lotes = _lotes(enumerate(filas, start=primera_linea), TAMANO_LOTE)
+        for lote in ctx.etapas.medir_iter("lectura", lotes):
+            _procesar_lote_csv(ctx, lote)
     except Exception as e:
-        registrar_error(db, archivo_id, 2, "inconsistencia", str(e), json.dumps(row))
+        db.rollback()
+        error = str(e)
+        try:
+            registrar_error(db, archivo_id, 0, "error_lectura", error)
+        except Exception as e_registro:
+            # Sin BD no se puede registrar: el error vuelve igualmente en el resultado
+            logger.warning("No se pudo registrar el error del trozo %s-%s: %s", primera_linea, ultima_linea, e_registro)
+    finally:
+        ctx.etapas.desvincular(db)
+    metricas.observar_etapas(ctx.etapas.segundos)
+    return {
+        "total": ctx.total,
+        "exitosos": ctx.exitosos,
+        "con_error": ctx.con_error,
+        "error": error,
+        "segundos": time.perf_counter() - inicio_trozo,
+        "etapas": ctx.etapas.exportar(),
+        "memoria_pico_mb": _memoria_pico_mb(),
+    }
 
 
-def procesar_archivo(db: Session, archivo_id: int, ruta_archivo: str) -> None:
+def _datos_lineas_csv(ruta_archivo_abs: str, lineas: set[int]) -> dict[int, str]:
     """
-    Procesa archivo de peajes (CSV o XML) línea por línea.
-    Usa primer valor de fechas, valida arrays de 6, tipos {12,41,42,43,51}, CUPS.
+    datos_linea (la fila en JSON, como la guarda el procesamiento secuencial) de
+    las líneas pedidas del CSV, numeradas igual que en él. Se lee hasta la última.
+    """
+    datos: dict[int, str] = {}
+    ultima = max(lineas)
+    with _abrir_datos(ruta_archivo_abs) as (f_datos, _), \
+            io.TextIOWrapper(f_datos, encoding="utf-8-sig", newline="") as f:
+        filas, fieldnames, _ = _abrir_csv(f)
+        columnas = _ColumnasCsv(fieldnames or [])
+        for num_linea, fila in enumerate(filas, start=2):
+            if num_linea in lineas:
+                datos[num_linea] = json.dumps(columnas.fila(fila))
+            if num_linea >= ultima:
+                break
+    return datos
+
+
+def _resolver_duplicados_entre_trozos(db: Session, archivo_id: int, ruta_archivo: str | None) -> int:
     """
+    Regla 7 entre trozos: de cada (cups, fecha_desde, fecha_hasta) repetido en el
+    archivo se conserva la primera línea y las demás pasan a registro_duplicado,
+    con la fila releída del archivo como datos_linea (igual que sin trozos).
+    Devuelve cuántas líneas se han descartado.
+    """
+    orden = func.row_number().over(
+        partition_by=(
+            EnergiaExcedentaria.cups_cliente,
+            EnergiaExcedentaria.fecha_desde,
+            EnergiaExcedentaria.fecha_hasta,
+        ),
+        order_by=EnergiaExcedentaria.linea_archivo,
+    ).label("orden")
+    filas = (
+        db.query(EnergiaExcedentaria.id, EnergiaExcedentaria.linea_archivo, orden)
+        .filter(EnergiaExcedentaria.archivo_id == archivo_id)
+        .subquery()
+    )
+    repetidos = db.query(filas.c.id, filas.c.linea_archivo).filter(filas.c.orden > 1).all()
+    datos: dict[int, str] = {}
+    try:
+        if repetidos and ruta_archivo:
+            datos = _datos_lineas_csv(_resolver_ruta(ruta_archivo), {linea for _, linea in repetidos})
+    except OSError as e:
+        logger.warning("No se pudieron releer las líneas duplicadas del archivo %s: %s", archivo_id, e)
+    sumidero = SumideroErrores(db, archivo_id)
+    for lote in _lotes(repetidos, LOTE_DUPLICADOS_ENTRE_TROZOS):
+        ids = [id_ for id_, _ in lote]
+        restar_registros(db, EnergiaExcedentaria.id.in_(ids))
+        db.query(EnergiaExcedentaria).filter(EnergiaExcedentaria.id.in_(ids)).delete(synchronize_session=False)
+        for _, linea in lote:
+            sumidero.agregar(linea, "registro_duplicado", "Ya existe", datos.get(linea))
+    sumidero.flush()
+    db.commit()
+    return len(repetidos)
+
+
+def _perfil_trozos(archivo: ArchivoProcesado, resultados: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Perfil de un archivo procesado por trozos: las etapas suman las de todos los
+    trozos (en paralelo, pueden superar el tiempo total, que es el transcurrido
+    desde que empezó) y la memoria es el mayor pico de los workers.
+    """
+    etapas = MedidorEtapas()
+    for resultado in resultados:
+        etapas.acumular(resultado.get("etapas") or {})
+    segundos_trozos = sum(r.get("segundos", 0.0) for r in resultados)
+    segundos = segundos_trozos
+    if archivo.fecha_procesamiento is not None:
+        segundos = (datetime.utcnow() - archivo.fecha_procesamiento).total_seconds()
+    perfil = _perfil(
+        etapas,
+        sum(r["total"] for r in resultados),
+        segundos,
+        trozos=len(resultados),
+        segundos_trozos=round(segundos_trozos, 3),
+    )
+    picos = [r["memoria_pico_mb"] for r in resultados if r.get("memoria_pico_mb") is not None]
+    perfil["memoria_pico_mb"] = max(picos) if picos else None
+    return perfil
+
+
+def finalizar_trozos(db: Session, archivo_id: int, resultados: list[dict[str, Any]]) -> None:
+    """Cierra un archivo procesado por trozos: duplicados entre trozos, contadores y estado final."""
     archivo = db.query(ArchivoProcesado).filter(ArchivoProcesado.id == archivo_id).first()
     if not archivo:
         return
+    try:
+        duplicados = _resolver_duplicados_entre_trozos(db, archivo_id, archivo.ruta_archivo)
+        archivo.estado = "error" if any(r["error"] for r in resultados) else "completado"
+        archivo.total_registros = sum(r["total"] for r in resultados)
+        archivo.registros_exitosos = sum(r["exitosos"] for r in resultados) - duplicados
+        archivo.registros_con_error = sum(r["con_error"] for r in resultados) + duplicados
+        archivo.perfil = _perfil_trozos(archivo, resultados)
+        db.commit()
+        # Cada trozo ya sumó sus líneas y etapas; aquí solo los duplicados entre trozos
+        metricas.observar_lote(0, 0, {"registro_duplicado": duplicados} if duplicados else {})
+    except Exception as e:
+        db.rollback()
+        archivo.estado = "error"
+        registrar_error(db, archivo_id, 0, "error_global", str(e))
+        db.commit()
+    actualizar_estadisticas_archivo(db, archivo_id)
+    metricas.observar_trabajo(archivo.estado, (archivo.perfil or {}).get("segundos", 0.0))
+    NotificadorProgreso(archivo_id).publicar(
+        archivo.total_registros or 0,
+        archivo.registros_exitosos or 0,
+        archivo.registros_con_error or 0,
+        archivo.estado,
+        forzar=True,
+    )
 
-    archivo.estado = "procesando"
-    archivo.fecha_procesamiento = datetime.utcnow()
-    db.commit()
 
-    exitosos = 0
-    con_error = 0
-    total = 0
+def procesar_archivo(
+    db: Session,
+    archivo_id: int,
+    ruta_archivo: str,
+    procesos: int | None = None,
+    motor_validacion: str | None = None,
+) -> dict[str, Any]:
+    """
+    Procesa archivo de peajes (CSV o XML) línea por línea.
+    Usa primer valor de fechas, valida arrays de 6, tipos {12,41,42,43,51}, CUPS.
+    Con procesos > 1 (por defecto PROCESAMIENTO_PROCESOS), los CSV/TXT de más de
+    un trozo se validan en paralelo; el resultado es idéntico al secuencial.
+    motor_validacion ("python" o "numpy", por defecto PROCESAMIENTO_MOTOR_VALIDACION)
+    elige cómo se validan las filas CSV/TXT; el resultado también es el mismo.
+    Devuelve el perfil de esta ejecución (tiempo, filas e idas a la BD por etapa y
+    pico de memoria), que también queda guardado en archivo_procesado.perfil.
+    Si otro trabajo sigue procesando el mismo archivo (entrega duplicada), no hace
+    nada y devuelve {}.
+    """
+    with reservar_archivo(db, archivo_id) as reservado:
+        if not reservado:
+            logger.warning("El archivo %s ya lo está procesando otro trabajo; se ignora esta entrega", archivo_id)
+            return {}
+        return _procesar_archivo_reservado(db, archivo_id, ruta_archivo, procesos, motor_validacion)
+
+
+def _procesar_archivo_reservado(
+    db: Session, archivo_id: int, ruta_archivo: str, procesos: int | None, motor_validacion: str | None
+) -> dict[str, Any]:
+    archivo = marcar_procesando(db, archivo_id)
+    if not archivo:
+        return {}
 
+    # Reanuda tras el último lote guardado si una ejecución anterior no terminó
+    ctx = _ContextoTrabajo(db, archivo_id, archivo=archivo, progreso=NotificadorProgreso(archivo_id))
+    if procesos is None:
+        procesos = settings.PROCESAMIENTO_PROCESOS
+    # Un proceso daemon (p. ej. worker prefork de Celery) no puede crear procesos hijos
+    if multiprocessing.current_process().daemon:
+        procesos = 1
+
+    motor = _motor_validacion(motor_validacion)
+
+    lineas_previas = ctx.total
+    memoria_inicio = _memoria_pico_mb()
+    inicio = time.perf_counter()
+    ctx.etapas.vincular(db)
     try:
-        # CORRECCIÓN PARA WINDOWS: Si la ruta viene de Docker (/app/uploads), 
-        # la traducimos a la carpeta local de uploads.
-        if ruta_archivo.startswith("/app/uploads/"):
-            filename = os.path.basename(ruta_archivo)
-            ruta_archivo = os.path.join(os.getcwd(), "uploads", filename)
-        
-        ruta_archivo_abs = os.path.abspath(ruta_archivo)
-        
+        try:
+            _procesar_archivo(ctx, archivo, ruta_archivo, procesos, motor)
+        finally:
+            ctx.etapas.desvincular(db)
+        # Solo si terminó: tras una caída no se hace commit de un lote a medias
+        perfil = _perfil(
+            ctx.etapas,
+            ctx.total - lineas_previas,
+            time.perf_counter() - inicio,
+            lineas_previas=lineas_previas,
+            procesos=procesos,
+            motor_validacion=motor,
+            memoria_pico_inicio_mb=memoria_inicio,
+        )
+        _guardar_perfil(db, archivo, perfil)
+        actualizar_estadisticas_archivo(db, archivo_id)
+        metricas.observar_etapas(ctx.etapas.segundos)
+        metricas.observar_trabajo(archivo.estado, perfil["segundos"])
+    finally:
+        # Evento final (completado/error) para los clientes del progreso en vivo
+        ctx.publicar_progreso(archivo.estado, forzar=True)
+    return perfil
+
+
+def simular_archivo(
+    db: Session,
+    ruta_archivo: str,
+    procesos: int | None = None,
+    motor_validacion: str | None = None,
+) -> dict[str, Any]:
+    """
+    Simulación (dry-run): recorre el archivo exactamente como procesar_archivo
+    (lectura, validación, CUPS y duplicados contra la BD) pero sin escribir
+    energía, errores ni archivo_procesado. Devuelve un informe con los contadores,
+    los errores por tipo, líneas por segundo total y por etapa y el pico de memoria.
+    """
+    archivo = ArchivoProcesado(id=0, nombre_archivo=os.path.basename(ruta_archivo), estado="procesando")
+    ctx = _ContextoTrabajo(db, 0, archivo=archivo, simulacion=True)
+    if procesos is None:
+        procesos = settings.PROCESAMIENTO_PROCESOS
+    if multiprocessing.current_process().daemon:
+        procesos = 1
+    inicio = time.perf_counter()
+    ctx.etapas.vincular(db)
+    try:
+        _procesar_archivo(ctx, archivo, ruta_archivo, procesos, _motor_validacion(motor_validacion))
+    finally:
+        ctx.etapas.desvincular(db)
+    segundos = time.perf_counter() - inicio
+    return {
+        "estado": archivo.estado,
+        "total_registros": archivo.total_registros or 0,
+        "registros_validos": archivo.registros_exitosos or 0,
+        "registros_con_error": archivo.registros_con_error or 0,
+        "errores_por_tipo": dict(ctx.sumidero.por_tipo),
+        **_perfil(ctx.etapas, ctx.total, segundos),
+    }
+
+
+def _procesar_archivo(
+    ctx: _ContextoTrabajo, archivo: ArchivoProcesado, ruta_archivo: str, procesos: int, motor: str
+) -> None:
+    db, archivo_id = ctx.db, ctx.archivo_id
+    try:
+        ruta_archivo_abs = _resolver_ruta(ruta_archivo)
+
         if not os.path.exists(ruta_archivo_abs):
             error_msg = f"Archivo no encontrado físicamente en: {ruta_archivo_abs}"
-            registrar_error(db, archivo_id, 0, "archivo_no_encontrado", error_msg)
+            ctx.registrar_error(0, "archivo_no_encontrado", error_msg)
             archivo.estado = "error"
             db.commit()
             return
+        if ctx.progreso is not None:
+            ctx.progreso.bytes_totales = os.path.getsize(ruta_archivo_abs)
 
-        ext = os.path.splitext(ruta_archivo_abs)[1].lower()
-        # Archivos .txt pueden ser XML (p. ej. exportados como .txt)
-        es_xml = False
-        if ext == ".xml":
-            es_xml = True
-        elif ext == ".txt":
-            with open(ruta_archivo_abs, "r", encoding="utf-8-sig", errors="replace") as f:
-                peek = f.read(512)
-            es_xml = peek.strip().startswith("<?xml") or (peek.strip().startswith("<") and "<" in peek and ">" in peek)
-
-        if ext == ".xml" or es_xml:
-            import xml.etree.ElementTree as ET
-            try:
-                with open(ruta_archivo_abs, "r", encoding="utf-8") as f:
-                    xml_content = f.read()
-                    if "</energiaExcedentaria>" in xml_content:
-                        xml_content = xml_content.split("</energiaExcedentaria>")[0] + "</energiaExcedentaria>"
-                root = ET.fromstring(xml_content)
-            except Exception as e:
-                registrar_error(db, archivo_id, 0, "error_xml", f"Error al leer XML: {str(e)}")
-                archivo.estado = "error"
-                db.commit()
-                return
-
-            root_tag = _tag_sin_namespace(root.tag)
-            # Soporte dos formatos XML: energiaExcedentaria (registro con 6 periodos) y AutoconsumoColectivo (Cabecera + Registros)
-            if root_tag == "AutoconsumoColectivo":
-                _procesar_xml_autoconsumo_colectivo(db, archivo_id, root, ruta_archivo_abs)
-                archivo.estado = "completado"
-                total_autoc = db.query(EnergiaExcedentaria).filter(EnergiaExcedentaria.archivo_id == archivo_id).count()
-                total_err_autoc = db.query(RegistroErrores).filter(RegistroErrores.archivo_id == archivo_id).count()
-                archivo.total_registros = total_autoc + total_err_autoc
-                archivo.registros_exitosos = total_autoc
-                archivo.registros_con_error = total_err_autoc
-                db.commit()
-                return
-            if root_tag != XML_ROOT_TAG:
-                registrar_error(
-                    db, archivo_id, 1, "estructura_invalida",
-                    f"Raíz del XML debe ser <{XML_ROOT_TAG}> o <AutoconsumoColectivo>. Encontrado: <{root_tag or root.tag}>"
-                )
-                archivo.estado = "error"
-                db.commit()
-                return
+        if _es_xml(ruta_archivo_abs):
+            with _abrir_datos(ruta_archivo_abs) as (fxml, crudo):
+                if ctx.progreso is not None:
+                    ctx.progreso.posicion = crudo.tell
+                try:
+                    root, registros = _abrir_xml_streaming(fxml)
+                except Exception as e:
+                    ctx.registrar_error(0, "error_xml", f"Error al leer XML: {str(e)}")
+                    archivo.estado = "error"
+                    db.commit()
+                    return
 
-            # Obtener todos los <registro> (con o sin namespace)
-            registros = [e for e in root if _tag_sin_namespace(e.tag) == XML_REGISTRO_TAG]
-            if not registros:
-                registrar_error(db, archivo_id, 1, "estructura_invalida", "No se encontró ningún elemento <registro> dentro de <energiaExcedentaria>")
-                archivo.estado = "error"
-                db.commit()
-                return
+                root_tag = _tag_sin_namespace(root.tag)
+                # Soporte dos formatos XML: energiaExcedentaria (registro con 6 periodos) y AutoconsumoColectivo (Cabecera + Registros)
+                if root_tag == "AutoconsumoColectivo":
+                    # Formato de un solo registro: se carga el árbol completo
+                    fxml.seek(0)
+                    root = ET.parse(fxml).getroot()
+                    _procesar_xml_autoconsumo_colectivo(ctx, root)
+                    archivo.estado = "completado"
+                    if ctx.simulacion:
+                        total_autoc = ctx.exitosos
+                        total_err_autoc = sum(ctx.sumidero.por_tipo.values())
+                    else:
+                        total_autoc = db.query(EnergiaExcedentaria).filter(EnergiaExcedentaria.archivo_id == archivo_id).count()
+                        total_err_autoc = db.query(RegistroErrores).filter(RegistroErrores.archivo_id == archivo_id).count()
+                    archivo.total_registros = total_autoc + total_err_autoc
+                    archivo.registros_exitosos = total_autoc
+                    archivo.registros_con_error = total_err_autoc
+                    db.commit()
+                    return
+                if root_tag != XML_ROOT_TAG:
+                    ctx.registrar_error(
+                        1, "estructura_invalida",
+                        f"Raíz del XML debe ser <{XML_ROOT_TAG}> o <AutoconsumoColectivo>. Encontrado: <{root_tag or root.tag}>"
+                    )
+                    archivo.estado = "error"
+                    db.commit()
+                    return
 
-            for num_linea, reg in enumerate(registros, start=2):
-                total += 1
-                # 1) Validar estructura del registro (campos obligatorios y 6 hora por bloque)
-                errores_estructura = validar_estructura_xml_registro(reg)
-                if errores_estructura:
-                    for t, d in errores_estructura:
-                        registrar_error(db, archivo_id, num_linea, t, d, None)
-                    con_error += 1
-                    continue
-
-                # 2) Construir row desde la estructura validada (acepta <hora> o <p1>..<p6>)
-                def _text(elm):
-                    return (elm.text or "").strip() if elm is not None else ""
-                row = {
-                    "cups_cliente": _text(_find_child(reg, "cupsCliente")),
-                    "instalacion_gen": _text(_find_child(reg, "instalacionGen")),
-                    "fecha_desde_1": _text(_find_child(reg, "fechaDesde")),
-                    "fecha_hasta_1": _text(_find_child(reg, "fechaHasta")),
-                    "tipo_autoconsumo": _text(_find_child(reg, "tipoAutoconsumo")),
-                }
-                for campo_xml, campo_csv in [("energiaNetaGen", "energia_neta_gen"), ("energiaAutoconsumida", "energia_autoconsumida"), ("pagoTDA", "pago_tda")]:
-                    elem = _find_child(reg, campo_xml)
-                    valores, _ = _obtener_valores_periodo(elem)
-                    for i in range(1, NUM_PERIODOS + 1):
-                        row[f"{campo_csv}_{i}"] = valores[i - 1] if i <= len(valores) else ""
-
-                errores = validar_linea(row, num_linea, db)
-                if not errores:
-                    try:
-                        f_d = datetime.strptime(row["fecha_desde_1"], "%Y-%m-%d").date()
-                        f_h = datetime.strptime(row["fecha_hasta_1"], "%Y-%m-%d").date()
-                        if db.query(EnergiaExcedentaria).filter(
-                            EnergiaExcedentaria.cups_cliente == row["cups_cliente"],
-                            EnergiaExcedentaria.fecha_desde == f_d,
-                            EnergiaExcedentaria.fecha_hasta == f_h,
-                            EnergiaExcedentaria.instalacion_gen == row.get("instalacion_gen", ""),
-                        ).first():
-                            errores.append(("registro_duplicado", "Ya existe este periodo para este CUPS"))
-                    except Exception:
-                        pass
-
-                if errores:
-                    for t, d in errores:
-                        registrar_error(db, archivo_id, num_linea, t, d, json.dumps(row))
-                    con_error += 1
-                else:
-                    try:
-                        insertar_energia(db, archivo_id, num_linea, row)
-                        exitosos += 1
-                    except Exception as e:
-                        registrar_error(db, archivo_id, num_linea, "inconsistencia", str(e), json.dumps(row))
-                        con_error += 1
+                # Los <registro> se procesan según se cierran (con o sin namespace)
+                try:
+                    for reg in islice(registros, ctx.guardados):
+                        reg.clear()
+                    lotes = _lotes(enumerate(registros, start=2 + ctx.guardados), TAMANO_LOTE)
+                    for lote in ctx.etapas.medir_iter("lectura", lotes):
+                        _procesar_lote_xml(ctx, lote)
+                except ET.ParseError as e:
+                    # XML mal formado a mitad de archivo: los lotes anteriores ya están guardados
+                    db.rollback()
+                    ctx.registrar_error(0, "error_xml", f"Error al leer XML: {str(e)}")
+                    archivo.estado = "error"
+                    archivo.total_registros = ctx.total
+                    archivo.registros_exitosos = ctx.exitosos
+                    archivo.registros_con_error = ctx.con_error
+                    db.commit()
+                    return
+                if ctx.total == 0:
+                    ctx.registrar_error(1, "estructura_invalida", "No se encontró ningún elemento <registro> dentro de <energiaExcedentaria>")
+                    archivo.estado = "error"
+                    db.commit()
+                    return
         else:
-            import csv
             try:
-                with open(ruta_archivo_abs, "r", encoding="utf-8-sig", newline="") as f:
-                    sample = f.read(2048)
-                    f.seek(0)
-                    dialect = None
-                    if sample:
-                        try:
-                            dialect = csv.Sniffer().sniff(sample, delimiters=",;|")
-                        except csv.Error:
-                            pass
-                    if dialect is None:
-                        first_line = sample.split("\n")[0] if sample else ""
-                        for delim in "|", ",", ";":
-                            if first_line.count(delim) >= 4:
-                                dialect = type("DelimDialect", (csv.Dialect,), {
-                                    "delimiter": delim,
-                                    "doublequote": True,
-                                    "skipinitialspace": True,
-                                    "lineterminator": "\r\n",
-                                    "quoting": csv.QUOTE_MINIMAL,
-                                })()
-                                break
-                    if dialect is None:
-                        dialect = csv.excel
-                    reader = csv.DictReader(f, dialect=dialect)
-                    fieldnames = [fn.strip() for fn in (reader.fieldnames or []) if fn]
-                    # Validar estructura CSV: debe tener columnas que permitan cups, fechas, tipo
-                    posibles_cups = {"cups", "cups_cliente", "CUPS", "cupsCliente"}
-                    posibles_fecha_desde = {"fecha_desde", "fecha_desde_1", "fechaDesde"}
-                    posibles_fecha_hasta = {"fecha_hasta", "fecha_hasta_1", "fechaHasta"}
-                    tiene_cups = any(c in fieldnames for c in posibles_cups)
-                    tiene_fechas = any(f in fieldnames for f in posibles_fecha_desde) and any(f in fieldnames for f in posibles_fecha_hasta)
-                    tiene_tipo = any(t in fieldnames for t in ("tipo", "tipo_autoconsumo", "tipoAutoconsumo"))
-                    if not fieldnames or not (tiene_cups and tiene_fechas and tiene_tipo):
-                        registrar_error(
-                            db, archivo_id, 1, "estructura_invalida",
+                with _abrir_datos(ruta_archivo_abs) as (datos, crudo), \
+                        io.TextIOWrapper(datos, encoding="utf-8-sig", newline="") as f:
+                    if ctx.progreso is not None:
+                        ctx.progreso.posicion = crudo.tell
+                    lineas, fieldnames, dialecto = _abrir_csv(f)
+                    if not _columnas_csv_validas(fieldnames):
+                        ctx.registrar_error(
+                            1, "estructura_invalida",
                             "CSV/TXT debe incluir columnas para CUPS, fechas (desde/hasta) y tipo autoconsumo (ej. cups, fecha_desde, fecha_hasta, tipo)"
                         )
                         archivo.estado = "error"
                         db.commit()
                         return
 
-                    for num_linea, row in enumerate(reader, start=2):
-                        total += 1
-                        row = {k.strip(): v for k, v in row.items() if k}
-                        mapping = {
-                            "cups": "cups_cliente", "CUPS": "cups_cliente", "cupsCliente": "cups_cliente",
-                            "tipo": "tipo_autoconsumo", "tipoAutoconsumo": "tipo_autoconsumo",
-                            "fecha_desde": "fecha_desde_1", "fechaDesde": "fecha_desde_1",
-                            "fecha_hasta": "fecha_hasta_1", "fechaHasta": "fecha_hasta_1",
-                            "instalacion": "instalacion_gen", "instalacionGen": "instalacion_gen",
-                        }
-                        for ok, nk in mapping.items():
-                            if ok in row and (nk not in row or not (row.get(nk) or "").strip()):
-                                row[nk] = row.get(ok) or ""
-
-                        for pref_ok, pref_nk in [("p", "energia_neta_gen_"), ("gen_p", "energia_neta_gen_"), ("cons_p", "energia_autoconsumida_")]:
-                            for i in range(1, 7):
-                                ok = f"{pref_ok}{i}"
-                                nk = f"{pref_nk}{i}"
-                                if ok in row and (nk not in row or not (row.get(nk) or "").strip()):
-                                    row[nk] = row.get(ok) or ""
-
-                        errores = validar_linea(row, num_linea, db)
-                        if not errores:
-                            try:
-                                f_d = datetime.strptime(row['fecha_desde_1'], "%Y-%m-%d").date()
-                                f_h = datetime.strptime(row['fecha_hasta_1'], "%Y-%m-%d").date()
-                                if db.query(EnergiaExcedentaria).filter(EnergiaExcedentaria.cups_cliente == row['cups_cliente'], EnergiaExcedentaria.fecha_desde == f_d, EnergiaExcedentaria.fecha_hasta == f_h).first():
-                                    errores.append(("registro_duplicado", "Ya existe"))
-                            except: pass
-                        
-                        if errores:
-                            for t, d in errores: registrar_error(db, archivo_id, num_linea, t, d, json.dumps(row))
-                            con_error += 1
-                        else:
-                            try:
-                                insertar_energia(db, archivo_id, num_linea, row)
-                                exitosos += 1
-                            except Exception as e:
-                                registrar_error(db, archivo_id, num_linea, "inconsistencia", str(e), json.dumps(row))
-                                con_error += 1
+                    divisible = datos is crudo and os.path.getsize(ruta_archivo_abs) > settings.PROCESAMIENTO_BYTES_TROZO
+                    if procesos > 1 and divisible:
+                        filas = islice(
+                            _validar_csv_en_paralelo(ruta_archivo_abs, fieldnames, dialecto, procesos, motor),
+                            ctx.guardados, None,
+                        )
+                    else:
+                        deque(islice(lineas, ctx.guardados), maxlen=0)
+                        filas = _validar_filas_csv(lineas, fieldnames, motor, ctx.etapas)
+                    lotes = _lotes(enumerate(filas, start=2 + ctx.guardados), TAMANO_LOTE)
+                    for lote in ctx.etapas.medir_iter("lectura", lotes):
+                        _procesar_lote_csv(ctx, lote)
             except Exception as e:
-                registrar_error(db, archivo_id, 0, "error_lectura", str(e))
+                # La transacción puede haber quedado inválida (p. ej. falló el COPY del lote)
+                db.rollback()
+                ctx.registrar_error(0, "error_lectura", str(e))
                 archivo.estado = "error"
                 db.commit()
                 return
 
         archivo.estado = "completado"
-        archivo.total_registros = total
-        archivo.registros_exitosos = exitosos
-        archivo.registros_con_error = con_error
+        archivo.total_registros = ctx.total
+        archivo.registros_exitosos = ctx.exitosos
+        archivo.registros_con_error = ctx.con_error
         db.commit()
     except Exception as e:
+        db.rollback()
         archivo.estado = "error"
-        registrar_error(db, archivo_id, 0, "error_global", str(e))
+        ctx.registrar_error(0, "error_global", str(e))
         db.commit()
@@ -0,0 +1,216 @@
+"""Progreso de procesamiento en vivo: publicación por Redis pub/sub o difusor en proceso."""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_FINALES = ("completado", "error")
+# Tras un fallo de conexión a Redis, no se reintenta durante este tiempo (segundos)
+REDIS_REINTENTO_SEGUNDOS = 30
+
+
+def canal_progreso(archivo_id: int) -> str:
+    """Canal Redis pub/sub con el progreso de un archivo."""
+    return f"archivo:{archivo_id}:progreso"
+
+
+class _DifusorLocal:
+    """
+    Difusor en proceso para cuando no hay Redis (p. ej. procesamiento en un hilo de la API).
+    Publica desde cualquier hilo hacia las colas asyncio de los suscriptores.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores: dict[int, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def suscribir(self, archivo_id: int) -> tuple[asyncio.AbstractEventLoop, asyncio.Queue]:
+        suscriptor = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._suscriptores.setdefault(archivo_id, set()).add(suscriptor)
+        return suscriptor
+
+    def cancelar(self, archivo_id: int, suscriptor: tuple[asyncio.AbstractEventLoop, asyncio.Queue]) -> None:
+        with self._lock:
+            suscriptores = self._suscriptores.get(archivo_id, set())
+            suscriptores.discard(suscriptor)
+            if not suscriptores:
+                self._suscriptores.pop(archivo_id, None)
+
+    def publicar(self, archivo_id: int, evento: dict[str, Any]) -> None:
+        with self._lock:
+            suscriptores = list(self._suscriptores.get(archivo_id, ()))
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, evento)
+            except RuntimeError:
+                # El loop del suscriptor ya está cerrado
+                self.cancelar(archivo_id, (loop, cola))
+
+
+difusor_local = _DifusorLocal()
+
+_redis = None
+_redis_no_disponible_hasta = 0.0
+
+
+def cliente_redis():
+    """Cliente Redis síncrono compartido, o None si Redis no está disponible."""
+    global _redis
+    if time.monotonic() < _redis_no_disponible_hasta:
+        return None
+    if _redis is None:
+        import redis
+
+        _redis = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return _redis
+
+
+def marcar_redis_no_disponible() -> None:
+    """Tras un fallo de Redis, cliente_redis devuelve None durante REDIS_REINTENTO_SEGUNDOS."""
+    global _redis_no_disponible_hasta
+    _redis_no_disponible_hasta = time.monotonic() + REDIS_REINTENTO_SEGUNDOS
+
+
+def publicar_progreso(archivo_id: int, evento: dict[str, Any]) -> None:
+    """Publica un evento de progreso. Nunca falla: sin Redis usa el difusor en proceso."""
+    difusor_local.publicar(archivo_id, evento)
+    try:
+        cliente = cliente_redis()
+        if cliente is not None:
+            cliente.publish(canal_progreso(archivo_id), json.dumps(evento))
+    except Exception as e:
+        logger.debug("Progreso sin Redis: %s", e)
+        marcar_redis_no_disponible()
+
+
+def evento_desde_archivo(archivo: Any) -> dict[str, Any]:
+    """Evento de progreso con los contadores guardados en archivo_procesado (sin velocidad ni ETA)."""
+    return {
+        "archivo_id": archivo.id,
+        "estado": archivo.estado,
+        "lineas_leidas": archivo.total_registros or 0,
+        "registros_exitosos": archivo.registros_exitosos or 0,
+        "registros_con_error": archivo.registros_con_error or 0,
+        "lineas_por_segundo": None,
+        "eta_segundos": None,
+    }
+
+
+class NotificadorProgreso:
+    """
+    Publica el progreso de un trabajo como mucho cada PROGRESO_INTERVALO_SEGUNDOS:
+    líneas leídas, exitosas, con error, líneas por segundo y ETA estimada por
+    bytes leídos (posicion() frente a bytes_totales).
+    """
+
+    def __init__(self, archivo_id: int, bytes_totales: int = 0):
+        self.archivo_id = archivo_id
+        self.bytes_totales = bytes_totales
+        # Devuelve los bytes leídos del archivo; None si no se conocen (sin ETA)
+        self.posicion: Callable[[], int] | None = None
+        # Líneas hechas por una ejecución anterior (reanudación): no cuentan para la velocidad
+        self.lineas_previas = 0
+        self._inicio = time.monotonic()
+        self._ultimo = 0.0
+
+    def publicar(
+        self,
+        lineas_leidas: int,
+        exitosos: int,
+        con_error: int,
+        estado: str = "procesando",
+        forzar: bool = False,
+    ) -> None:
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo < settings.PROGRESO_INTERVALO_SEGUNDOS:
+            return
+        self._ultimo = ahora
+        transcurrido = max(ahora - self._inicio, 1e-6)
+        eta = None
+        if estado == "procesando" and self.posicion is not None and self.bytes_totales:
+            try:
+                leidos = self.posicion()
+            except (OSError, ValueError):
+                leidos = 0
+            if leidos:
+                eta = round(transcurrido * max(self.bytes_totales - leidos, 0) / leidos, 1)
+        publicar_progreso(self.archivo_id, {
+            "archivo_id": self.archivo_id,
+            "estado": estado,
+            "lineas_leidas": lineas_leidas,
+            "registros_exitosos": exitosos,
+            "registros_con_error": con_error,
+            "lineas_por_segundo": round((lineas_leidas - self.lineas_previas) / transcurrido, 1),
+            "eta_segundos": eta,
+        })
+
+
+async def _suscribir_redis(archivo_id: int):
+    """
+    Cliente Redis y su PubSub suscrito al canal del archivo, o None si Redis no
+    está disponible. Quien lo recibe cierra los dos (_cerrar_redis).
+    """
+    cliente = pubsub = None
+    try:
+        import redis.asyncio as aioredis
+
+        cliente = aioredis.from_url(settings.REDIS_URL, socket_connect_timeout=1)
+        pubsub = cliente.pubsub()
+        await pubsub.subscribe(canal_progreso(archivo_id))
+        return cliente, pubsub
+    except Exception as e:
+        logger.debug("Suscripción de progreso sin Redis: %s", e)
+        await _cerrar_redis(cliente, pubsub)
+        return None
+
+
+async def _cerrar_redis(cliente, pubsub) -> None:
+    """Cierra el PubSub y el cliente (y su pool de conexiones) de un suscriptor. Nunca falla."""
+    for recurso in (pubsub, cliente):
+        if recurso is None:
+            continue
+        try:
+            await recurso.aclose()
+        except Exception as e:
+            logger.debug("Error al cerrar la suscripción de progreso: %s", e)
+
+
+async def suscribir_progreso(archivo_id: int, espera: float) -> AsyncIterator[dict[str, Any] | None]:
+    """
+    Eventos de progreso de un archivo (Redis pub/sub o, sin Redis, difusor en proceso).
+    Entrega None cada `espera` segundos sin eventos, para latidos y comprobaciones.
+    Si Redis se cae a mitad, sigue con el difusor en proceso en lugar de cortar
+    la suscripción (con los None, quien escucha comprueba el final en la BD).
+    """
+    suscripcion = await _suscribir_redis(archivo_id)
+    if suscripcion is not None:
+        cliente, pubsub = suscripcion
+        try:
+            while True:
+                try:
+                    mensaje = await pubsub.get_message(ignore_subscribe_messages=True, timeout=espera)
+                except Exception as e:
+                    logger.warning("Progreso del archivo %s sin Redis a mitad de la suscripción: %s", archivo_id, e)
+                    marcar_redis_no_disponible()
+                    break
+                yield json.loads(mensaje["data"]) if mensaje else None
+        finally:
+            await _cerrar_redis(cliente, pubsub)
+
+    _, cola = suscriptor = difusor_local.suscribir(archivo_id)
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(cola.get(), timeout=espera)
+            except asyncio.TimeoutError:
+                yield None
+    finally:
+        difusor_local.cancelar(archivo_id, suscriptor)
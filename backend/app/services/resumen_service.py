@@ -0,0 +1,213 @@
+"""
+Resumen mensual de energía (resumen_mensual_energia): por cliente, mes de
+fecha_desde y tipo de autoconsumo, número de registros y sumas por periodo.
+
+La ingesta lo actualiza en la misma transacción en que escribe cada lote
+(sumar_lote) o borra registros (restar_registros), así que cuadra con
+energia_excedentaria en cada commit; reconstruir_resumen lo rehace desde cero.
+Las consultas de totales leen una fila por mes en lugar de cada registro.
+Solo se mantiene en PostgreSQL (arrays y INSERT ... ON CONFLICT).
+"""
+
+import csv
+import io
+from datetime import date
+from typing import Any, Iterable
+
+from sqlalchemy import Date, cast, column, delete, func, select, table, text, tuple_
+from sqlalchemy.dialects.postgresql import array, insert
+from sqlalchemy.orm import Session
+
+from app.models import EnergiaExcedentaria, ResumenMensualEnergia
+
+# Campos de 6 periodos que se suman (los mismos que COLUMNAS_ARRAY_ORDEN de la ingesta)
+CAMPOS_RESUMEN = ("energia_neta_gen", "energia_autoconsumida", "pago_tda")
+NUM_PERIODOS = 6
+CLAVE_RESUMEN = ("cliente_id", "mes", "tipo_autoconsumo")
+COLUMNAS_RESUMEN = (*CLAVE_RESUMEN, "registros", *CAMPOS_RESUMEN)
+
+_tabla = ResumenMensualEnergia.__table__
+# Tabla temporal (por conexión) a la que se copia cada lote antes de sumarlo
+_lote = table("resumen_mensual_lote", *(column(c) for c in COLUMNAS_RESUMEN))
+
+
+def _en_postgresql(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def mes_de(fecha: date) -> date:
+    """Primer día del mes de la fecha (clave mes del resumen)."""
+    return fecha.replace(day=1)
+
+
+def agrupar_por_mes(valores: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Filas del resumen (registros y sumas por periodo) de unos valores de
+    energia_excedentaria, ordenadas por clave: dos lotes que tocan los mismos
+    meses bloquean sus filas en el mismo orden y no se interbloquean.
+    """
+    grupos: dict[tuple, list[dict[str, Any]]] = {}
+    for v in valores:
+        grupos.setdefault((v["cliente_id"], mes_de(v["fecha_desde"]), v["tipo_autoconsumo"]), []).append(v)
+    filas = []
+    for clave in sorted(grupos):
+        registros = grupos[clave]
+        fila = dict(zip(CLAVE_RESUMEN, clave), registros=len(registros))
+        for campo in CAMPOS_RESUMEN:
+            fila[campo] = [sum(periodo) for periodo in zip(*(v[campo] for v in registros))]
+        filas.append(fila)
+    return filas
+
+
+def _sumar_periodos(actual, nuevo):
+    return array([actual[p] + nuevo[p] for p in range(1, NUM_PERIODOS + 1)])
+
+
+def _upsert(sentencia):
+    """INSERT que, si la fila (cliente, mes, tipo) ya existe, le suma registros y periodos."""
+    return sentencia.on_conflict_do_update(
+        index_elements=list(CLAVE_RESUMEN),
+        set_={
+            "registros": _tabla.c.registros + sentencia.excluded.registros,
+            **{c: _sumar_periodos(_tabla.c[c], sentencia.excluded[c]) for c in CAMPOS_RESUMEN},
+        },
+    )
+
+
+def _copiar_a_tabla_lote(db: Session, filas: list[dict[str, Any]]) -> None:
+    """
+    Deja las filas en una tabla temporal de la conexión con COPY: mucho más
+    barato que un INSERT con miles de VALUES y arrays.
+    """
+    from app.services.procesador_service import CLAVE_MEDIDOR
+
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {_lote.name} (LIKE {_tabla.name})"
+    ))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for fila in filas:
+        writer.writerow([
+            "{" + ",".join(str(x) for x in fila[c]) + "}" if c in CAMPOS_RESUMEN else fila[c]
+            for c in COLUMNAS_RESUMEN
+        ])
+    buffer.seek(0)
+    conexion = db.connection()
+    medidor = db.info.get(CLAVE_MEDIDOR)
+    if medidor is not None:
+        medidor.consultas += 1
+    cursor = conexion.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {_lote.name} ({', '.join(COLUMNAS_RESUMEN)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def sumar_lote(db: Session, valores: Iterable[dict[str, Any]]) -> int:
+    """Suma al resumen los registros recién escritos (sin commit). Devuelve las filas tocadas."""
+    if not _en_postgresql(db):
+        return 0
+    filas = agrupar_por_mes(valores)
+    if not filas:
+        return 0
+    if db.get_bind().dialect.driver == "psycopg2":
+        _copiar_a_tabla_lote(db, filas)
+        db.execute(_upsert(insert(_tabla).from_select(
+            list(COLUMNAS_RESUMEN), select(*_lote.c).order_by(*(_lote.c[c] for c in CLAVE_RESUMEN))
+        )))
+        db.execute(delete(_lote))
+    else:
+        db.execute(_upsert(insert(_tabla)), filas)
+    return len(filas)
+
+
+def _agregado(*condiciones, restar: bool = False):
+    """SELECT con las filas del resumen de los registros que cumplen las condiciones (en negativo si restar)."""
+    signo = (lambda x: -x) if restar else (lambda x: x)
+    mes = cast(func.date_trunc("month", EnergiaExcedentaria.fecha_desde), Date)
+    return (
+        select(
+            EnergiaExcedentaria.cliente_id,
+            mes,
+            EnergiaExcedentaria.tipo_autoconsumo,
+            signo(func.count()),
+            *(
+                array([signo(func.sum(getattr(EnergiaExcedentaria, c)[p])) for p in range(1, NUM_PERIODOS + 1)])
+                for c in CAMPOS_RESUMEN
+            ),
+        )
+        .where(*condiciones)
+        .group_by(EnergiaExcedentaria.cliente_id, mes, EnergiaExcedentaria.tipo_autoconsumo)
+        .order_by(EnergiaExcedentaria.cliente_id, mes, EnergiaExcedentaria.tipo_autoconsumo)
+    )
+
+
+def restar_registros(db: Session, *condiciones) -> int:
+    """
+    Resta del resumen los registros de energia_excedentaria que cumplen las
+    condiciones; se llama justo antes de borrarlos, sin commit. Las filas que se
+    quedan sin registros se eliminan. Devuelve las filas tocadas.
+    """
+    if not _en_postgresql(db):
+        return 0
+    sentencia = _upsert(
+        insert(_tabla).from_select(
+            list(COLUMNAS_RESUMEN), _agregado(*condiciones, restar=True)
+        )
+    ).returning(*(_tabla.c[c] for c in CLAVE_RESUMEN), _tabla.c.registros)
+    filas = db.execute(sentencia).all()
+    vacias = [tuple(fila[:3]) for fila in filas if fila.registros <= 0]
+    if vacias:
+        db.execute(delete(_tabla).where(tuple_(*(_tabla.c[c] for c in CLAVE_RESUMEN)).in_(vacias)))
+    return len(filas)
+
+
+def reconstruir_resumen(db: Session, cliente_id: int | None = None) -> int:
+    """
+    Rehace el resumen (entero o de un cliente) a partir de energia_excedentaria
+    y hace commit. Mientras dura, la ingesta espera para escribir (LOCK en modo
+    SHARE), así que no se pierde ningún lote. Devuelve las filas del resumen.
+    """
+    if not _en_postgresql(db):
+        raise RuntimeError("El resumen mensual solo se mantiene en PostgreSQL")
+    condiciones = [] if cliente_id is None else [EnergiaExcedentaria.cliente_id == cliente_id]
+    try:
+        db.execute(text(f"LOCK TABLE {EnergiaExcedentaria.__tablename__} IN SHARE MODE"))
+        borrar = delete(_tabla)
+        if cliente_id is not None:
+            borrar = borrar.where(_tabla.c.cliente_id == cliente_id)
+        db.execute(borrar)
+        resultado = db.execute(
+            insert(_tabla).from_select(list(COLUMNAS_RESUMEN), _agregado(*condiciones))
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return resultado.rowcount
+
+
+def totales_por_mes(db: Session, cliente_id: int, desde: date | None = None, hasta: date | None = None) -> list:
+    """
+    Filas (mes, registros, sumas P1-P6 de cada campo) del cliente, una por mes
+    (todos los tipos de autoconsumo juntos), entre los meses desde y hasta incluidos.
+    """
+    condiciones = [_tabla.c.cliente_id == cliente_id]
+    if desde is not None:
+        condiciones.append(_tabla.c.mes >= mes_de(desde))
+    if hasta is not None:
+        condiciones.append(_tabla.c.mes <= mes_de(hasta))
+    return db.execute(
+        select(
+            _tabla.c.mes,
+            func.sum(_tabla.c.registros).label("registros"),
+            *(
+                func.sum(_tabla.c[c][p]).label(f"{c}_{p}")
+                for c in CAMPOS_RESUMEN
+                for p in range(1, NUM_PERIODOS + 1)
+            ),
+        )
+        .where(*condiciones)
+        .group_by(_tabla.c.mes)
+        .order_by(_tabla.c.mes)
+    ).all()
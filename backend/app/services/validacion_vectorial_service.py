@@ -0,0 +1,164 @@
+"""
+Validación vectorial (NumPy) de lotes de filas CSV/TXT.
+
+Aplica las reglas de parsear_linea a un lote entero, por columnas: máscaras
+NumPy para el prefijo y la longitud del CUPS, el tipo de autoconsumo, las
+fechas ISO válidas y en orden y, opcionalmente, la existencia del CUPS; los 18
+valores numéricos se convierten a Decimal columna a columna (la conversión es
+a la vez la regla 5). Las filas que no pasan alguna regla (o traen un valor en
+un formato poco habitual) se validan fila a fila con parsear_linea, así que
+los errores son exactamente los mismos.
+NumPy (numpy>=2, por np.strings) es opcional: sin él o con una versión
+anterior, NUMPY_DISPONIBLE es False y se valida en Python.
+"""
+
+from decimal import Decimal, InvalidOperation
+from typing import Any, Collection
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+from app.services.procesador_service import (
+    COLUMNAS_ARRAY_ORDEN,
+    NUM_PERIODOS,
+    RegistroEnergia,
+    _error_cliente_inexistente,
+    parsear_linea,
+)
+from app.utils.validators import TIPOS_AUTOCONSUMO_VALIDOS
+
+# Las operaciones de texto vectoriales (np.strings) llegaron en NumPy 2.0
+NUMPY_DISPONIBLE = np is not None and hasattr(np, "strings")
+
+CAMPOS_NUMERICOS = tuple(f"{campo}_{i}" for campo in COLUMNAS_ARRAY_ORDEN for i in range(1, NUM_PERIODOS + 1))
+# Días de cada mes (febrero de año no bisiesto)
+DIAS_MES = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+# Códigos de carácter
+_CERO, _NUEVE, _GUION = ord("0"), ord("9"), ord("-")
+
+
+def _columna(rows: list[dict[str, Any]], campo: str):
+    return np.array([row.get(campo) or "" for row in rows], dtype=np.str_)
+
+
+def _codigos(texto) -> tuple[Any, Any]:
+    """Matriz (filas x ancho) de códigos de carácter del array de texto y la longitud de cada valor."""
+    ancho = max(texto.dtype.itemsize // 4, 1)
+    codigos = np.ascontiguousarray(texto, dtype=f"U{ancho}").view(np.uint32).reshape(len(texto), ancho)
+    return codigos, np.strings.str_len(texto)
+
+
+def _decimales(valores: list[Any]) -> tuple[list[Decimal | None], Any]:
+    """
+    Convierte una columna a Decimal de una vez (Decimal ignora los espacios de los
+    extremos, igual que parsear_linea tras strip). Si algún valor no convierte, se
+    repite valor a valor: devuelve los Decimal (None si falla) y la máscara de los válidos.
+    """
+    try:
+        return list(map(Decimal, valores)), True
+    except (InvalidOperation, TypeError, ValueError):
+        pass
+    convertidos: list[Decimal | None] = []
+    for valor in valores:
+        try:
+            convertidos.append(Decimal(valor))
+        except (InvalidOperation, TypeError, ValueError):
+            convertidos.append(None)
+    return convertidos, np.array([c is not None for c in convertidos], dtype=bool)
+
+
+def _fechas_limpias(texto):
+    """Fechas AAAA-MM-DD en ASCII que existen en el calendario (strptime las acepta)."""
+    codigos, largo = _codigos(texto)
+    if codigos.shape[1] < 10:
+        return np.zeros(len(texto), dtype=bool)
+    codigos = codigos[:, :10].astype(np.int64)
+    cifras = codigos[:, [0, 1, 2, 3, 5, 6, 8, 9]]
+    ok = (
+        (largo == 10)
+        & np.all((cifras >= _CERO) & (cifras <= _NUEVE), axis=1)
+        & (codigos[:, 4] == _GUION)
+        & (codigos[:, 7] == _GUION)
+    )
+    cifras = cifras - _CERO
+    anio = cifras[:, :4] @ np.array([1000, 100, 10, 1])
+    mes = cifras[:, 4] * 10 + cifras[:, 5]
+    dia = cifras[:, 6] * 10 + cifras[:, 7]
+    bisiesto = (anio % 4 == 0) & ((anio % 100 != 0) | (anio % 400 == 0))
+    max_dia = np.array(DIAS_MES)[np.clip(mes - 1, 0, 11)] + (bisiesto & (mes == 2))
+    return ok & (anio >= 1) & (mes >= 1) & (mes <= 12) & (dia >= 1) & (dia <= max_dia)
+
+
+def validar_filas_vectorial(
+    rows: list[dict[str, Any]],
+    cups_conocidos: Collection[str] | None = None,
+) -> list[tuple[RegistroEnergia | None, list[tuple[str, str]]]]:
+    """
+    Valida y convierte un lote de filas (campos canónicos, ver _ColumnasCsv).
+    Devuelve, por fila y en orden, lo mismo que parsear_linea: (registro, errores).
+    Sin cups_conocidos se omite la regla 6 (como con comprobar_cliente=False);
+    con ellos, el CUPS debe estar en el conjunto.
+    """
+    n = len(rows)
+    if n == 0:
+        return []
+
+    # 1. CUPS formato y 6. CUPS existe
+    cups = np.strings.strip(_columna(rows, "cups_cliente"))
+    limpias = np.strings.startswith(cups, "ES") & (np.strings.str_len(cups) >= 10)
+    if cups_conocidos is not None:
+        limpias &= np.isin(cups, np.array(list(cups_conocidos), dtype=np.str_))
+    # 2. Tipo autoconsumo (solo los valores exactos; cualquier otra escritura va a parsear_linea)
+    tipos = _columna(rows, "tipo_autoconsumo")
+    limpias &= np.isin(tipos, np.array([str(t) for t in TIPOS_AUTOCONSUMO_VALIDOS], dtype=np.str_))
+    # 3. Fechas válidas
+    fecha_desde = np.strings.strip(_columna(rows, "fecha_desde_1"))
+    fecha_hasta = np.strings.strip(_columna(rows, "fecha_hasta_1"))
+    limpias &= _fechas_limpias(fecha_desde) & _fechas_limpias(fecha_hasta)
+    # 4 y 5. Seis periodos numéricos por campo
+    columnas = []
+    for campo in CAMPOS_NUMERICOS:
+        convertidos, validos = _decimales([row.get(campo) for row in rows])
+        columnas.append(convertidos)
+        limpias &= validos
+    # 3. hasta >= desde (las que no, van a parsear_linea por el error)
+    indices = np.flatnonzero(limpias)
+    desde = fecha_desde[indices].astype("datetime64[D]")
+    hasta = fecha_hasta[indices].astype("datetime64[D]")
+    en_orden = hasta >= desde
+    indices, desde, hasta = indices[en_orden], desde[en_orden], hasta[en_orden]
+
+    resultados: list[Any] = [None] * n
+    seleccion = indices.tolist()
+    if len(seleccion) < n:
+        columnas = [[columna[i] for i in seleccion] for columna in columnas]
+    instalaciones = np.strings.strip(_columna(rows, "instalacion_gen")[indices]).tolist()
+    periodos = [
+        zip(*columnas[i:i + NUM_PERIODOS]) for i in range(0, len(CAMPOS_NUMERICOS), NUM_PERIODOS)
+    ]
+    registros = map(
+        RegistroEnergia,
+        cups[indices].tolist(),
+        instalaciones,
+        desde.tolist(),
+        hasta.tolist(),
+        tipos[indices].astype(int).tolist(),
+        *periodos,
+    )
+    for i, registro in zip(seleccion, registros):
+        resultados[i] = (registro, [])
+
+    # Filas con algún error o valor poco habitual: reglas fila a fila
+    pendientes = np.ones(n, dtype=bool)
+    pendientes[indices] = False
+    for i in np.flatnonzero(pendientes).tolist():
+        registro, errores = parsear_linea(rows[i], 0, None, comprobar_cliente=False)
+        if cups_conocidos is not None and not (errores and errores[0][0] == "formato_cups_invalido"):
+            cups_fila = (rows[i].get("cups_cliente") or "").strip()
+            if cups_fila not in cups_conocidos:
+                errores.insert(0, _error_cliente_inexistente(cups_fila))
+                registro = None
+        resultados[i] = (registro, errores)
+    return resultados
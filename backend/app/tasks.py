@@ -1,19 +1,135 @@
 """Tareas Celery para procesamiento asíncrono."""
 
+import os
+import time
+
+from celery import chord
+from celery.signals import worker_init, worker_process_shutdown
+
+from app import metricas
 from app.celery_app import celery_app
+from app.config import settings
 from app.database import SessionLocal
-from app.services.procesador_service import procesar_archivo
+from app.models import ArchivoProcesado
+from app.services.procesador_service import (
+    finalizar_trozos,
+    planificar_trozos_csv,
+    procesar_archivo,
+    procesar_trozo_csv,
+    repartir_en_trozos,
+)
+
+
+@worker_init.connect
+def _iniciar_metricas(**kwargs) -> None:
+    """Servidor HTTP con las métricas Prometheus del worker."""
+    try:
+        metricas.iniciar_exportador_worker(settings.METRICAS_PUERTO_WORKER)
+    except OSError as e:
+        # Puerto ocupado (p. ej. dos workers en la misma máquina): el worker sigue sin exportador
+        metricas.logger.warning("No se pudo iniciar el exportador de métricas: %s", e)
+
+
+@worker_process_shutdown.connect
+def _terminar_metricas(pid=None, **kwargs) -> None:
+    metricas.proceso_terminado(pid or os.getpid())
 
 
-@celery_app.task(bind=True, name="procesar_archivo")
-def procesar_archivo_task(self, archivo_id: int, ruta_archivo: str) -> dict:
+def _estado_tras_procesar(db, archivo_id: int, perfil: dict) -> str:
+    """
+    Resultado de procesar_archivo: el estado final del archivo ('completado' o
+    'error'); sin perfil, 'no_encontrado' o 'en_curso' (otro trabajo lo tiene reservado).
+    """
+    estado = db.query(ArchivoProcesado.estado).filter(ArchivoProcesado.id == archivo_id).scalar()
+    if estado is None:
+        return "no_encontrado"
+    return estado if perfil else "en_curso"
+
+
+# acks_late + reject_on_worker_lost: si el worker muere, la tarea vuelve a la cola
+# y se reanuda desde el checkpoint del archivo (o repite solo el trozo).
+@celery_app.task(bind=True, name="procesar_archivo", acks_late=True, reject_on_worker_lost=True)
+def procesar_archivo_task(
+    self,
+    archivo_id: int,
+    ruta_archivo: str,
+    motor_validacion: str | None = None,
+    encolado: float | None = None,
+) -> dict:
     """
     Tarea asíncrona: procesa un archivo de peajes.
     El worker ejecuta esta tarea cuando la API encola un archivo.
+    Los CSV/TXT mayores que CELERY_UMBRAL_DIVISION_BYTES se reparten en
+    subtareas por trozos (chord) y finalizar_trozos_task cierra el archivo.
+    encolado (time.time() al encolar) da la espera en cola para las métricas.
     """
+    metricas.observar_espera_cola(encolado, "procesar_archivo")
+    plan = planificar_trozos_csv(
+        ruta_archivo, settings.CELERY_UMBRAL_DIVISION_BYTES, settings.CELERY_BYTES_TROZO
+    )
+    db = SessionLocal()
+    try:
+        if plan is None:
+            perfil = procesar_archivo(db, archivo_id, ruta_archivo, motor_validacion=motor_validacion)
+            return {"archivo_id": archivo_id, "estado": _estado_tras_procesar(db, archivo_id, perfil)}
+        ahora = time.time()
+        subtareas = [
+            procesar_trozo_task.s(
+                archivo_id, plan["ruta"], plan["fieldnames"], plan["dialecto"], *trozo, motor_validacion, ahora
+            )
+            for trozo in plan["trozos"]
+        ]
+        # Una entrega duplicada (acks_late) no lanza un segundo chord sobre los mismos trozos
+        estado = repartir_en_trozos(
+            db, archivo_id, plan, lambda: chord(subtareas)(finalizar_trozos_task.s(archivo_id))
+        )
+    finally:
+        db.close()
+    if estado != "procesando":
+        return {"archivo_id": archivo_id, "estado": estado}
+    return {"archivo_id": archivo_id, "estado": estado, "trozos": len(subtareas)}
+
+
+@celery_app.task(name="procesar_trozo", acks_late=True, reject_on_worker_lost=True)
+def procesar_trozo_task(
+    archivo_id: int,
+    ruta_archivo_abs: str,
+    fieldnames: list,
+    dialecto: dict,
+    inicio: int,
+    fin: int,
+    primera_linea: int,
+    ultima_linea: int,
+    motor_validacion: str | None = None,
+    encolado: float | None = None,
+) -> dict:
+    """
+    Subtarea: procesa las filas del rango de bytes [inicio, fin) de un CSV/TXT.
+    El resultado lleva `terminado` (time.time()): el último trozo en terminar es
+    el que encola la finalización del chord.
+    """
+    metricas.observar_espera_cola(encolado, "procesar_trozo")
+    db = SessionLocal()
+    try:
+        resultado = procesar_trozo_csv(
+            db, archivo_id, ruta_archivo_abs, fieldnames, dialecto, inicio, fin, primera_linea, ultima_linea,
+            motor_validacion,
+        )
+    finally:
+        db.close()
+    return {**resultado, "terminado": time.time()}
+
+
+@celery_app.task(name="finalizar_trozos", acks_late=True, reject_on_worker_lost=True)
+def finalizar_trozos_task(resultados: list, archivo_id: int) -> dict:
+    """Callback del chord: agrega los contadores de los trozos y fija el estado final."""
+    # Se encola al terminar el último trozo
+    metricas.observar_espera_cola(
+        max((r.get("terminado") for r in resultados if r.get("terminado")), default=None), "finalizar_trozos"
+    )
     db = SessionLocal()
     try:
-        procesar_archivo(db, archivo_id, ruta_archivo)
-        return {"archivo_id": archivo_id, "estado": "completado"}
+        finalizar_trozos(db, archivo_id, resultados)
+        return {"archivo_id": archivo_id, "trozos": len(resultados)}
     finally:
         db.close()
@@ -0,0 +1,5 @@
+"""
+Benchmarks de procesar_archivo: generador de archivos sintéticos (generador)
+y ejecución con resultados en JSON comparables entre ejecuciones (ejecutar).
+Uso: python -m benchmarks.ejecutar --help
+"""
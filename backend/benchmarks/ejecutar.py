@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Benchmark de procesar_archivo por formato y tamaño, con resultados en JSON.
+
+Genera archivos sintéticos (benchmarks.generador), los procesa de punta a
+punta contra la BD indicada y guarda, por caso, las líneas por segundo total y
+por etapa (ETAPAS_PROCESAMIENTO) y los contadores. Con --comparar se marca
+como regresión todo caso que vaya más de --tolerancia más lento que en otra
+ejecución (sale con código 1).
+
+La BD debe ser de pruebas: se crean las tablas que falten y los clientes de
+los benchmarks, y lo procesado en cada caso se borra al terminarlo.
+SQLite sirve de sustituto sin PostgreSQL, pero no tiene ARRAY: solo admite
+--simulacion (todo salvo la escritura, que queda en 0).
+
+Uso:
+    python -m benchmarks.ejecutar --database-url sqlite:///benchmark.db --simulacion
+    python -m benchmarks.ejecutar --formatos csv xml --lineas 1000 100000 5000000 \\
+        --tasa-errores 0.05 --salida resultados.json --comparar anterior.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import ARRAY, create_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import settings
+from app.database import Base
+from app.models import ArchivoProcesado, Cliente, EnergiaExcedentaria, RegistroErrores, TipoAutoconsumo, Usuario
+from app.services.procesador_service import (
+    ETAPAS_PROCESAMIENTO,
+    _memoria_pico_mb,
+    _por_segundo,
+    procesar_archivo,
+    simular_archivo,
+)
+from benchmarks.generador import FORMATOS, NUM_CUPS, TIPOS_VALIDOS, cups_benchmark, generar_archivo
+
+LINEAS_POR_DEFECTO = (1_000, 10_000, 100_000)
+TOLERANCIA_POR_DEFECTO = 0.2
+# El colectivo es un archivo por línea (un trabajo completo cada uno): se limita el número de archivos
+MAX_ARCHIVOS_COLECTIVO = 1_000
+USUARIO_BENCHMARK = "benchmark"
+
+
+@compiles(ARRAY, "sqlite")
+def _array_en_sqlite(tipo, compilador, **kw):
+    # Solo para poder crear el esquema en SQLite: los benchmarks en SQLite no escriben energía
+    return "TEXT"
+
+
+def preparar_bd(db: Session, num_cups: int = NUM_CUPS) -> int:
+    """Crea las tablas que falten, los tipos de autoconsumo y los clientes de los benchmarks. Devuelve el usuario."""
+    Base.metadata.create_all(bind=db.get_bind())
+    existentes = {codigo for (codigo,) in db.query(TipoAutoconsumo.codigo)}
+    db.add_all(
+        TipoAutoconsumo(codigo=int(codigo), descripcion=f"Tipo {codigo}")
+        for codigo in TIPOS_VALIDOS
+        if int(codigo) not in existentes
+    )
+    usuario = db.query(Usuario).filter(Usuario.username == USUARIO_BENCHMARK).first()
+    if usuario is None:
+        usuario = Usuario(
+            username=USUARIO_BENCHMARK,
+            email="benchmark@localhost",
+            password_hash="!",
+            nombre_completo="Benchmarks",
+            activo=False,
+        )
+        db.add(usuario)
+    clientes = cups_benchmark(num_cups)
+    dados_de_alta = {cups for (cups,) in db.query(Cliente.cups).filter(Cliente.cups.in_(clientes))}
+    db.add_all(Cliente(cups=cups, nombre_cliente=f"Benchmark {cups}") for cups in clientes if cups not in dados_de_alta)
+    db.commit()
+    return usuario.id
+
+
+def _procesar(db: Session, usuario_id: int, ruta: str, procesos: int | None, motor: str | None) -> dict[str, Any]:
+    """
+    Procesa un archivo de verdad y deja la BD como estaba. Devuelve contadores,
+    segundos de procesar_archivo (sin el alta ni el borrado del benchmark), segundos
+    por etapa y sentencias enviadas a la BD.
+    """
+    archivo = ArchivoProcesado(
+        usuario_id=usuario_id,
+        nombre_archivo=ruta.rsplit("/", 1)[-1],
+        hash_archivo=uuid.uuid4().hex,
+        estado="pendiente",
+        ruta_archivo=ruta,
+    )
+    db.add(archivo)
+    db.commit()
+    try:
+        inicio = time.perf_counter()
+        perfil = procesar_archivo(db, archivo.id, ruta, procesos, motor)
+        segundos = time.perf_counter() - inicio
+        db.refresh(archivo)
+        return {
+            "estado": archivo.estado,
+            "total_registros": archivo.total_registros or 0,
+            "registros_validos": archivo.registros_exitosos or 0,
+            "registros_con_error": archivo.registros_con_error or 0,
+            "segundos": segundos,
+            "etapas": {etapa: datos["segundos"] for etapa, datos in perfil["etapas"].items()},
+            "consultas_bd": perfil["consultas_bd"],
+        }
+    finally:
+        db.rollback()
+        for modelo in (EnergiaExcedentaria, RegistroErrores):
+            db.query(modelo).filter(modelo.archivo_id == archivo.id).delete(synchronize_session=False)
+        db.query(ArchivoProcesado).filter(ArchivoProcesado.id == archivo.id).delete(synchronize_session=False)
+        db.commit()
+
+
+def _simular(db: Session, ruta: str, procesos: int | None, motor: str | None) -> dict[str, Any]:
+    informe = simular_archivo(db, ruta, procesos, motor)
+    informe["etapas"] = {etapa: datos["segundos"] for etapa, datos in informe["etapas"].items()}
+    return informe
+
+
+def ejecutar_caso(
+    db: Session,
+    usuario_id: int,
+    formato: str,
+    lineas: int,
+    tasa_errores: float,
+    semilla: int = 0,
+    simulacion: bool = False,
+    procesos: int | None = None,
+    motor: str | None = None,
+) -> dict[str, Any]:
+    """Genera un archivo sintético y lo procesa (o simula). Devuelve el resultado del caso."""
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as directorio:
+        inicio = time.perf_counter()
+        rutas = generar_archivo(formato, directorio, lineas, tasa_errores, semilla)
+        generacion = time.perf_counter() - inicio
+
+        acumulado = {"total_registros": 0, "registros_validos": 0, "registros_con_error": 0}
+        etapas = dict.fromkeys(ETAPAS_PROCESAMIENTO, 0.0)
+        estados = set()
+        segundos = 0.0
+        consultas = 0
+        for ruta in rutas:
+            if simulacion:
+                resultado = _simular(db, ruta, procesos, motor)
+            else:
+                resultado = _procesar(db, usuario_id, ruta, procesos, motor)
+            estados.add(resultado["estado"])
+            segundos += resultado["segundos"]
+            consultas += resultado["consultas_bd"]
+            for clave in acumulado:
+                acumulado[clave] += resultado[clave]
+            for etapa, seg in resultado["etapas"].items():
+                etapas[etapa] += seg
+
+    return {
+        "formato": formato,
+        "lineas": lineas,
+        "tasa_errores": tasa_errores,
+        "archivos": len(rutas),
+        "estado": "completado" if estados == {"completado"} else ", ".join(sorted(estados)),
+        **acumulado,
+        "generacion_segundos": round(generacion, 3),
+        "segundos": round(segundos, 3),
+        "lineas_por_segundo": _por_segundo(lineas, segundos),
+        "etapas": {
+            etapa: {"segundos": round(seg, 3), "lineas_por_segundo": _por_segundo(lineas, seg)}
+            for etapa, seg in etapas.items()
+        },
+        "consultas_bd": consultas,
+        # Pico del proceso hasta este caso (no baja entre casos)
+        "memoria_pico_mb": _memoria_pico_mb(),
+    }
+
+
+def comparar(resultados: list[dict[str, Any]], anteriores: list[dict[str, Any]], tolerancia: float) -> list[str]:
+    """Casos (mismo formato, líneas y tasa de errores) más lentos que antes en más de la tolerancia."""
+    previos = {(r["formato"], r["lineas"], r["tasa_errores"]): r for r in anteriores}
+    regresiones = []
+    for r in resultados:
+        previo = previos.get((r["formato"], r["lineas"], r["tasa_errores"]))
+        if not previo or not previo.get("lineas_por_segundo") or not r["lineas_por_segundo"]:
+            continue
+        cambio = r["lineas_por_segundo"] / previo["lineas_por_segundo"] - 1
+        if cambio < -tolerancia:
+            regresiones.append(
+                f"{r['formato']} {r['lineas']} líneas: {previo['lineas_por_segundo']} -> "
+                f"{r['lineas_por_segundo']} líneas/s ({cambio:+.0%})"
+            )
+    return regresiones
+
+
+def _commit_git() -> str | None:
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return salida.stdout.strip() or None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de procesar_archivo por formato y tamaño.")
+    parser.add_argument("--formatos", nargs="+", choices=FORMATOS, default=list(FORMATOS))
+    parser.add_argument("--lineas", nargs="+", type=int, default=list(LINEAS_POR_DEFECTO),
+                        help="Tamaños en líneas (en colectivo, número de archivos)")
+    parser.add_argument("--max-colectivo", type=int, default=MAX_ARCHIVOS_COLECTIVO,
+                        help="Máximo de archivos por caso en el formato colectivo")
+    parser.add_argument("--tasa-errores", type=float, default=0.05, help="Fracción de líneas con error (0 a 1)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--database-url", default=settings.database_url, help="BD de pruebas (por defecto DATABASE_URL)")
+    parser.add_argument("--simulacion", action="store_true", help="Simular (dry-run): sin escritura")
+    parser.add_argument("--motor", choices=("python", "numpy"), help="Motor de validación de filas CSV/TXT")
+    parser.add_argument("--procesos", type=int, help="Procesos para validar CSV/TXT grandes")
+    parser.add_argument("--salida", default="benchmark.json", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior con la que comparar")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_POR_DEFECTO,
+                        help="Caída de líneas/s admitida frente a --comparar (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    simulacion = args.simulacion
+    if engine.dialect.name == "sqlite" and not simulacion:
+        print("SQLite no tiene ARRAY: se ejecuta en simulación (sin escritura).", file=sys.stderr)
+        simulacion = True
+    db = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        usuario_id = preparar_bd(db)
+        resultados = []
+        for formato in args.formatos:
+            tamanos = args.lineas
+            if formato == "colectivo":
+                tamanos = sorted({min(lineas, args.max_colectivo) for lineas in args.lineas})
+            for lineas in tamanos:
+                resultado = ejecutar_caso(
+                    db, usuario_id, formato, lineas, args.tasa_errores, args.semilla,
+                    simulacion, args.procesos, args.motor,
+                )
+                print(
+                    f"{formato:>9} {lineas:>9} líneas: {resultado['lineas_por_segundo']} líneas/s "
+                    f"({resultado['segundos']} s, {resultado['registros_con_error']} con error)",
+                    file=sys.stderr,
+                )
+                resultados.append(resultado)
+    finally:
+        db.close()
+
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_git(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "base_datos": engine.dialect.name,
+        "simulacion": simulacion,
+        "motor": args.motor or settings.PROCESAMIENTO_MOTOR_VALIDACION,
+        "procesos": args.procesos or settings.PROCESAMIENTO_PROCESOS,
+        "resultados": resultados,
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"Resultados en {args.salida}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f)["resultados"], args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN: {regresion}", file=sys.stderr)
+        if regresiones:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Generador de archivos de peajes sintéticos para los benchmarks.
+
+Formatos: csv (coma, columnas canónicas), txt (barra vertical, columnas con
+alias), xml (<energiaExcedentaria>, periodos <p1>..<p6>) y colectivo
+(<AutoconsumoColectivo>: un registro por archivo, así que se genera un
+directorio con un archivo por línea).
+Cada línea es válida o, con probabilidad tasa_errores, lleva un error de
+TIPOS_ERROR_GENERADOS. Las líneas válidas no repiten (cups, fecha_desde,
+fecha_hasta); los CUPS salen de cups_benchmark(), que hay que dar de alta
+como clientes para que no sean cliente_inexistente.
+"""
+
+import os
+import random
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterator
+from xml.sax.saxutils import escape
+
+from app.services.procesador_service import COLUMNAS_ARRAY_ORDEN, CSV_CAMPOS, NUM_PERIODOS
+
+FORMATOS = ("csv", "txt", "xml", "colectivo")
+TIPOS_ERROR_GENERADOS = (
+    "formato_cups_invalido",
+    "cliente_inexistente",
+    "tipo_no_soportado",
+    "fecha_formato_invalido",
+    "rango_fechas_invalido",
+    "formato_numerico_invalido",
+    "periodos_insuficientes",
+    "registro_duplicado",
+)
+# Clientes de los benchmarks: las líneas válidas se reparten entre ellos
+NUM_CUPS = 1000
+TIPOS_VALIDOS = ("12", "41", "42", "43", "51")
+FECHA_INICIO = date(2000, 1, 1)
+# Cabecera del TXT: alias de las columnas canónicas (como los archivos de las distribuidoras)
+CABECERA_TXT = ["cups", "instalacion", "tipo", "fecha_desde", "fecha_hasta"] + list(CSV_CAMPOS[5:])
+XML_BLOQUES = {
+    "energia_neta_gen": "energiaNetaGen",
+    "energia_autoconsumida": "energiaAutoconsumida",
+    "pago_tda": "pagoTDA",
+}
+COLECTIVO_CAMPOS = {
+    "energia_neta_gen": "EnergiaNetaGenerada",
+    "energia_autoconsumida": "EnergiaAutoconsumida",
+    "pago_tda": "PagoTDA",
+}
+
+
+def cups_benchmark(num_cups: int = NUM_CUPS) -> list[str]:
+    """CUPS de los clientes de los benchmarks (formato válido, 20 caracteres)."""
+    return [f"ES0099{n:012d}BM" for n in range(num_cups)]
+
+
+def _periodo(indice: int) -> tuple[date, date]:
+    """Periodo único por índice: meses consecutivos desde FECHA_INICIO."""
+    anio, mes = divmod(indice, 12)
+    desde = date(FECHA_INICIO.year + anio, mes + 1, 1)
+    siguiente = date(desde.year + (mes == 11), (mes + 1) % 12 + 1, 1)
+    return desde, siguiente - timedelta(days=1)
+
+
+def generar_filas(
+    lineas: int,
+    tasa_errores: float = 0.0,
+    semilla: int = 0,
+    num_cups: int = NUM_CUPS,
+    errores: tuple[str, ...] = TIPOS_ERROR_GENERADOS,
+) -> Iterator[dict[str, str]]:
+    """
+    Filas con los campos canónicos (CSV_CAMPOS), en texto. Un valor vacío es un
+    periodo que falta (en XML, la etiqueta no se escribe).
+    """
+    azar = random.Random(semilla)
+    clientes = cups_benchmark(num_cups)
+    ultima_valida: dict[str, str] | None = None
+    for i in range(lineas):
+        desde, hasta = _periodo(i // num_cups)
+        row = {
+            "cups_cliente": clientes[i % num_cups],
+            "instalacion_gen": f"GEN{i % 50:03d}",
+            "tipo_autoconsumo": azar.choice(TIPOS_VALIDOS),
+            "fecha_desde_1": desde.isoformat(),
+            "fecha_hasta_1": hasta.isoformat(),
+        }
+        for campo in COLUMNAS_ARRAY_ORDEN:
+            for p in range(1, NUM_PERIODOS + 1):
+                row[f"{campo}_{p}"] = f"{azar.uniform(0, 500):.3f}" if campo != "pago_tda" else f"{azar.uniform(0, 50):.2f}"
+
+        error = azar.choice(errores) if errores and azar.random() < tasa_errores else None
+        if error == "registro_duplicado" and ultima_valida is None:
+            error = "formato_numerico_invalido"
+        if error == "formato_cups_invalido":
+            row["cups_cliente"] = f"XX{i:018d}"
+        elif error == "cliente_inexistente":
+            row["cups_cliente"] = f"ES9999{i:012d}ZZ"
+        elif error == "tipo_no_soportado":
+            row["tipo_autoconsumo"] = "99"
+        elif error == "fecha_formato_invalido":
+            row["fecha_desde_1"] = desde.strftime("%d/%m/%Y")
+        elif error == "rango_fechas_invalido":
+            row["fecha_desde_1"], row["fecha_hasta_1"] = row["fecha_hasta_1"], row["fecha_desde_1"]
+        elif error == "formato_numerico_invalido":
+            row[f"energia_autoconsumida_{azar.randint(1, NUM_PERIODOS)}"] = "abc"
+        elif error == "periodos_insuficientes":
+            row[f"pago_tda_{azar.randint(1, NUM_PERIODOS)}"] = ""
+        elif error == "registro_duplicado":
+            for clave in ("cups_cliente", "instalacion_gen", "fecha_desde_1", "fecha_hasta_1"):
+                row[clave] = ultima_valida[clave]
+        else:
+            ultima_valida = row
+        yield row
+
+
+def _escribir_delimitado(ruta: Path, filas: Iterator[dict[str, str]], delimitador: str, cabecera: list[str]) -> None:
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        f.write(delimitador.join(cabecera) + "\n")
+        for row in filas:
+            f.write(delimitador.join(row[c] for c in CSV_CAMPOS) + "\n")
+
+
+def _periodos_xml(row: dict[str, str], campo: str) -> str:
+    return "".join(
+        f"<p{p}>{row[f'{campo}_{p}']}</p{p}>" for p in range(1, NUM_PERIODOS + 1) if row[f"{campo}_{p}"]
+    )
+
+
+def _escribir_xml(ruta: Path, filas: Iterator[dict[str, str]]) -> None:
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<energiaExcedentaria>\n')
+        for row in filas:
+            f.write(
+                f"<registro><cupsCliente>{escape(row['cups_cliente'])}</cupsCliente>"
+                f"<instalacionGen>{escape(row['instalacion_gen'])}</instalacionGen>"
+                f"<fechaDesde>{escape(row['fecha_desde_1'])}</fechaDesde>"
+                f"<fechaHasta>{escape(row['fecha_hasta_1'])}</fechaHasta>"
+                f"<tipoAutoconsumo>{escape(row['tipo_autoconsumo'])}</tipoAutoconsumo>"
+            )
+            for campo, etiqueta in XML_BLOQUES.items():
+                f.write(f"<{etiqueta}>{_periodos_xml(row, campo)}</{etiqueta}>")
+            f.write("</registro>\n")
+        f.write("</energiaExcedentaria>\n")
+
+
+def _escribir_colectivo(ruta: Path, row: dict[str, str]) -> None:
+    registros = []
+    for p in range(1, NUM_PERIODOS + 1):
+        valores = "".join(
+            f"<{etiqueta}>{escape(row[f'{campo}_{p}'])}</{etiqueta}>" for campo, etiqueta in COLECTIVO_CAMPOS.items()
+        )
+        registros.append(f"<Registro><Hora>{p}</Hora>{valores}</Registro>")
+    ruta.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n<AutoconsumoColectivo><Cabecera>'
+        f"<CUPS>{escape(row['cups_cliente'])}</CUPS>"
+        f"<TipoAutoconsumo>{escape(row['tipo_autoconsumo'])}</TipoAutoconsumo>"
+        f"<PeriodoFacturacion><FechaDesde>{escape(row['fecha_desde_1'])}</FechaDesde>"
+        f"<FechaHasta>{escape(row['fecha_hasta_1'])}</FechaHasta></PeriodoFacturacion>"
+        f"</Cabecera><Registros>{''.join(registros)}</Registros></AutoconsumoColectivo>\n",
+        encoding="utf-8",
+    )
+
+
+def generar_archivo(
+    formato: str,
+    destino: str | os.PathLike,
+    lineas: int,
+    tasa_errores: float = 0.0,
+    semilla: int = 0,
+    num_cups: int = NUM_CUPS,
+) -> list[str]:
+    """
+    Escribe un archivo sintético de `lineas` líneas de datos en el directorio
+    destino, sin cargarlo en memoria. Devuelve las rutas generadas: una, o una
+    por línea en el formato colectivo.
+    El colectivo no pasa por la regla 7 (un registro por archivo), así que no
+    se generan duplicados en ese formato.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato {formato!r} no soportado. Formatos: {', '.join(FORMATOS)}")
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    errores = TIPOS_ERROR_GENERADOS
+    if formato == "colectivo":
+        errores = tuple(e for e in errores if e != "registro_duplicado")
+    filas = generar_filas(lineas, tasa_errores, semilla, num_cups, errores)
+    nombre = f"benchmark_{lineas}"
+    if formato == "colectivo":
+        directorio = destino / nombre
+        directorio.mkdir(exist_ok=True)
+        rutas = []
+        for i, row in enumerate(filas):
+            ruta = directorio / f"colectivo_{i:07d}.xml"
+            _escribir_colectivo(ruta, row)
+            rutas.append(str(ruta))
+        return rutas
+    ruta = destino / f"{nombre}.{formato}"
+    if formato == "csv":
+        _escribir_delimitado(ruta, filas, ",", list(CSV_CAMPOS))
+    elif formato == "txt":
+        _escribir_delimitado(ruta, filas, "|", CABECERA_TXT)
+    else:
+        _escribir_xml(ruta, filas)
+    return [str(ruta)]
@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 from app.database import SessionLocal, Base, engine
 from app.models import Usuario, Cliente, ArchivoProcesado, EnergiaExcedentaria, TipoAutoconsumo
 from app.utils.auth import get_password_hash
+from app.services.estadisticas_service import actualizar_estadisticas_archivo
+from app.services.resumen_service import reconstruir_resumen
 from decimal import Decimal
 
 def init_db():
@@ -230,6 +232,10 @@ def init_db():
         db.add_all(registros_energia)
         db.commit()
         print(f"✓ {len(registros_energia)} registros de energía creados")
+        if engine.dialect.name == "postgresql":
+            print(f"✓ {reconstruir_resumen(db)} filas del resumen mensual de energía")
+        for archivo in archivos:
+            actualizar_estadisticas_archivo(db, archivo.id)
         
         print("\n✅ Base de datos inicializada correctamente!")
         print(f"  - Usuarios: {db.query(Usuario).count()}")
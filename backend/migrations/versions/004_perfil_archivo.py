@@ -0,0 +1,24 @@
+"""Perfil de procesamiento por archivo (tiempos por etapa, consultas y memoria).
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "004"
+down_revision: Union[str, None] = "003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("archivo_procesado", sa.Column("perfil", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("archivo_procesado", "perfil")
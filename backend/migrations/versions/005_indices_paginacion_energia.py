@@ -0,0 +1,25 @@
+"""Índices para la paginación por clave de energia_excedentaria.
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("idx_energia_linea_id", "energia_excedentaria", ["linea_archivo", "id"], unique=False)
+    op.create_index("idx_energia_fecha_id", "energia_excedentaria", ["fecha_desde", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("idx_energia_fecha_id", "energia_excedentaria")
+    op.drop_index("idx_energia_linea_id", "energia_excedentaria")
@@ -0,0 +1,50 @@
+"""Resumen mensual de energía por cliente y tipo de autoconsumo.
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "resumen_mensual_energia",
+        sa.Column("cliente_id", sa.Integer(), nullable=False),
+        sa.Column("mes", sa.Date(), nullable=False),
+        sa.Column("tipo_autoconsumo", sa.Integer(), nullable=False),
+        sa.Column("registros", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("energia_neta_gen", sa.ARRAY(sa.Numeric(16, 3)), nullable=False),
+        sa.Column("energia_autoconsumida", sa.ARRAY(sa.Numeric(16, 3)), nullable=False),
+        sa.Column("pago_tda", sa.ARRAY(sa.Numeric(16, 2)), nullable=False),
+        sa.ForeignKeyConstraint(["cliente_id"], ["cliente.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tipo_autoconsumo"], ["tipo_autoconsumo.codigo"]),
+        sa.PrimaryKeyConstraint("cliente_id", "mes", "tipo_autoconsumo"),
+    )
+    # Carga inicial con los registros existentes (lo mismo que python reconstruir_resumen.py)
+    op.execute("""
+        INSERT INTO resumen_mensual_energia
+            (cliente_id, mes, tipo_autoconsumo, registros, energia_neta_gen, energia_autoconsumida, pago_tda)
+        SELECT cliente_id, date_trunc('month', fecha_desde)::date, tipo_autoconsumo, count(*),
+               ARRAY[sum(energia_neta_gen[1]), sum(energia_neta_gen[2]), sum(energia_neta_gen[3]),
+                     sum(energia_neta_gen[4]), sum(energia_neta_gen[5]), sum(energia_neta_gen[6])],
+               ARRAY[sum(energia_autoconsumida[1]), sum(energia_autoconsumida[2]), sum(energia_autoconsumida[3]),
+                     sum(energia_autoconsumida[4]), sum(energia_autoconsumida[5]), sum(energia_autoconsumida[6])],
+               ARRAY[sum(pago_tda[1]), sum(pago_tda[2]), sum(pago_tda[3]),
+                     sum(pago_tda[4]), sum(pago_tda[5]), sum(pago_tda[6])]
+        FROM energia_excedentaria
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("resumen_mensual_energia")
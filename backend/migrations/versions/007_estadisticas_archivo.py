@@ -0,0 +1,40 @@
+"""Contadores por archivo para GET /api/v1/stats.
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "estadisticas_archivo",
+        sa.Column("archivo_id", sa.Integer(), nullable=False),
+        sa.Column("registros_energia", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("errores", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("fecha_actualizacion", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["archivo_id"], ["archivo_procesado.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("archivo_id"),
+    )
+    # Carga inicial: lo que ya hay guardado de cada archivo
+    op.execute("""
+        INSERT INTO estadisticas_archivo (archivo_id, registros_energia, errores)
+        SELECT a.id,
+               (SELECT count(*) FROM energia_excedentaria e WHERE e.archivo_id = a.id),
+               (SELECT count(*) FROM registro_errores r WHERE r.archivo_id = a.id)
+        FROM archivo_procesado a
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("estadisticas_archivo")
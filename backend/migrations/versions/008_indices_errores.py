@@ -0,0 +1,28 @@
+"""Índices de registro_errores para la paginación por clave y el resumen por tipo.
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Sustituye a idx_error_linea (archivo_id, linea_archivo), que es su prefijo
+    op.create_index("idx_error_archivo_linea_id", "registro_errores", ["archivo_id", "linea_archivo", "id"], unique=False)
+    op.drop_index("idx_error_linea", "registro_errores")
+    op.create_index("idx_error_archivo_tipo", "registro_errores", ["archivo_id", "tipo_error"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("idx_error_archivo_tipo", "registro_errores")
+    op.create_index("idx_error_linea", "registro_errores", ["archivo_id", "linea_archivo"], unique=False)
+    op.drop_index("idx_error_archivo_linea_id", "registro_errores")
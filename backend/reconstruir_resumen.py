@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Reconstruye el resumen mensual de energía (resumen_mensual_energia) a partir de
+energia_excedentaria: entero o de un solo cliente. La ingesta lo mantiene al día
+lote a lote; esto sirve tras cargas o borrados hechos fuera de ella.
+Uso: python reconstruir_resumen.py [--cliente-id ID]
+"""
+
+import argparse
+import sys
+
+from app.database import SessionLocal
+from app.services.resumen_service import reconstruir_resumen
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Reconstruye el resumen mensual de energía.")
+    parser.add_argument("--cliente-id", type=int, help="Solo el resumen de este cliente")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        filas = reconstruir_resumen(db, cliente_id=args.cliente_id)
+    finally:
+        db.close()
+    print(f"Resumen mensual reconstruido: {filas} filas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Simulación (dry-run) de la ingesta de un archivo de peajes: lo valida por el
+mismo camino que el procesamiento real, sin escribir nada en la BD, e imprime
+el informe en JSON (errores por tipo, líneas por segundo por etapa y pico de memoria).
+Uso: python simular.py ARCHIVO [--motor python|numpy] [--procesos N]
+"""
+
+import argparse
+import json
+import sys
+
+from app.database import SessionLocal
+from app.services.procesador_service import simular_archivo
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Valida un archivo de peajes sin guardarlo (dry-run).")
+    parser.add_argument("archivo", help="Archivo XML/CSV/TXT (o gzip/bz2/zip de un solo archivo)")
+    parser.add_argument("--motor", choices=("python", "numpy"), help="Motor de validación de filas CSV/TXT")
+    parser.add_argument("--procesos", type=int, help="Procesos para validar CSV/TXT grandes")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        informe = simular_archivo(db, args.archivo, procesos=args.procesos, motor_validacion=args.motor)
+    finally:
+        db.close()
+    print(json.dumps(informe, indent=2, ensure_ascii=False))
+    return 0 if informe["estado"] == "completado" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,8 +30,340 @@ def test_consulta_energia_sin_filtros(client):
     assert "registros" in response.json()
 
 
+def test_consulta_energia_paginada(client):
+    """Página con límite máximo, cursor inválido -> 400; sin página siguiente, siguiente_cursor es null."""
+    assert client.get("/api/v1/energia?limite=100000").status_code == 422
+    assert client.get("/api/v1/energia?cursor=no-es-un-cursor").status_code == 400
+    data = client.get("/api/v1/energia?orden=fecha_desde&limite=10").json()
+    assert data["siguiente_cursor"] is None and data["total"] == 0
+
+
+def test_consulta_energia_solo_cuenta_si_se_pide(client):
+    """Por defecto (total=ninguno) una página con siguiente no lanza el COUNT; con total=exacto, sí."""
+    from unittest.mock import patch
+    from app.api.routes import energia
+
+    pagina = ([], "cursor-siguiente")
+    with patch.object(energia, "paginar", return_value=pagina), \
+            patch.object(energia, "contar", return_value=250) as contar:
+        data = client.get("/api/v1/energia?limite=10").json()
+        assert data["total"] is None and data["siguiente_cursor"] == "cursor-siguiente"
+        contar.assert_not_called()
+        assert client.get("/api/v1/energia?limite=10&total=exacto").json()["total"] == 250
+        assert contar.call_args[0][2] == "exacto"
+
+
+def test_errores_paginados_y_resumen_por_tipo(client):
+    """GET /api/v1/errores: sigue siendo una lista, con el cursor en cabecera; /resumen cuenta por archivo y tipo."""
+    from datetime import datetime
+    from types import SimpleNamespace
+    from app.api.deps import get_db
+    from app.main import app
+    from app.api.routes.errores import ORDEN_ERRORES
+    from app.services.paginacion_service import decodificar_cursor
+
+    errores = [
+        SimpleNamespace(id=i, archivo_id=1, linea_archivo=i + 1, tipo_error="cliente_inexistente",
+                        descripcion="CUPS no encontrado", datos_linea=None, fecha_registro=datetime(2024, 1, 1))
+        for i in (10, 11, 12)
+    ]
+    session = MagicMock()
+    q = session.query.return_value
+    q.filter.return_value = q.order_by.return_value = q.limit.return_value = q.group_by.return_value = q
+    q.all.return_value = errores
+    app.dependency_overrides[get_db] = lambda: session
+    response = client.get(
+        "/api/v1/errores?limite=2&tipo_error=cliente_inexistente&fecha_hasta=2024-01-31",
+        headers={"Origin": "http://localhost:5173"},
+    )
+    assert [e["id"] for e in response.json()] == [10, 11]
+    assert decodificar_cursor(response.headers["X-Siguiente-Cursor"], "archivo_linea", ORDEN_ERRORES) == (1, 12, 11)
+    # El navegador solo deja leer la cabecera si CORS la expone
+    assert "x-siguiente-cursor" in response.headers["Access-Control-Expose-Headers"].lower()
+    assert q.filter.call_count == 2
+    assert client.get("/api/v1/errores?cursor=no-es-un-cursor").status_code == 400
+
+    q.all.return_value = [(1, "cliente_inexistente", 40000), (1, "fecha_invalida", 3)]
+    assert client.get("/api/v1/errores/resumen?archivo_id=1").json() == [
+        {"archivo_id": 1, "tipo_error": "cliente_inexistente", "total": 40000},
+        {"archivo_id": 1, "tipo_error": "fecha_invalida", "total": 3},
+    ]
+
+
+def test_exportar_energia_en_streaming(client):
+    """GET /api/v1/energia/export: mismos filtros que la consulta; CSV con cabecera y descarga como adjunto."""
+    response = client.get("/api/v1/energia/export?formato=csv&cups=NOEXISTE")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="energia.csv"' in response.headers["content-disposition"]
+    assert response.text.startswith("id,cups_cliente,")
+    response = client.get("/api/v1/energia/export?tipo_autoconsumo=41")
+    assert response.headers["content-type"] == "application/x-ndjson" and response.text == ""
+    assert client.get("/api/v1/energia/export?formato=xlsx").status_code == 422
+
+
+def test_energia_cliente_agregada_en_bd(client):
+    """GET /api/v1/clientes/{id}/energia: totales de la fila ROLLUP y desglose por periodo, sin cargar registros."""
+    from datetime import datetime
+    from decimal import Decimal
+    from app.api.deps import get_db
+    from app.main import app
+
+    cliente = {
+        "id": 3, "cups": "ES0021000000000001AA", "nombre_cliente": "Cliente", "email": None, "telefono": None,
+        "direccion": None, "municipio": None, "provincia": None, "codigo_postal": None, "activo": True,
+        "fecha_registro": datetime(2024, 1, 1), "fecha_actualizacion": datetime(2024, 1, 1),
+    }
+    filas = [(p, 2, Decimal("10.500"), Decimal("5"), Decimal("1.25")) for p in range(1, 7)]
+    filas.append((None, 2, Decimal("63.000"), Decimal("30"), Decimal("7.50")))
+    session = MagicMock()
+    session.execute.side_effect = [
+        MagicMock(**{"mappings.return_value.first.return_value": cliente}),
+        MagicMock(**{"all.return_value": filas}),
+    ]
+    app.dependency_overrides[get_db] = lambda: session
+    data = client.get("/api/v1/clientes/3/energia?fecha_desde=2024-01-01").json()
+    assert data["cups"] == cliente["cups"] and data["total_registros"] == 2
+    assert (data["total_energia_generada"], data["total_pago_tda"]) == (63.0, 7.5)
+    assert [p["periodo"] for p in data["periodos"]] == [1, 2, 3, 4, 5, 6]
+    assert data["periodos"][0] == {"periodo": 1, "generada": 10.5, "autoconsumida": 5.0, "pago": 1.25}
+    session.query.assert_not_called()
+
+
+def test_energia_cliente_mensual_desde_resumen(client):
+    """GET /api/v1/clientes/{id}/energia/mensual: una fila por mes del resumen; sin fechas, /energia suma esas filas."""
+    from datetime import date, datetime
+    from decimal import Decimal
+    from types import SimpleNamespace
+    from app.api.deps import get_db
+    from app.main import app
+
+    def mes(m, registros):
+        sumas = {f"{c}_{p}": Decimal("1.5") for c in ("energia_neta_gen", "energia_autoconsumida", "pago_tda") for p in range(1, 7)}
+        return SimpleNamespace(mes=date(2024, m, 1), registros=registros, **sumas)
+
+    session = MagicMock()
+    session.execute.side_effect = [
+        MagicMock(**{"first.return_value": (3,)}),
+        MagicMock(**{"all.return_value": [mes(1, 2), mes(2, 1)]}),
+    ]
+    app.dependency_overrides[get_db] = lambda: session
+    data = client.get("/api/v1/clientes/3/energia/mensual?desde=2024-01-15").json()
+    assert data == [
+        {"mes": "2024-01-01", "registros": 2, "generada": 9.0, "autoconsumida": 9.0, "pago": 9.0},
+        {"mes": "2024-02-01", "registros": 1, "generada": 9.0, "autoconsumida": 9.0, "pago": 9.0},
+    ]
+
+    session.execute.side_effect = [MagicMock(**{"first.return_value": None})]
+    assert client.get("/api/v1/clientes/99/energia/mensual").status_code == 404
+
+    cliente = {
+        "id": 3, "cups": "ES0021000000000001AA", "nombre_cliente": "Cliente", "email": None, "telefono": None,
+        "direccion": None, "municipio": None, "provincia": None, "codigo_postal": None, "activo": True,
+        "fecha_registro": datetime(2024, 1, 1), "fecha_actualizacion": datetime(2024, 1, 1),
+    }
+    session.execute.side_effect = [
+        MagicMock(**{"mappings.return_value.first.return_value": cliente}),
+        MagicMock(**{"all.return_value": [mes(1, 2), mes(2, 1)]}),
+    ]
+    data = client.get("/api/v1/clientes/3/energia").json()
+    assert (data["total_registros"], data["total_energia_generada"]) == (3, 18.0)
+    assert data["periodos"][0] == {"periodo": 1, "generada": 3.0, "autoconsumida": 3.0, "pago": 3.0}
+
+
+def test_stats_desde_cache_hasta_que_termina_un_trabajo(client, monkeypatch):
+    """GET /api/v1/stats suma los contadores por archivo una vez y sirve de caché; exact=true cuenta las tablas."""
+    from app.api.deps import get_db
+    from app.main import app
+    from app.services import estadisticas_service
+
+    monkeypatch.setattr(estadisticas_service, "cliente_redis", lambda: None)
+    estadisticas_service.invalidar_cache()
+    session = MagicMock()
+    session.query.return_value.one.return_value = (120, 7)
+    session.query.return_value.scalar.return_value = 3
+    session.query.return_value.filter.return_value.scalar.return_value = 5
+    app.dependency_overrides[get_db] = lambda: session
+    esperado = {"total_archivos": 3, "total_registros_energia": 120, "total_errores": 7}
+    assert client.get("/api/v1/stats").json() == esperado
+    session.query.reset_mock()
+    assert client.get("/api/v1/stats").json() == esperado
+    session.query.assert_not_called()
+    assert client.get("/api/v1/stats?exact=true").json() == {k: 3 for k in esperado}
+
+    # Al terminar un trabajo se guardan sus contadores y se invalida la caché
+    estadisticas_service.actualizar_estadisticas_archivo(session, 9)
+    guardado = session.merge.call_args[0][0]
+    assert (guardado.archivo_id, guardado.registros_energia, guardado.errores) == (9, 5, 5)
+    session.query.return_value.one.return_value = (125, 12)
+    assert client.get("/api/v1/stats").json()["total_registros_energia"] == 125
+    estadisticas_service.invalidar_cache()
+
+
 def test_root(client):
     """GET / retorna servicio y docs."""
     response = client.get("/")
     assert response.status_code == 200
     assert "docs" in response.json()
+
+
+def test_progreso_archivo_inexistente(client):
+    """GET /api/v1/archivos/{id}/events de un archivo que no existe retorna 404."""
+    response = client.get("/api/v1/archivos/999/events")
+    assert response.status_code == 404
+
+
+def test_perfil_archivo(client):
+    """GET /api/v1/archivos/{id}/profile: 404 sin archivo o sin perfil; si no, el perfil guardado."""
+    from app.api.deps import get_db
+    from app.main import app
+
+    assert client.get("/api/v1/archivos/999/profile").status_code == 404
+
+    archivo = MagicMock(id=7, nombre_archivo="peajes.csv", estado="completado", fecha_procesamiento=None, perfil=None)
+    session = MagicMock()
+    session.query.return_value.filter.return_value.first.return_value = archivo
+    app.dependency_overrides[get_db] = lambda: session
+    assert client.get("/api/v1/archivos/7/profile").status_code == 404
+
+    archivo.perfil = {
+        "segundos": 2.0,
+        "lineas": 100,
+        "lineas_por_segundo": 50.0,
+        "etapas": {"lectura": {"segundos": 0.5, "filas": 100, "lineas_por_segundo": 200.0}},
+        "consultas_bd": 4,
+        "memoria_pico_mb": 80.5,
+    }
+    response = client.get("/api/v1/archivos/7/profile")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["archivo_id"] == 7 and data["consultas_bd"] == 4
+    assert data["etapas"]["lectura"]["filas"] == 100
+
+
+def test_metricas_prometheus(client):
+    """GET /metrics: latencia por plantilla de ruta (no por URL), ingesta y archivos por estado."""
+    client.get("/api/v1/archivos/999")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    texto = response.text
+    assert 'ruta="/api/v1/archivos/{archivo_id}"' in texto and "/api/v1/archivos/999" not in texto
+    assert 'energy_archivos{estado="pendiente"} 0.0' in texto
+    assert "energy_bd_espera_conexion_segundos_bucket" in texto
+    assert "energy_ingesta_lineas_total" in texto or "# TYPE energy_ingesta_lineas counter" in texto
+
+
+def test_metricas_tareas_en_cola(client):
+    """GET /metrics lee del broker las tareas pendientes (todas las prioridades); sin Redis, no falla."""
+    from app.api.routes import metricas as ruta_metricas
+
+    redis = MagicMock()
+    redis.pipeline.return_value.__enter__.return_value.execute.return_value = [7, 2, 0, 1]
+    with patch.object(ruta_metricas, "cliente_redis", return_value=redis):
+        texto = client.get("/metrics").text
+    assert 'energy_cola_tareas{cola="celery"} 10.0' in texto
+
+    redis.pipeline.side_effect = ConnectionError("redis caído")
+    with patch.object(ruta_metricas, "cliente_redis", return_value=redis), \
+            patch.object(ruta_metricas, "marcar_redis_no_disponible") as marcar:
+        assert client.get("/metrics").status_code == 200
+    marcar.assert_called_once()
+
+
+def test_subida_se_guarda_por_trozos_y_se_renombra(tmp_path, monkeypatch, csv_content):
+    """La subida se copia por trozos a un temporal, con hash incremental, y se renombra a su sitio."""
+    import hashlib
+    from app.api.routes import archivos
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "UPLOAD_TAMANO_TROZO", 64)
+    db = MagicMock()
+    db.refresh.side_effect = lambda a: setattr(a, "id", 5)
+    with patch("app.database.SessionLocal", return_value=db), \
+            patch.object(archivos, "obtener_archivo_por_hash", return_value=None) as por_hash, \
+            patch.object(archivos, "_encolar_o_procesar_sync") as encolar:
+        resultado = archivos._subida_pesada_sync(BytesIO(csv_content), "peajes.csv", 1)
+
+    hash_archivo = hashlib.sha256(csv_content).hexdigest()
+    ruta = tmp_path / hash_archivo[:2] / hash_archivo[2:4] / f"{hash_archivo}.csv"
+    assert resultado["ok"] and resultado["archivo_id"] == 5
+    por_hash.assert_called_once_with(db, hash_archivo)
+    assert ruta.read_bytes() == csv_content
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == [ruta]
+    assert db.add.call_args[0][0].nombre_archivo == "peajes.csv"
+    encolar.assert_called_once_with(5, str(ruta), None)
+
+
+def test_subida_duplicada_no_deja_archivos(tmp_path, monkeypatch, csv_content):
+    """Si el hash ya existe, el temporal se borra y no se guarda nada."""
+    from app.api.routes import archivos
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    with patch("app.database.SessionLocal", return_value=MagicMock()), \
+            patch.object(archivos, "obtener_archivo_por_hash", return_value=MagicMock(id=3)):
+        resultado = archivos._subida_pesada_sync(BytesIO(csv_content), "peajes.csv", 1)
+
+    assert not resultado["ok"] and "ID 3" in resultado["detail"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_subida_en_simulacion_no_guarda_nada(client, tmp_path, monkeypatch, csv_content):
+    """Con simulacion=true se devuelve el informe (200) y no queda ningún archivo ni trabajo."""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    informe = {
+        "estado": "completado", "total_registros": 4, "registros_validos": 3, "registros_con_error": 1,
+        "errores_por_tipo": {"tipo_no_soportado": 1}, "segundos": 0.1, "lineas_por_segundo": 40.0,
+        "etapas": {"lectura": {"segundos": 0.01, "lineas_por_segundo": 400.0}}, "memoria_pico_mb": 60.0,
+    }
+    with patch("app.database.SessionLocal", return_value=MagicMock()), \
+            patch("app.services.procesador_service.simular_archivo", return_value=informe) as simular:
+        response = client.post(
+            "/api/v1/archivos/upload?simulacion=true",
+            files={"file": ("peajes.csv", csv_content, "text/csv")},
+        )
+
+    assert response.status_code == 200
+    datos = response.json()
+    assert datos["simulacion"] is True
+    assert datos["informes"][0]["nombre_archivo"] == "peajes.csv"
+    assert datos["informes"][0]["errores_por_tipo"] == {"tipo_no_soportado": 1}
+    simular.assert_called_once()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_subida_zip_crea_un_trabajo_por_archivo(tmp_path, monkeypatch, csv_content):
+    """Cada archivo del ZIP se guarda comprimido en gzip y se encola como un trabajo propio."""
+    import gzip
+    import hashlib
+    import zipfile
+    from app.api.routes import archivos
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    zip_bytes = BytesIO()
+    with zipfile.ZipFile(zip_bytes, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("lote/enero.csv", csv_content)
+        zf.writestr("lote/febrero.csv", csv_content + b"\n")
+        zf.writestr("__MACOSX/lote/._enero.csv", b"meta")
+    zip_bytes.seek(0)
+    ids = iter([11, 12])
+    db = MagicMock()
+    db.refresh.side_effect = lambda a: setattr(a, "id", next(ids))
+    with patch("app.database.SessionLocal", return_value=db), \
+            patch.object(archivos, "obtener_archivo_por_hash", return_value=None), \
+            patch.object(archivos, "_encolar_o_procesar_sync") as encolar:
+        resultado = archivos._subida_pesada_sync(zip_bytes, "lote.zip", 1)
+
+    assert resultado["ok"] and resultado["archivo_ids"] == [11, 12]
+    nuevos = [llamada[0][0] for llamada in db.add.call_args_list]
+    assert [a.nombre_archivo for a in nuevos] == ["enero.csv", "febrero.csv"]
+    assert nuevos[0].hash_archivo == hashlib.sha256(csv_content).hexdigest()
+    with gzip.open(nuevos[0].ruta_archivo) as f:
+        assert f.read() == csv_content
+    assert encolar.call_count == 2
+    assert len([p for p in tmp_path.rglob("*") if p.is_file()]) == 2
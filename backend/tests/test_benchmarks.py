@@ -0,0 +1,44 @@
+"""Tests del generador de archivos sintéticos y de la comparación de resultados de los benchmarks."""
+
+from benchmarks.ejecutar import comparar
+from benchmarks.generador import generar_archivo, generar_filas
+from app.services.procesador_service import _abrir_csv, _validar_filas_csv, parsear_linea
+
+
+def test_generador_csv_y_txt_validos_y_sin_duplicados(tmp_path):
+    """Sin errores, todas las líneas son válidas (con alias en TXT) y no repiten clave."""
+    for formato in ("csv", "txt"):
+        (ruta,) = generar_archivo(formato, tmp_path, 300, num_cups=7)
+        with open(ruta, encoding="utf-8", newline="") as f:
+            filas, fieldnames, _ = _abrir_csv(f)
+            validadas = list(_validar_filas_csv(filas, fieldnames))
+        assert len(validadas) == 300
+        assert all(registro is not None and not errores for _, registro, errores in validadas)
+        claves = {(r.cups_cliente, r.fecha_desde, r.fecha_hasta) for _, r, _ in validadas}
+        assert len(claves) == 300
+
+
+def test_generador_inyecta_la_tasa_de_errores():
+    filas = list(generar_filas(2000, tasa_errores=0.5, semilla=3, errores=("tipo_no_soportado",)))
+    con_error = sum(1 for row in filas if parsear_linea(row, 0, None, comprobar_cliente=False)[1])
+    assert 900 < con_error < 1100
+
+
+def test_generador_colectivo_un_archivo_por_linea(tmp_path):
+    rutas = generar_archivo("colectivo", tmp_path, 3)
+    assert len(rutas) == 3
+    assert "<AutoconsumoColectivo>" in open(rutas[0], encoding="utf-8").read()
+
+
+def test_comparar_marca_regresiones_por_caso():
+    anteriores = [
+        {"formato": "csv", "lineas": 1000, "tasa_errores": 0.05, "lineas_por_segundo": 1000.0},
+        {"formato": "xml", "lineas": 1000, "tasa_errores": 0.05, "lineas_por_segundo": 1000.0},
+    ]
+    resultados = [
+        {"formato": "csv", "lineas": 1000, "tasa_errores": 0.05, "lineas_por_segundo": 700.0},
+        {"formato": "xml", "lineas": 1000, "tasa_errores": 0.05, "lineas_por_segundo": 900.0},
+        {"formato": "txt", "lineas": 1000, "tasa_errores": 0.05, "lineas_por_segundo": 10.0},
+    ]
+    regresiones = comparar(resultados, anteriores, tolerancia=0.2)
+    assert len(regresiones) == 1 and regresiones[0].startswith("csv 1000")
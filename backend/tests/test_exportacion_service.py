@@ -0,0 +1,43 @@
+"""Tests de la serialización de la exportación de energía en streaming."""
+
+import csv
+import io
+import json
+from datetime import date
+from decimal import Decimal
+
+from app.schemas.energia import EnergiaExcedenteResponse
+from app.services.exportacion_service import CABECERA_CSV, exportar_csv, exportar_ndjson
+
+
+def _fila():
+    """Fila tal como la devuelve la BD (periodos y totales ya en texto)."""
+    return (
+        5, "ES0021000000000001AA", "GEN001", date(2024, 1, 1), date(2024, 1, 31), 41,
+        "{120.500,115.300,125.800,118.200,122.900,119.700}",
+        "{60.200,58.100,62.400,59.500,61.800,60.000}",
+        "{12.50,11.80,13.20,12.10,12.75,12.30}",
+        "722.400", "362.000", "74.65",
+    )
+
+
+def test_ndjson_igual_que_la_respuesta_json_de_la_consulta():
+    (bloque,) = exportar_ndjson([[_fila(), _fila()]])
+    lineas = bloque.splitlines()
+    assert len(lineas) == 2
+    esperado = EnergiaExcedenteResponse(
+        id=5, cups_cliente="ES0021000000000001AA", instalacion_gen="GEN001",
+        fecha_desde=date(2024, 1, 1), fecha_hasta=date(2024, 1, 31), tipo_autoconsumo=41,
+        energia_neta_gen=[Decimal(v) for v in ("120.500", "115.300", "125.800", "118.200", "122.900", "119.700")],
+        energia_autoconsumida=[Decimal(v) for v in ("60.200", "58.100", "62.400", "59.500", "61.800", "60.000")],
+        pago_tda=[Decimal(v) for v in ("12.50", "11.80", "13.20", "12.10", "12.75", "12.30")],
+    )
+    assert json.loads(lineas[0]) == json.loads(esperado.model_dump_json())
+
+
+def test_csv_cabecera_primero_y_periodos_en_columnas():
+    bloques = exportar_csv([[_fila()], []])
+    assert next(bloques) == ",".join(CABECERA_CSV) + "\n"
+    (fila,) = csv.DictReader(io.StringIO(",".join(CABECERA_CSV) + "\n" + "".join(bloques)))
+    assert fila["energia_neta_gen_6"] == "119.700" and fila["pago_tda_1"] == "12.50"
+    assert fila["total_neta_gen"] == "722.400"
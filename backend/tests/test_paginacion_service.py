@@ -0,0 +1,24 @@
+"""Tests del cursor de la paginación por clave."""
+
+from datetime import date
+
+import pytest
+
+from app.api.routes.energia import ORDENES_ENERGIA
+from app.services.paginacion_service import codificar_cursor, decodificar_cursor
+
+
+def test_cursor_ida_y_vuelta_con_tipos():
+    columnas = ORDENES_ENERGIA["fecha_desde"]
+    cursor = codificar_cursor("fecha_desde", (date(2024, 1, 31), 42))
+    assert "=" not in cursor
+    assert decodificar_cursor(cursor, "fecha_desde", columnas) == (date(2024, 1, 31), 42)
+
+
+def test_cursor_de_otro_orden_o_manipulado_es_invalido():
+    cursor = codificar_cursor("linea_archivo", (7, 42))
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        decodificar_cursor(cursor, "fecha_desde", ORDENES_ENERGIA["fecha_desde"])
+    for manipulado in ("xx", cursor[:-3], codificar_cursor("linea_archivo", ("siete", 42))):
+        with pytest.raises(ValueError):
+            decodificar_cursor(manipulado, "linea_archivo", ORDENES_ENERGIA["linea_archivo"])
@@ -1,7 +1,15 @@
 """Tests unitarios de parsing y validación de líneas."""
 
+import io
+
 import pytest
-from app.services.procesador_service import validar_linea
+from app.services.procesador_service import (
+    IndiceCups,
+    _abrir_xml_streaming,
+    _find_child,
+    validar_estructura_xml_registro,
+    validar_linea,
+)
 from app.utils.validators import TIPOS_AUTOCONSUMO_VALIDOS
 
 
@@ -79,3 +87,45 @@ def test_fecha_formato_invalido(db_session):
 def test_tipos_validos_constante():
     """Constante TIPOS_AUTOCONSUMO_VALIDOS contiene 12, 41, 42, 43, 51."""
     assert TIPOS_AUTOCONSUMO_VALIDOS == {12, 41, 42, 43, 51}
+
+
+def test_indice_cups_resuelve_lote_con_una_consulta(db_session):
+    """El índice resuelve los CUPS de un lote con una sola consulta y no repite CUPS ya vistos."""
+    q = db_session.query.return_value
+    q.filter.return_value = q
+    q.order_by.return_value = q
+    q.__iter__.return_value = iter([("ES0021000000000001AA", 7)])
+    indice = IndiceCups(db_session)
+    indice.precargar(["ES0021000000000001AA", "ES0021000000000002BB", "ES0021000000000001AA"])
+    assert indice.cliente_id("ES0021000000000001AA") == 7
+    assert indice.cliente_id("ES0021000000000002BB") is None
+    assert db_session.query.call_count == 1
+
+
+def test_validar_linea_usa_indice_cups(db_session):
+    """Con índice, un CUPS que no está en clientes genera cliente_inexistente sin consultar por línea."""
+    indice = IndiceCups(db_session)
+    indice.precargar([_row_valido()["cups_cliente"]])
+    errores = validar_linea(_row_valido(), 2, db_session, indice)
+    assert any(e[0] == "cliente_inexistente" for e in errores)
+    assert db_session.query.call_count == 1
+
+
+def test_xml_streaming_entrega_registros_y_libera_la_raiz():
+    """iterparse entrega cada <registro> (con namespace) y no acumula hijos en la raíz."""
+    bloque = "".join(f"<hora>{v}</hora>" for v in range(1, 7))
+    registro = (
+        "<registro><cupsCliente>ES0021000000000001AA</cupsCliente><instalacionGen>GEN001</instalacionGen>"
+        "<fechaDesde>2024-01-01</fechaDesde><fechaHasta>2024-01-31</fechaHasta><tipoAutoconsumo>41</tipoAutoconsumo>"
+        f"<energiaNetaGen>{bloque}</energiaNetaGen><energiaAutoconsumida>{bloque}</energiaAutoconsumida>"
+        f"<pagoTDA>{bloque}</pagoTDA></registro>"
+    )
+    xml = f'<?xml version="1.0"?><energiaExcedentaria xmlns="urn:peajes">{registro * 3}</energiaExcedentaria>basura'
+    root, registros = _abrir_xml_streaming(io.BytesIO(xml.encode()))
+    vistos = 0
+    for reg in registros:
+        vistos += 1
+        assert _find_child(reg, "cupsCliente").text == "ES0021000000000001AA"
+        assert validar_estructura_xml_registro(reg) == []
+    assert vistos == 3
+    assert len(root) == 0
@@ -0,0 +1,417 @@
+"""Tests unitarios de las etapas por lotes del procesador (escritura, errores)."""
+
+import csv
+import json
+import time
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError, PendingRollbackError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ArchivoProcesado, RegistroErrores
+from app.services.procesador_service import (
+    EscritorEnergia,
+    MedidorEtapas,
+    SumideroErrores,
+    _ColumnasCsv,
+    _ContextoTrabajo,
+    _abrir_datos,
+    _datos_lineas_csv,
+    _procesar_archivo,
+    _escribir_candidatos,
+    _trocear_csv,
+    _valores_energia,
+    detectar_duplicados,
+    planificar_trozos_csv,
+    procesar_trozo_csv,
+    _validar_csv_en_paralelo,
+    _validar_filas_csv,
+    detectar_compresion,
+    parsear_linea,
+    simular_archivo,
+)
+from tests.test_parsing import _row_valido
+
+
+def _valores_energia_prueba():
+    return _valores_energia(1, 2, _registro(_row_valido()), 7)
+
+
+def _registro(row):
+    registro, errores = parsear_linea(row, 2, None, comprobar_cliente=False)
+    assert errores == []
+    return registro
+
+
+def test_escritor_energia_escribe_lote_en_bloque(db_session):
+    """Sin PostgreSQL, el lote se escribe con un único executemany."""
+    escritor = EscritorEnergia(db_session, archivo_id=1)
+    escritor.agregar(2, _registro(_row_valido()), cliente_id=7)
+    escritor.agregar(3, _registro(_row_valido()), cliente_id=7)
+    escritos, fallos = escritor.flush()
+    assert (escritos, fallos) == (2, [])
+    assert db_session.execute.call_count == 1
+    assert len(db_session.execute.call_args[0][1]) == 2
+    assert len(escritor) == 0
+
+
+def test_escritor_energia_copy_no_convierte_vacios_en_null(db_session):
+    """En COPY csv un campo vacío sin comillas es NULL: instalacion_gen vacía debe llegar como ''."""
+    db_session.get_bind.return_value.dialect.name = "postgresql"
+    db_session.get_bind.return_value.dialect.driver = "psycopg2"
+    cursor = db_session.connection.return_value.connection.cursor.return_value
+    cargado = {}
+    cursor.copy_expert.side_effect = lambda sql, buffer: cargado.update(sql=sql, filas=list(csv.reader(buffer)))
+    escritor = EscritorEnergia(db_session, archivo_id=1)
+    escritor._copy([{**_valores_energia_prueba(), "instalacion_gen": ""}])
+    assert "FORCE_NOT_NULL (instalacion_gen" in cargado["sql"]
+    (fila,) = cargado["filas"]
+    assert fila[3] == "" and fila[7] == "ES0021000000000001AA"
+    cursor.close.assert_called_once()
+
+
+def test_escritor_energia_aisla_lineas_si_falla_el_lote(db_session):
+    """Si el bloque falla, se reintenta línea a línea y solo se reportan las que fallan."""
+    def execute(stmt, filas):
+        if len(filas) > 1 or filas[0]["linea_archivo"] == 3:
+            raise ValueError("duplicate key")
+
+    db_session.execute.side_effect = execute
+    escritor = EscritorEnergia(db_session, archivo_id=1)
+    for linea in (2, 3, 4):
+        escritor.agregar(linea, _registro(_row_valido()), cliente_id=7)
+    escritos, fallos = escritor.flush()
+    assert escritos == 2
+    assert [(linea, mensaje) for linea, _, mensaje in fallos] == [(3, "duplicate key")]
+
+
+def test_sumidero_errores_inserta_en_bloque_sin_commit(db_session):
+    """Los errores se acumulan y se insertan de una vez; el commit queda para el lote."""
+    sumidero = SumideroErrores(db_session, archivo_id=1)
+    sumidero.agregar(2, "cliente_inexistente", "CUPS no encontrado")
+    sumidero.agregar(2, "periodos_insuficientes", "Faltan periodos", "{}")
+    assert db_session.execute.call_count == 0
+    assert sumidero.flush() == 2
+    filas = db_session.execute.call_args[0][1]
+    assert [f["tipo_error"] for f in filas] == ["cliente_inexistente", "formato_invalido"]
+    assert filas[1]["descripcion"] == "Faltan periodos"
+    db_session.commit.assert_not_called()
+    assert sumidero.flush() == 0
+
+
+def test_duplicados_del_lote_con_una_consulta(db_session):
+    """Un lote se comprueba contra la BD con una consulta y también detecta repetidos en el archivo."""
+    existente = _row_valido()
+    existente["fecha_desde_1"], existente["fecha_hasta_1"] = "2023-01-01", "2023-01-31"
+    q = db_session.query.return_value
+    q.filter.return_value = q
+    q.distinct.return_value = q
+    q.__iter__.return_value = iter([(existente["cups_cliente"], date(2023, 1, 1), date(2023, 1, 31))])
+    ctx = _ContextoTrabajo(db_session, archivo_id=1)
+    ctx.indice_cups._ids[existente["cups_cliente"]] = 7
+
+    candidatos = [(n, row, _registro(row)) for n, row in ((2, _row_valido()), (3, existente), (4, _row_valido()))]
+    _escribir_candidatos(ctx, candidatos, con_instalacion=False, mensaje_duplicado="Ya existe")
+    assert ctx.con_error == 2
+    assert db_session.query.call_count == 1
+    assert len(ctx.escritor) == 1
+    assert [(e["linea_archivo"], e["descripcion"]) for e in ctx.sumidero._pendientes] == [
+        (3, "Ya existe"),
+        (4, "Ya existe"),
+    ]
+
+
+def _csv_de_prueba(tmp_path, lineas):
+    cabecera = "cups,tipo,fecha_desde,fecha_hasta,p1,p2,p3,p4,p5,p6\n"
+    fila = "ES0021000000000001AA,41,2023-{mes:02d}-01,2023-{mes:02d}-28,1,2,3,4,5,{p6}\n"
+    ruta = tmp_path / "peajes.csv"
+    # Una de cada siete líneas lleva un periodo no numérico
+    ruta.write_text(cabecera + "".join(
+        fila.format(mes=i % 12 + 1, p6="x" if i % 7 == 0 else i) for i in range(lineas)
+    ))
+    return ruta
+
+
+def test_detectar_duplicados_en_bd_real():
+    """La consulta (cups, fechas[, instalación]) IN (...) se ejecuta de verdad (SQLite) y excluye el propio archivo."""
+    motor = create_engine("sqlite://")
+    with motor.begin() as conexion:
+        # Solo las columnas de la clave: el resto (ARRAY) es de PostgreSQL
+        conexion.execute(text(
+            "CREATE TABLE energia_excedentaria (id INTEGER PRIMARY KEY, archivo_id INTEGER, "
+            "cups_cliente TEXT, instalacion_gen TEXT, fecha_desde DATE, fecha_hasta DATE)"
+        ))
+        conexion.execute(text(
+            "INSERT INTO energia_excedentaria (archivo_id, cups_cliente, instalacion_gen, fecha_desde, fecha_hasta) "
+            "VALUES (1, 'ES01', 'GEN1', '2024-01-01', '2024-01-31'), (2, 'ES02', 'GEN2', '2024-02-01', '2024-02-29')"
+        ))
+    enero, febrero = (date(2024, 1, 1), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 29))
+    with Session(motor) as db:
+        assert detectar_duplicados(db, [("ES01", *enero), ("ES02", *enero), ("ES01", *enero)], False) == {
+            ("ES01", *enero)
+        }
+        assert detectar_duplicados(db, [("ES01", *enero, "GEN1"), ("ES02", *febrero, "GEN9")], True) == {
+            ("ES01", *enero, "GEN1")
+        }
+        assert detectar_duplicados(db, [("ES01", *enero), ("ES02", *febrero)], False, excluir_archivo_id=1) == {
+            ("ES02", *febrero)
+        }
+        assert detectar_duplicados(db, [], False) == set()
+
+
+def test_trocear_csv_alinea_rangos_a_lineas(tmp_path):
+    ruta = _csv_de_prueba(tmp_path, 50)
+    contenido = ruta.read_bytes()
+    inicio_datos = contenido.index(b"\n") + 1
+    rangos = _trocear_csv(str(ruta), inicio_datos, 100)
+    assert len(rangos) > 1
+    assert rangos[0][0] == inicio_datos and rangos[-1][1] == len(contenido)
+    for (_, fin), (inicio, _) in zip(rangos, rangos[1:]):
+        assert fin == inicio and contenido[fin - 1:fin] == b"\n"
+
+
+def test_validacion_paralela_igual_a_secuencial(tmp_path, monkeypatch):
+    """Los trozos validados en el pool se entregan en el orden del archivo."""
+    monkeypatch.setattr(settings, "PROCESAMIENTO_BYTES_TROZO", 300)
+    ruta = _csv_de_prueba(tmp_path, 60)
+    dialecto = {"delimiter": ",", "quotechar": '"'}
+    with open(ruta, newline="") as f:
+        reader = csv.reader(f, **dialecto)
+        fieldnames = next(reader)
+        secuencial = list(_validar_filas_csv(reader, fieldnames))
+    paralelo = list(_validar_csv_en_paralelo(str(ruta), fieldnames, dialecto, procesos=2))
+    assert paralelo == secuencial
+    assert any(errores for _, _, errores in paralelo)
+
+
+def test_planificar_trozos_numera_lineas_como_secuencial(tmp_path):
+    """primera_linea de cada trozo coincide con la numeración de csv.DictReader (sin líneas vacías)."""
+    ruta = _csv_de_prueba(tmp_path, 40)
+    with open(ruta, "a") as f:
+        f.write("\n" + ruta.read_text().splitlines()[1] + "\n")
+    plan = planificar_trozos_csv(str(ruta), umbral_bytes=0, tamano_trozo=200)
+    assert plan is not None and len(plan["trozos"]) > 1
+
+    with open(ruta, newline="") as f:
+        secuencial = list(enumerate(csv.DictReader(f), start=2))
+    contenido = ruta.read_bytes()
+    por_trozos = []
+    for inicio, fin, primera_linea, ultima_linea in plan["trozos"]:
+        lector = csv.DictReader(contenido[inicio:fin].decode().splitlines(), fieldnames=plan["fieldnames"])
+        por_trozos.extend(enumerate(lector, start=primera_linea))
+        assert por_trozos[-1][0] == ultima_linea
+    assert por_trozos == secuencial
+
+
+def test_planificar_trozos_archivo_pequeno_o_xml(tmp_path):
+    ruta = _csv_de_prueba(tmp_path, 5)
+    assert planificar_trozos_csv(str(ruta), umbral_bytes=10_000, tamano_trozo=100) is None
+    xml = tmp_path / "peajes.xml"
+    xml.write_text("<?xml version='1.0'?><energiaExcedentaria>" + " " * 500 + "</energiaExcedentaria>")
+    assert planificar_trozos_csv(str(xml), umbral_bytes=0, tamano_trozo=100) is None
+
+
+def test_checkpoint_se_guarda_con_el_lote_y_se_reanuda(db_session):
+    """El commit de cada lote lleva el checkpoint; un trabajo nuevo continúa tras él."""
+    archivo = ArchivoProcesado(
+        id=1, checkpoint_linea=0, total_registros=0, registros_exitosos=0, registros_con_error=0
+    )
+    ctx = _ContextoTrabajo(db_session, archivo_id=1, archivo=archivo)
+    ctx.total, ctx.con_error = 3, 1
+    ctx.escritor.agregar(2, _registro(_row_valido()), cliente_id=7)
+    ctx.escritor.agregar(3, _registro(_row_valido()), cliente_id=7)
+    ctx.cerrar_lote(ultima_linea=4)
+    db_session.commit.assert_called_once()
+    assert (archivo.checkpoint_linea, archivo.total_registros) == (4, 3)
+    assert (archivo.registros_exitosos, archivo.registros_con_error) == (2, 1)
+
+    reanudado = _ContextoTrabajo(db_session, archivo_id=1, archivo=archivo)
+    assert reanudado.guardados == 3
+    assert (reanudado.total, reanudado.exitosos, reanudado.con_error) == (3, 2, 1)
+
+
+def test_abrir_datos_descomprime_por_magic_bytes(tmp_path):
+    """gzip y bz2 se detectan por contenido, no por extensión, y se leen descomprimidos."""
+    import bz2
+    import gzip
+
+    contenido = b"cups,tipo\nES0021000000000001AA,41\n"
+    for nombre, comprimir in (("a.csv", gzip.compress), ("b.dat", bz2.compress), ("c.csv", bytes)):
+        ruta = tmp_path / nombre
+        ruta.write_bytes(comprimir(contenido))
+        with _abrir_datos(str(ruta)) as (datos, _):
+            assert datos.read() == contenido
+    assert detectar_compresion(b"PK\x03\x04") == "zip"
+    assert detectar_compresion(b"<?xm") is None
+
+
+def test_parsear_linea_convierte_una_sola_vez():
+    """La línea válida sale ya convertida; con errores no hay registro."""
+    registro = _registro(_row_valido())
+    assert (registro.fecha_desde, registro.fecha_hasta, registro.tipo_autoconsumo) == (
+        date(2024, 1, 1), date(2024, 1, 31), 41,
+    )
+    assert registro.energia_neta_gen[0] == Decimal("100.5") and len(registro.pago_tda) == 6
+    fila = _row_valido()
+    fila["pago_tda_6"] = "x"
+    assert parsear_linea(fila, 2, None, comprobar_cliente=False)[0] is None
+
+
+def test_columnas_csv_resuelve_alias_una_vez():
+    """Solo se extraen campos canónicos; un alias cubre la columna canónica vacía y se toleran líneas cortas."""
+    columnas = _ColumnasCsv([" cups ", "tipo", "fecha_desde", "fecha_hasta", "p1", "energia_neta_gen_1", "otra"])
+    row = columnas.fila(["ES0021000000000001AA", "41", "2024-01-01", "2024-01-31", "7.5", " ", "x"])
+    assert row == {
+        "cups_cliente": "ES0021000000000001AA",
+        "tipo_autoconsumo": "41",
+        "fecha_desde_1": "2024-01-01",
+        "fecha_hasta_1": "2024-01-31",
+        "energia_neta_gen_1": "7.5",
+    }
+    assert columnas.fila(["ES0021000000000001AA", "41"])["fecha_desde_1"] == ""
+
+    directo = _ColumnasCsv(["cups_cliente", "tipo_autoconsumo", "fecha_desde_1", "fecha_hasta_1"])
+    assert directo.fila(["ES1", "41", "a", "b"]) == {
+        "cups_cliente": "ES1", "tipo_autoconsumo": "41", "fecha_desde_1": "a", "fecha_hasta_1": "b",
+    }
+    assert directo.fila(["ES1"]) == {
+        "cups_cliente": "ES1", "tipo_autoconsumo": None, "fecha_desde_1": None, "fecha_hasta_1": None,
+    }
+
+
+def test_simulacion_cuenta_errores_sin_escribir(tmp_path, db_session):
+    """La simulación recorre el archivo igual que el procesamiento real, pero no escribe nada."""
+    fila = _row_valido()
+    ruta = tmp_path / "peajes.csv"
+    with open(ruta, "w", newline="") as f:
+        escritor = csv.DictWriter(f, fieldnames=list(fila))
+        escritor.writeheader()
+        # La repetida es duplicado aunque la primera no se haya escrito
+        escritor.writerows([fila, fila, {**fila, "tipo_autoconsumo": "99"}])
+    db_session.query.return_value.filter.return_value.order_by.return_value = [(fila["cups_cliente"], 7)]
+
+    informe = simular_archivo(db_session, str(ruta), procesos=1)
+
+    assert informe["estado"] == "completado"
+    assert (informe["total_registros"], informe["registros_validos"], informe["registros_con_error"]) == (3, 1, 2)
+    assert informe["errores_por_tipo"] == {"registro_duplicado": 1, "tipo_no_soportado": 1}
+    assert set(informe["etapas"]) == {"lectura", "validacion", "cups", "duplicados", "escritura"}
+    db_session.execute.assert_not_called()
+    db_session.add.assert_not_called()
+
+
+def test_medidor_etapas_anidadas_y_acumuladas():
+    """La etapa interior no cuenta en la exterior; los trozos se suman con exportar/acumular."""
+    medidor = MedidorEtapas()
+    with medidor.medir("lectura"):
+        with medidor.medir("cups"):
+            time.sleep(0.02)
+    medidor.contar("cups", 5)
+    assert medidor.segundos["cups"] >= 0.02 > medidor.segundos["lectura"]
+
+    total = MedidorEtapas()
+    total.acumular(medidor.exportar())
+    total.acumular({**medidor.exportar(), "consultas": 2})
+    resumen = total.resumen(10)
+    assert resumen["cups"]["filas"] == 10 and total.consultas == 2
+    assert resumen["cups"]["segundos"] == round(2 * medidor.segundos["cups"], 3)
+
+
+def test_medidor_etapas_solo_cuenta_la_sesion_vinculada():
+    """Las consultas se cuentan en la conexión de la sesión del trabajo, no en todo el proceso, y solo hasta desvincular."""
+    motor = create_engine("sqlite://")
+    trabajo, otra = Session(motor), Session(motor)
+    medidor = MedidorEtapas()
+    medidor.vincular(trabajo)
+    trabajo.execute(text("SELECT 1"))
+    otra.execute(text("SELECT 1"))
+    trabajo.commit()
+    # Nueva transacción, nueva conexión: se sigue contando
+    trabajo.execute(text("SELECT 1"))
+    medidor.desvincular(trabajo)
+    trabajo.execute(text("SELECT 1"))
+    trabajo.commit()
+    otra.commit()
+    assert medidor.consultas == 2
+
+
+def test_entrega_duplicada_no_reprocesa_el_archivo(db_session):
+    """Si otro trabajo tiene reservado el archivo (advisory lock ocupado), la segunda entrega no hace nada."""
+    from app.services.procesador_service import procesar_archivo
+
+    bind = db_session.get_bind.return_value
+    bind.dialect.name = "postgresql"
+    conexion = bind.connect.return_value.__enter__.return_value
+    conexion.execute.return_value.scalar.return_value = False
+    assert procesar_archivo(db_session, 1, "no_existe.csv") == {}
+    db_session.query.assert_not_called()
+    db_session.commit.assert_not_called()
+    # Sin la reserva no hay nada que liberar: solo el intento de bloqueo
+    assert conexion.execute.call_count == 1
+
+
+def test_fallo_del_escritor_deja_el_archivo_en_error(tmp_path, db_session):
+    """Si falla la escritura, se hace rollback antes de registrar el error y el archivo acaba en error."""
+    fila = _row_valido()
+    ruta = tmp_path / "peajes.csv"
+    with open(ruta, "w", newline="") as f:
+        escritor = csv.DictWriter(f, fieldnames=list(fila))
+        escritor.writeheader()
+        escritor.writerow(fila)
+    db_session.query.return_value.filter.return_value.order_by.return_value = [(fila["cups_cliente"], 7)]
+    # Como una sesión real: tras un fallo, nada hasta el rollback
+    fallida = []
+    db_session.rollback.side_effect = fallida.clear
+
+    def commit():
+        if fallida:
+            raise PendingRollbackError("Can't reconnect until invalid transaction is rolled back")
+
+    def flush():
+        fallida.append(True)
+        raise OperationalError("COPY", {}, Exception("conexión perdida"))
+
+    db_session.commit.side_effect = commit
+    archivo = ArchivoProcesado(id=1, estado="procesando")
+    ctx = _ContextoTrabajo(db_session, archivo_id=1)
+    ctx.escritor.flush = flush
+
+    _procesar_archivo(ctx, archivo, str(ruta), 1, "python")
+
+    assert archivo.estado == "error"
+    # Un único error (el de lectura), registrado a la primera
+    db_session.add.assert_called_once()
+    error = db_session.add.call_args[0][0]
+    assert isinstance(error, RegistroErrores) and "conexión perdida" in error.descripcion
+
+
+def test_trozo_devuelve_resultado_si_falla_la_limpieza(db_session):
+    """Si falla el borrado idempotente del trozo, se hace rollback y el trozo devuelve su resultado con el error."""
+    db_session.query.return_value.filter.return_value.delete.side_effect = OperationalError(
+        "DELETE", {}, Exception("conexión perdida")
+    )
+    resultado = procesar_trozo_csv(db_session, 1, "no_existe.csv", [], {}, 0, 10, 2, 5)
+    assert "conexión perdida" in resultado["error"]
+    assert resultado["total"] == 0
+    db_session.rollback.assert_called()
+
+
+def test_duplicados_entre_trozos_releen_la_fila_como_sin_trozos(tmp_path):
+    """datos_linea de un duplicado entre trozos: la fila del CSV en JSON, numerada como en el secuencial."""
+    fila = _row_valido()
+    ruta = tmp_path / "peajes.csv"
+    with open(ruta, "w", newline="") as f:
+        escritor = csv.DictWriter(f, fieldnames=list(fila))
+        escritor.writeheader()
+        escritor.writerow(fila)
+        f.write("\n")
+        escritor.writerows([{**fila, "tipo_autoconsumo": "41"}, fila])
+    columnas = _ColumnasCsv(list(fila))
+    datos = _datos_lineas_csv(str(ruta), {3, 4})
+    assert datos == {
+        3: json.dumps(columnas.fila(list({**fila, "tipo_autoconsumo": "41"}.values()))),
+        4: json.dumps(columnas.fila(list(fila.values()))),
+    }
@@ -0,0 +1,98 @@
+"""Tests del progreso en vivo (difusor en proceso y límite de eventos)."""
+
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services import progreso_service
+from app.services.progreso_service import NotificadorProgreso, difusor_local, suscribir_progreso
+
+
+def test_difusor_local_entrega_eventos_publicados_desde_otro_hilo():
+    async def escuchar():
+        suscriptor = difusor_local.suscribir(7)
+        try:
+            threading.Thread(target=difusor_local.publicar, args=(7, {"estado": "completado"})).start()
+            return await asyncio.wait_for(suscriptor[1].get(), timeout=2)
+        finally:
+            difusor_local.cancelar(7, suscriptor)
+
+    assert asyncio.run(escuchar()) == {"estado": "completado"}
+
+
+def test_suscripcion_sin_redis_usa_difusor_local():
+    async def escuchar():
+        eventos = suscribir_progreso(8, espera=0.05)
+        assert await eventos.__anext__() is None  # latido sin eventos
+        difusor_local.publicar(8, {"estado": "procesando"})
+        evento = await eventos.__anext__()
+        await eventos.aclose()
+        return evento
+
+    async def sin_redis(archivo_id):
+        return None
+
+    with patch.object(progreso_service, "_suscribir_redis", sin_redis):
+        assert asyncio.run(escuchar()) == {"estado": "procesando"}
+
+
+def test_suscripcion_redis_cierra_pubsub_y_cliente():
+    """Al cerrarse el SSE (aclose del generador) se cierran el PubSub y el cliente Redis del suscriptor."""
+    cliente, pubsub = MagicMock(), MagicMock()
+    cliente.aclose, pubsub.aclose = AsyncMock(), AsyncMock()
+    pubsub.get_message = AsyncMock(return_value={"data": '{"estado": "procesando"}'})
+
+    async def con_redis(archivo_id):
+        return cliente, pubsub
+
+    async def escuchar():
+        eventos = suscribir_progreso(9, espera=0.05)
+        evento = await eventos.__anext__()
+        await eventos.aclose()
+        return evento
+
+    with patch.object(progreso_service, "_suscribir_redis", con_redis):
+        assert asyncio.run(escuchar()) == {"estado": "procesando"}
+    pubsub.aclose.assert_awaited_once()
+    cliente.aclose.assert_awaited_once()
+
+
+def test_suscripcion_pasa_al_difusor_local_si_redis_cae():
+    """Si Redis falla a mitad del SSE, la suscripción sigue con el difusor local en vez de cortarse."""
+    cliente, pubsub = MagicMock(), MagicMock()
+    cliente.aclose, pubsub.aclose = AsyncMock(), AsyncMock()
+    pubsub.get_message = AsyncMock(side_effect=[
+        {"data": '{"estado": "procesando"}'}, ConnectionError("Redis caído"),
+    ])
+
+    async def con_redis(archivo_id):
+        return cliente, pubsub
+
+    async def escuchar():
+        eventos = suscribir_progreso(10, espera=0.05)
+        primero = await eventos.__anext__()
+        assert await eventos.__anext__() is None  # ya en el difusor local: latido
+        difusor_local.publicar(10, {"estado": "completado"})
+        ultimo = await eventos.__anext__()
+        await eventos.aclose()
+        return primero, ultimo
+
+    with patch.object(progreso_service, "_suscribir_redis", con_redis), \
+            patch.object(progreso_service, "marcar_redis_no_disponible") as marcar:
+        assert asyncio.run(escuchar()) == ({"estado": "procesando"}, {"estado": "completado"})
+    marcar.assert_called_once()
+    pubsub.aclose.assert_awaited_once()
+    cliente.aclose.assert_awaited_once()
+
+
+def test_notificador_limita_eventos_por_intervalo():
+    publicados = []
+    with patch.object(progreso_service, "publicar_progreso", lambda _id, e: publicados.append(e)):
+        notificador = NotificadorProgreso(archivo_id=1, bytes_totales=1000)
+        notificador.posicion = lambda: 250
+        notificador.publicar(100, 90, 10)
+        notificador.publicar(200, 180, 20)  # dentro del intervalo: se omite
+        notificador.publicar(300, 270, 30, estado="completado", forzar=True)
+    assert [e["lineas_leidas"] for e in publicados] == [100, 300]
+    assert publicados[0]["eta_segundos"] is not None
+    assert publicados[1]["estado"] == "completado" and publicados[1]["eta_segundos"] is None
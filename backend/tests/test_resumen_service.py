@@ -0,0 +1,33 @@
+"""Tests del resumen mensual de energía."""
+
+from datetime import date
+from decimal import Decimal
+
+from app.services.resumen_service import agrupar_por_mes, sumar_lote
+
+
+def _valores(cliente_id, fecha_desde, tipo=12, valor="1.5"):
+    periodos = [Decimal(valor)] * 6
+    return {
+        "cliente_id": cliente_id, "fecha_desde": fecha_desde, "tipo_autoconsumo": tipo,
+        "energia_neta_gen": periodos, "energia_autoconsumida": periodos, "pago_tda": periodos,
+    }
+
+
+def test_agrupar_por_mes_suma_por_cliente_mes_y_tipo_en_orden():
+    filas = agrupar_por_mes([
+        _valores(7, date(2024, 2, 15)),
+        _valores(3, date(2024, 1, 31), valor="2"),
+        _valores(7, date(2024, 2, 1), valor="0.25"),
+        _valores(7, date(2024, 2, 1), tipo=41),
+    ])
+    assert [(f["cliente_id"], f["mes"], f["tipo_autoconsumo"], f["registros"]) for f in filas] == [
+        (3, date(2024, 1, 1), 12, 1), (7, date(2024, 2, 1), 12, 2), (7, date(2024, 2, 1), 41, 1),
+    ]
+    assert filas[1]["energia_neta_gen"] == [Decimal("1.75")] * 6
+
+
+def test_sumar_lote_solo_en_postgresql(db_session):
+    """En otros motores el resumen no se mantiene: no se ejecuta nada."""
+    assert sumar_lote(db_session, [_valores(7, date(2024, 2, 1))]) == 0
+    db_session.execute.assert_not_called()
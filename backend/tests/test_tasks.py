@@ -0,0 +1,71 @@
+"""Tests de las tareas Celery (reparto en trozos y entregas duplicadas)."""
+
+from unittest.mock import patch
+
+from app import tasks
+from app.models import ArchivoProcesado
+
+PLAN = {
+    "ruta": "/tmp/peajes.csv",
+    "fieldnames": ["cups"],
+    "dialecto": {},
+    "trozos": [[10, 50, 2, 40], [50, 90, 41, 80]],
+}
+
+
+def test_entrega_duplicada_no_lanza_otro_chord(db_session):
+    """acks_late puede entregar la tarea dos veces: el chord de trozos se lanza solo una."""
+    archivo = ArchivoProcesado(id=3, estado="pendiente", checkpoint_linea=0)
+    db_session.query.return_value.filter.return_value.first.return_value = archivo
+    with patch.object(tasks, "SessionLocal", return_value=db_session), \
+            patch.object(tasks, "planificar_trozos_csv", return_value=PLAN), \
+            patch.object(tasks, "chord") as chord:
+        primera = tasks.procesar_archivo_task(3, PLAN["ruta"])
+        segunda = tasks.procesar_archivo_task(3, PLAN["ruta"])
+    assert primera == {"archivo_id": 3, "estado": "procesando", "trozos": 2}
+    assert segunda == {"archivo_id": 3, "estado": "en_curso"}
+    chord.assert_called_once()
+    assert (archivo.estado, archivo.checkpoint_linea) == ("procesando", 80)
+
+    # Ya terminado: una entrega tardía tampoco reparte
+    archivo.estado = "completado"
+    with patch.object(tasks, "SessionLocal", return_value=db_session), \
+            patch.object(tasks, "planificar_trozos_csv", return_value=PLAN), \
+            patch.object(tasks, "chord") as chord:
+        assert tasks.procesar_archivo_task(3, PLAN["ruta"])["estado"] == "completado"
+    chord.assert_not_called()
+
+
+def test_tarea_sin_trozos_devuelve_el_estado_real(db_session):
+    """Sin reparto, la tarea devuelve el resultado de procesar_archivo, no siempre 'completado'."""
+    casos = [({"segundos": 1.0}, "error", "error"), ({}, "procesando", "en_curso"), ({}, None, "no_encontrado")]
+    for perfil, estado_bd, esperado in casos:
+        db_session.query.return_value.filter.return_value.scalar.return_value = estado_bd
+        with patch.object(tasks, "SessionLocal", return_value=db_session), \
+                patch.object(tasks, "planificar_trozos_csv", return_value=None), \
+                patch.object(tasks, "procesar_archivo", return_value=perfil):
+            assert tasks.procesar_archivo_task(3, "peajes.csv") == {"archivo_id": 3, "estado": esperado}
+
+
+def test_trozos_y_finalizacion_miden_la_espera_en_cola(db_session):
+    """Los trozos reciben `encolado` del orquestador y la finalización usa el fin del último trozo."""
+    archivo = ArchivoProcesado(id=3, estado="pendiente", checkpoint_linea=0)
+    db_session.query.return_value.filter.return_value.first.return_value = archivo
+    with patch.object(tasks, "SessionLocal", return_value=db_session), \
+            patch.object(tasks, "planificar_trozos_csv", return_value=PLAN), \
+            patch.object(tasks, "chord") as chord:
+        tasks.procesar_archivo_task(3, PLAN["ruta"])
+    subtareas = chord.call_args.args[0]
+    assert all(s.args[-1] is not None and s.args[-1] == subtareas[0].args[-1] for s in subtareas)
+
+    resultado = {"total": 1, "exitosos": 1, "con_error": 0, "error": None}
+    with patch.object(tasks, "SessionLocal", return_value=db_session), \
+            patch.object(tasks, "procesar_trozo_csv", return_value=resultado), \
+            patch.object(tasks.metricas, "observar_espera_cola") as observar:
+        trozo = tasks.procesar_trozo_task(*subtareas[0].args)
+        assert observar.call_args.args == (subtareas[0].args[-1], "procesar_trozo")
+        assert trozo["terminado"] >= subtareas[0].args[-1]
+
+        with patch.object(tasks, "finalizar_trozos"):
+            tasks.finalizar_trozos_task([{**resultado, "terminado": 5.0}, trozo], 3)
+        assert observar.call_args.args == (trozo["terminado"], "finalizar_trozos")
@@ -0,0 +1,100 @@
+"""Tests de paridad del motor de validación vectorial (NumPy) con parsear_linea."""
+
+import random
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.services.procesador_service import CSV_CAMPOS, IndiceCups, _validar_filas_csv, parsear_linea
+from app.services.validacion_vectorial_service import CAMPOS_NUMERICOS, validar_filas_vectorial
+
+CUPS_CONOCIDOS = {"ES0021000000000001AA", "ES0021000000000002BB"}
+VALORES = {
+    "cups_cliente": [
+        "ES0021000000000001AA", " ES0021000000000002BB ", "ES0021000000009999ZZ", "ES123",
+        "FR0021000000000001AA", "", None,
+    ],
+    "instalacion_gen": ["GEN001", " GEN002 ", "", None],
+    "tipo_autoconsumo": ["41", "12", "51", " 41", "041", "40", "abc", "", None, "41.0", "٤١"],
+    "fecha": [
+        "2024-01-01", "2024-02-29", "2023-02-29", "2024-1-5", " 2024-01-31 ", "2024/01/01",
+        "", None, "0000-01-01", "٢٠٢٤-01-01", "2024-13-01", "2024-12-31", "2024-01-011",
+    ],
+    "numero": [
+        "1", "-2.5", "0.000", ".5", "5.", "-", "1e3", " 3 ", "abc", "", None, "1.2.3", "٣", "+1", "NaN", "--1",
+    ],
+}
+
+
+def _filas(n, semilla=0):
+    """Filas mayoritariamente limpias, con valores problemáticos en cualquier campo."""
+    azar = random.Random(semilla)
+
+    def valor(clave):
+        opciones = VALORES[clave]
+        return opciones[0] if azar.random() < 0.8 else azar.choice(opciones)
+
+    filas = []
+    for _ in range(n):
+        row = {
+            "cups_cliente": valor("cups_cliente"),
+            "instalacion_gen": valor("instalacion_gen"),
+            "tipo_autoconsumo": valor("tipo_autoconsumo"),
+            "fecha_desde_1": valor("fecha"),
+            "fecha_hasta_1": azar.choice(VALORES["fecha"][:2] + ["2023-12-31"]),
+        }
+        for campo in CAMPOS_NUMERICOS:
+            row[campo] = str(azar.randint(0, 999)) if azar.random() < 0.95 else azar.choice(VALORES["numero"])
+        filas.append(row)
+    return filas
+
+
+def _repr(resultados):
+    # Decimal("NaN") != Decimal("NaN"): se compara la representación
+    return [repr(r) for r in resultados]
+
+
+def test_paridad_con_parsear_linea():
+    """Mismo registro y mismos (tipo, descripcion), en el mismo orden, que fila a fila."""
+    filas = _filas(3000)
+    esperado = [parsear_linea(row, 0, None, comprobar_cliente=False) for row in filas]
+    assert _repr(validar_filas_vectorial(filas)) == _repr(esperado)
+    assert any(registro for registro, _ in esperado) and any(errores for _, errores in esperado)
+
+
+def test_paridad_con_cups_conocidos():
+    """Con el conjunto de CUPS, la regla 6 coincide con validar contra el índice del trabajo."""
+    indice = IndiceCups(MagicMock())
+    indice._ids = {cups: 1 for cups in CUPS_CONOCIDOS}
+    filas = _filas(1500, semilla=1)
+    esperado = [parsear_linea(row, 0, None, indice) for row in filas]
+    assert _repr(validar_filas_vectorial(filas, CUPS_CONOCIDOS)) == _repr(esperado)
+    assert any(e and e[0][0] == "cliente_inexistente" for _, e in esperado)
+
+
+def test_motor_numpy_en_filas_csv_igual_que_python():
+    filas = _filas(200, semilla=2)
+    lineas = [[row[c] or "" for c in CSV_CAMPOS] for row in filas]
+    python = list(_validar_filas_csv(lineas, list(CSV_CAMPOS)))
+    assert _repr(_validar_filas_csv(lineas, list(CSV_CAMPOS), "numpy")) == _repr(python)
+
+
+def test_motor_numpy_sin_np_strings_valida_en_python(monkeypatch):
+    """Con NumPy < 2 (sin np.strings) el motor numpy no está disponible y se valida fila a fila."""
+    import importlib
+    import sys
+    import types
+
+    from app.services import procesador_service, validacion_vectorial_service
+
+    monkeypatch.setitem(sys.modules, "numpy", types.ModuleType("numpy"))
+    try:
+        importlib.reload(validacion_vectorial_service)
+        assert not validacion_vectorial_service.NUMPY_DISPONIBLE
+        assert procesador_service._motor_validacion("numpy") == "python"
+    finally:
+        monkeypatch.undo()
+        importlib.reload(validacion_vectorial_service)
+    assert validacion_vectorial_service.NUMPY_DISPONIBLE
@@ -1,11 +1,17 @@
-import { useState, useEffect } from "react";
-import { getArchivos, getEnergia, api } from "../services/api";
+import { useState, useEffect, useRef } from "react";
+import { getArchivos, getEnergia, getErrores, siguienteCursorErrores } from "../services/api";
 import "./DataViewer.css";
 
 export default function DataViewer() {
   const [archivos, setArchivos] = useState([]);
   const [energia, setEnergia] = useState([]);
+  const [energiaCursor, setEnergiaCursor] = useState(null);
+  const [cargandoMas, setCargandoMas] = useState(false);
+  // Con páginas extra cargadas, el refresco periódico no vuelve a la primera
+  const energiaAmpliada = useRef(false);
+  const erroresAmpliados = useRef(false);
   const [errores, setErrores] = useState([]);
+  const [erroresCursor, setErroresCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [activeTab, setActiveTab] = useState("archivos");
 
@@ -16,12 +22,18 @@ export default function DataViewer() {
         const [archivosRes, energiaRes, erroresRes] = await Promise.all([
           getArchivos(100),
           getEnergia(),
-          api.get("/api/v1/errores").catch(() => ({ data: [] }))
+          getErrores().catch(() => ({ data: [], headers: {} }))
         ]);
 
         setArchivos(archivosRes.data || []);
-        setEnergia(energiaRes.data?.registros || []);
-        setErrores(Array.isArray(erroresRes.data) ? erroresRes.data : []);
+        if (!energiaAmpliada.current) {
+          setEnergia(energiaRes.data?.registros || []);
+          setEnergiaCursor(energiaRes.data?.siguiente_cursor ?? null);
+        }
+        if (!erroresAmpliados.current) {
+          setErrores(Array.isArray(erroresRes.data) ? erroresRes.data : []);
+          setErroresCursor(siguienteCursorErrores(erroresRes));
+        }
       } catch (error) {
         console.error("Error cargando datos:", error);
       } finally {
@@ -34,6 +46,36 @@ export default function DataViewer() {
     return () => clearInterval(interval);
   }, []);
 
+  // /energia devuelve una página y el cursor de la siguiente
+  const cargarMasEnergia = async () => {
+    setCargandoMas(true);
+    try {
+      const { data } = await getEnergia({ cursor: energiaCursor });
+      energiaAmpliada.current = true;
+      setEnergia((prev) => [...prev, ...(data?.registros || [])]);
+      setEnergiaCursor(data?.siguiente_cursor ?? null);
+    } catch (error) {
+      console.error("Error cargando más registros:", error);
+    } finally {
+      setCargandoMas(false);
+    }
+  };
+
+  // /errores devuelve una página; el cursor de la siguiente va en una cabecera
+  const cargarMasErrores = async () => {
+    setCargandoMas(true);
+    try {
+      const res = await getErrores({ cursor: erroresCursor });
+      erroresAmpliados.current = true;
+      setErrores((prev) => [...prev, ...(Array.isArray(res.data) ? res.data : [])]);
+      setErroresCursor(siguienteCursorErrores(res));
+    } catch (error) {
+      console.error("Error cargando más errores:", error);
+    } finally {
+      setCargandoMas(false);
+    }
+  };
+
   if (loading && archivos.length === 0 && energia.length === 0) {
     return <div className="data-viewer-loading">Cargando datos...</div>;
   }
@@ -51,13 +93,13 @@ export default function DataViewer() {
           className={`tab ${activeTab === "energia" ? "active" : ""}`}
           onClick={() => setActiveTab("energia")}
         >
-           Energía ({energia.length})
+           Energía ({energia.length}{energiaCursor ? "+" : ""})
         </button>
         <button
           className={`tab ${activeTab === "errores" ? "active" : ""}`}
           onClick={() => setActiveTab("errores")}
         >
-          Errores ({errores.length})
+          Errores ({errores.length}{erroresCursor ? "+" : ""})
         </button>
       </div>
 
@@ -131,6 +173,11 @@ export default function DataViewer() {
             ) : (
               <p className="empty-message">No hay registros de energía en la base de datos</p>
             )}
+            {energiaCursor && (
+              <button type="button" className="tab" onClick={cargarMasEnergia} disabled={cargandoMas}>
+                {cargandoMas ? "Cargando…" : "Cargar más"}
+              </button>
+            )}
           </div>
         )}
 
@@ -164,6 +211,11 @@ export default function DataViewer() {
             ) : (
               <p className="empty-message">No hay errores registrados</p>
             )}
+            {erroresCursor && (
+              <button type="button" className="tab" onClick={cargarMasErrores} disabled={cargandoMas}>
+                {cargandoMas ? "Cargando…" : "Cargar más"}
+              </button>
+            )}
           </div>
         )}
       </div>
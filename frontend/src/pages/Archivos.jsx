@@ -33,6 +33,8 @@ export default function Archivos() {
   const [detalle, setDetalle] = useState(null);
   const [errores, setErrores] = useState([]);
   const [registrosOk, setRegistrosOk] = useState([]);
+  const [cursorOk, setCursorOk] = useState(null);
+  const [loadingMasOk, setLoadingMasOk] = useState(false);
   const [loading, setLoading] = useState(true);
   const [loadingDetalle, setLoadingDetalle] = useState(false);
 
@@ -60,20 +62,35 @@ export default function Archivos() {
         setDetalle(aRes.data);
         setErrores(Array.isArray(eRes.data) ? eRes.data : []);
         setRegistrosOk(enRes.data?.registros ?? []);
+        setCursorOk(enRes.data?.siguiente_cursor ?? null);
       })
       .catch(() => {
         setDetalle(null);
         setErrores([]);
         setRegistrosOk([]);
+        setCursorOk(null);
       })
       .finally(() => setLoadingDetalle(false));
   };
 
+  // /energia devuelve una página: las siguientes se piden con su cursor
+  const cargarMasOk = () => {
+    setLoadingMasOk(true);
+    getEnergia({ archivo_id: parseInt(id, 10), cursor: cursorOk })
+      .then((res) => {
+        setRegistrosOk((prev) => [...prev, ...(res.data?.registros ?? [])]);
+        setCursorOk(res.data?.siguiente_cursor ?? null);
+      })
+      .catch(() => {})
+      .finally(() => setLoadingMasOk(false));
+  };
+
   useEffect(() => {
     if (!id) {
       setDetalle(null);
       setErrores([]);
       setRegistrosOk([]);
+      setCursorOk(null);
       return;
     }
     loadDetalle();
@@ -100,7 +117,10 @@ export default function Archivos() {
 
         <div className="card" style={{ marginBottom: "1.5rem" }}>
           <div style={{ display: "flex", justifyContent: "space-between", alignItems: "center", flexWrap: "wrap", gap: "0.5rem" }}>
-            <h2 className="card-title">Registros OK ({registrosOk.length})</h2>
+            <h2 className="card-title">
+              Registros OK ({registrosOk.length}
+              {cursorOk ? ` de ${detalle?.registros_exitosos ?? "…"}` : ""})
+            </h2>
             <button type="button" className="btn btn-sm" onClick={loadDetalle} disabled={loadingDetalle}>
               {loadingDetalle ? "Cargando…" : "Refrescar"}
             </button>
@@ -135,6 +155,11 @@ export default function Archivos() {
               </table>
             </div>
           )}
+          {cursorOk && !loadingDetalle && (
+            <button type="button" className="btn btn-sm" onClick={cargarMasOk} disabled={loadingMasOk}>
+              {loadingMasOk ? "Cargando…" : "Cargar más"}
+            </button>
+          )}
         </div>
 
         <div className="card">
@@ -3,16 +3,34 @@ import { getEnergia } from "../services/api";
 
 export default function Consulta() {
   const [cups, setCups] = useState("");
-  const [data, setData] = useState({ total: 0, registros: [] });
+  const [data, setData] = useState({ total: 0, registros: [], cursor: null });
   const [loading, setLoading] = useState(false);
 
+  const filtros = () => (cups ? { cups } : {});
+
   const buscar = async () => {
     setLoading(true);
     try {
-      const { data: res } = await getEnergia(cups ? { cups } : {});
-      setData({ total: res.total, registros: res.registros || [] });
+      const { data: res } = await getEnergia({ ...filtros(), total: "exacto" });
+      setData({ total: res.total, registros: res.registros || [], cursor: res.siguiente_cursor });
+    } catch {
+      setData({ total: 0, registros: [], cursor: null });
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const cargarMas = async () => {
+    setLoading(true);
+    try {
+      const { data: res } = await getEnergia({ ...filtros(), cursor: data.cursor });
+      setData((prev) => ({
+        ...prev,
+        registros: [...prev.registros, ...(res.registros || [])],
+        cursor: res.siguiente_cursor,
+      }));
     } catch {
-      setData({ total: 0, registros: [] });
+      // Se mantiene lo ya cargado; se puede reintentar
     } finally {
       setLoading(false);
     }
@@ -61,7 +79,9 @@ export default function Consulta() {
           </p>
         ) : (
           <>
-            <p className="card-count">Total: {data.total} registros</p>
+            <p className="card-count">
+              Mostrando {data.registros.length} de {data.total ?? data.registros.length} registros
+            </p>
             <div className="table-wrap">
               <table className="table">
                 <thead>
@@ -94,6 +114,11 @@ export default function Consulta() {
                 </tbody>
               </table>
             </div>
+            {data.cursor && (
+              <button type="button" onClick={cargarMas} disabled={loading} className="btn">
+                {loading ? "Cargando…" : "Cargar más"}
+              </button>
+            )}
           </>
         )}
       </div>
@@ -22,9 +22,19 @@ export const uploadArchivo = (file, usuarioId = 1) => {
 export const getArchivoStatus = (archivoId) =>
   api.get(`/api/v1/archivos/${archivoId}`);
 
+// Una página de registros; la siguiente se pide con cursor = siguiente_cursor
+// (null en la última). total: "exacto" solo en la primera página si hace falta.
 export const getEnergia = (params = {}) =>
   api.get("/api/v1/energia", { params });
 
+// Una página de errores (lista); la siguiente se pide con cursor = siguienteCursorErrores(res)
+export const getErrores = (params = {}) =>
+  api.get("/api/v1/errores", { params });
+
+// Cursor de la página siguiente de /errores (cabecera X-Siguiente-Cursor), o null en la última
+export const siguienteCursorErrores = (res) =>
+  res?.headers?.["x-siguiente-cursor"] ?? null;
+
 export const getErroresArchivo = (archivoId) =>
   api.get(`/api/v1/errores/${archivoId}`);
 
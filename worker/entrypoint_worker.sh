@@ -45,5 +45,10 @@ while True:
         time.sleep(1)
 END
 
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    # Métricas de una ejecución anterior fuera: se empieza con el directorio vacío
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 echo "Iniciando worker (Celery)..."
 exec celery -A app.celery_app worker -l info